@@ -0,0 +1,10 @@
+from api.metrics.views import MetricsViewAPI
+
+
+def metrics_urls(api):
+    api.add_resource(
+        MetricsViewAPI,
+        '/v1/metrics',
+        "/v1/metrics/",
+        endpoint="metrics_api"
+    )
@@ -0,0 +1,42 @@
+from flask_restful import Resource
+from flask_jwt_extended import jwt_required
+
+from api.utils.metrics import collect_metrics
+from api.utils.views_utils import role_required, json_response
+
+
+class MetricsViewAPI(Resource):
+
+    @jwt_required()
+    @role_required(['Admin', 'SuperAdmin'])
+    def get(self):
+        """
+        This endpoint returns the in-process counters of the worker serving the request
+        ---
+        tags:
+          - admin
+          - metrics
+        security:
+          - bearer_token: []
+        responses:
+          '200':
+              description: worker counters returned
+              content:
+                application/json:
+                  schema:
+                    $ref: '#/components/schemas/GeneralResponse'
+                  example:
+                    $ref: '#/components/examples/metrics_success'
+          '401':
+              $ref: '#/components/responses/TokenMissing'
+          '400':
+              $ref: '#/components/responses/TokenInvalid'
+          '403':
+              $ref: '#/components/responses/AccessDenied'
+        """
+
+        return json_response(
+            status=200,
+            message="Data fetched!",
+            data=collect_metrics()
+        )
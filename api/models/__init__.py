@@ -1,3 +1,4 @@
 # flake8: noqa
 
 from api.models.users import *
+from api.models.mail import *
@@ -0,0 +1,51 @@
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from api.utils import db, email_outbox
+from api.models.users import utc_now
+
+import datetime as dt
+
+
+class OutboxMessage(db.Model):
+    """
+    Email written in the same transaction as the change it announces and
+    delivered afterwards by the outbox worker
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(254), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    subtype = db.Column(db.String(16), nullable=False, default="plain")
+    status = db.Column(db.String(16), nullable=False, default="pending", server_default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=utc_now)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=dt.datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    # Workers only ever scan messages still waiting for delivery
+    __table_args__ = (
+        db.Index(
+            "ix_outbox_message_due", "next_attempt_at",
+            postgresql_where=text("status = 'pending'")
+        ),
+    )
+
+    def __repr__(self):
+        return '<OutboxMessage %r>' % self.id
+
+
+email_outbox.model = OutboxMessage
+
+
+# Wake the delivery worker once queued mail is visible to it
+@event.listens_for(Session, "after_commit")
+def notify_email_queued(session):
+    email_outbox.committed(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_email_queued(session):
+    session.info.pop("email_queued", None)
@@ -1,15 +1,29 @@
 from flask import current_app
-from werkzeug.security import check_password_hash, generate_password_hash
 from flask_jwt_extended import (
     create_access_token, get_jwt_identity
 )
+from sqlalchemy import event, false, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Session, object_session
 
-from api.utils import db, token
+from api.utils import (
+    db, token, user_cache, revoked_token_filter, password_hashers, hashing_pool, role_registry
+)
 
 import uuid
 import datetime as dt
 
 
+def generate_uuid():
+    return str(uuid.uuid1())
+
+
+# Creation timestamps are set by the database and read back through
+# INSERT ... RETURNING (eager_defaults), so new rows can be serialized
+# without selecting them again
+utc_now = text("(now() at time zone 'utc')")
+
+
 # many to many users to roles association table
 user_role = db.Table(
     "user_role",
@@ -17,13 +31,17 @@ user_role = db.Table(
     db.Column("role_id", db.String(36), db.ForeignKey("role.uuid")),
     db.Column("date_added", db.DateTime, default=dt.datetime.utcnow),
     db.UniqueConstraint("user_id", "role_id"),
+    # Members of a role, for filtering users by role
+    db.Index("ix_user_role_role_id_user_id", "role_id", "user_id"),
 )
 
 
 class Role(db.Model):
-    uuid = db.Column(db.String(36), primary_key=True, default=uuid.uuid1())
+    __mapper_args__ = {"eager_defaults": True}
+
+    uuid = db.Column(db.String(36), primary_key=True, default=generate_uuid)
     name = db.Column(db.String(64), nullable=False, unique=True)
-    date_created = db.Column(db.DateTime, default=dt.datetime.utcnow)
+    date_created = db.Column(db.DateTime, server_default=utc_now)
     date_modified = db.Column(db.DateTime, onupdate=dt.datetime.utcnow)
 
     users = db.relationship(
@@ -37,9 +55,37 @@ class Role(db.Model):
     def __repr__(self):
         return '<Role %r>' % self.name
 
+    def bump_users_roles_version(self):
+        """ Invalidate role claims already issued to the members of this role """
+
+        members = db.session.query(user_role.c.user_id).filter(
+            user_role.c.role_id == self.uuid
+        )
+        User.query.filter(User.uuid.in_(members)).update(
+            {User.roles_version: User.roles_version + 1},
+            synchronize_session=False
+        )
+        user_cache.clear()
+
 
 class User(db.Model):
-    uuid = db.Column(db.String(40), primary_key=True, default=uuid.uuid1())
+    __mapper_args__ = {"eager_defaults": True}
+    # Sort key and filters of the keyset paginated user list
+    __table_args__ = (
+        db.Index("ix_user_date_created_uuid", "date_created", "uuid"),
+        # Unconfirmed users are few, so they get their own small index
+        db.Index(
+            "ix_user_unconfirmed_date_created_uuid", "date_created", "uuid",
+            postgresql_where=text("NOT is_email_confirmed")
+        ),
+        # Username prefix (LIKE 'abc%') lookups, whatever the collation
+        db.Index(
+            "ix_user_username_prefix", "username",
+            postgresql_ops={"username": "varchar_pattern_ops"}
+        ),
+    )
+
+    uuid = db.Column(db.String(40), primary_key=True, default=generate_uuid)
     username = db.Column(db.String(50), nullable=False, index=True, unique=True)
     email = db.Column(db.String(50), nullable=False, index=True, unique=True)
     password = db.Column(db.String, nullable=False)
@@ -48,8 +94,9 @@ class User(db.Model):
     email_confirm_token = db.Column(db.String, nullable=True)
     auth_token = db.Column(db.String, nullable=True)
     number_of_verification_requests = db.Column(db.Integer, nullable=True, default=0)
+    roles_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
-    date_created = db.Column(db.DateTime, default=dt.datetime.utcnow)
+    date_created = db.Column(db.DateTime, nullable=False, server_default=utc_now)
     date_modified = db.Column(db.DateTime, onupdate=dt.datetime.utcnow)
 
     roles = db.relationship("Role", secondary="user_role", backref="my_users", viewonly=True)
@@ -61,15 +108,26 @@ class User(db.Model):
         order_by="desc(Account.date_created)",
         foreign_keys="Account.user_id",
     )
+    # Read-only list form of `accounts`, which unlike the dynamic
+    # relationship can be eager loaded for many users in one query
+    account_list = db.relationship(
+        "Account",
+        viewonly=True,
+        order_by="desc(Account.date_created)",
+        foreign_keys="Account.user_id",
+    )
 
     def __repr__(self):
         return '<User %r>' % self.username
 
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hashing_pool.run(password_hashers.hash, password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password, password)
+        return hashing_pool.run(password_hashers.verify, password, self.password)
+
+    def password_needs_rehash(self):
+        return password_hashers.needs_rehash(self.password)
 
     def set_email_confirm_token(self, email):
         self.email_confirm_token = token.encode(
@@ -103,13 +161,58 @@ class User(db.Model):
             return None
 
 
+# Drop cached token lookups whenever a user row is written through the ORM,
+# and again once the write commits: a request running in between reads the
+# old committed row and would cache it for another TTL
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def evict_cached_user(mapper, connection, target):
+    user_cache.pop(target.uuid)
+    object_session(target).info.setdefault("evicted_users", set()).add(target.uuid)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def evict_committed_users(session):
+    for user_id in session.info.pop("evicted_users", ()):
+        user_cache.pop(user_id)
+
+
+# Role membership changes invalidate the role claims stamped into access tokens
+@event.listens_for(Role.users, "append")
+@event.listens_for(Role.users, "remove")
+def bump_member_roles_version(target, value, initiator):
+    value.roles_version = (value.roles_version or 0) + 1
+
+
+role_registry.loader = lambda: db.session.query(Role.name, Role.uuid).all()
+
+
+# Reload the role registry once a transaction that wrote a role ends, so
+# workers never cache a role another transaction cannot see yet
+@event.listens_for(Role, "after_insert")
+@event.listens_for(Role, "after_update")
+@event.listens_for(Role, "after_delete")
+def mark_roles_changed(mapper, connection, target):
+    object_session(target).info["roles_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def invalidate_role_registry(session):
+    if session.info.pop("roles_changed", False):
+        role_registry.invalidate()
+
+
 class Account(db.Model):
-    uuid = db.Column(db.String(40), primary_key=True, default=uuid.uuid1())
+    __mapper_args__ = {"eager_defaults": True}
+
+    uuid = db.Column(db.String(40), primary_key=True, default=generate_uuid)
     name = db.Column(db.String(50), nullable=False, index=True, unique=True)
     bio_data = db.Column(db.String, nullable=False)
     display_photo = db.Column(db.String, nullable=False, default="default-avatar.png")
 
-    date_created = db.Column(db.DateTime, default=dt.datetime.utcnow)
+    date_created = db.Column(db.DateTime, server_default=utc_now)
     date_modified = db.Column(db.DateTime, onupdate=dt.datetime.utcnow)
 
     user_id = db.Column(db.String(36), db.ForeignKey("user.uuid"))
@@ -120,5 +223,29 @@ class Account(db.Model):
 
 class TokenBlocklist(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    jti = db.Column(db.String(36), nullable=False, index=True)
+    jti = db.Column(UUID(as_uuid=False), nullable=False, index=True, unique=True)
     created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class TokenFamily(db.Model):
+    """
+    Chain of refresh tokens descending from a single login. Only the
+    `current_jti` may be exchanged; presenting any older member of the
+    chain revokes the whole family.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.String(40), db.ForeignKey("user.uuid", ondelete="CASCADE"), nullable=False, index=True
+    )
+    current_jti = db.Column(UUID(as_uuid=False), nullable=False)
+    revoked = db.Column(db.Boolean, nullable=False, default=False, server_default=false())
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# Keep this worker's revoked token prefilter in step with local revocations
+@event.listens_for(TokenBlocklist, "after_insert")
+def add_revoked_token_to_filter(mapper, connection, target):
+    revoked_token_filter.add(target.jti)
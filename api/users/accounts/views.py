@@ -7,7 +7,9 @@ from flask_jwt_extended import jwt_required, current_user
 from api.users.accounts.schemas import AccountSchema, AccountUpdateSchema
 from api.models import Account
 from api.utils import db
-from api.utils.views_utils import json_response, allowed_file
+from api.utils.views_utils import (
+    json_response, allowed_file, etag_for, not_modified, with_etag
+)
 
 import os
 
@@ -139,13 +141,15 @@ class AccountViewAPI(Resource):
                     )
 
         db.session.add(account)
-        db.session.commit()
+        db.session.flush()
 
-        account = Account.query.filter_by(name=result['name']).one_or_none()
+        # Serialize before commit expires the row
+        data = AccountSchema().dump(account)
+        db.session.commit()
 
         return json_response(
             status=201,
-            data=AccountSchema().dump(account),
+            data=data,
             message="Account Created."
         )
 
@@ -184,10 +188,13 @@ class AccountDetailViewAPI(Resource):
               $ref: '#/components/responses/TokenMissing'
           '400':
               $ref: '#/components/responses/TokenInvalid'
+          '304':
+              $ref: '#/components/responses/NotModified'
           '404':
               $ref: '#/components/responses/NotFound'
         parameters:
           - $ref: '#/components/parameters/account_id'
+          - $ref: '#/components/parameters/if_none_match'
         """
 
         account = Account.query.filter_by(
@@ -196,12 +203,16 @@ class AccountDetailViewAPI(Resource):
         ).one_or_none()
 
         if account:
+            etag = etag_for(account.uuid, account.date_created, account.date_modified)
+            response = not_modified(etag)
+            if response is not None:
+                return response
 
-            return json_response(
+            return with_etag(json_response(
                 status=200,
                 message="Data fetched!",
                 data=AccountSchema().dump(account)
-            )
+            ), etag)
         else:
             return json_response(
                 status=404,
@@ -0,0 +1,252 @@
+import csv
+import datetime as dt
+import io
+import itertools
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from marshmallow import fields, validates_schema, ValidationError, EXCLUDE
+from sqlalchemy import or_
+
+from api.models import User, user_role, generate_uuid
+from api.users.schemas import UserRegisterSchema
+from api.utils import db, password_hashers, role_registry
+
+
+USER_COLUMNS = (
+    "uuid", "username", "email", "phone_number", "password", "is_email_confirmed",
+    "number_of_verification_requests", "roles_version", "date_created",
+)
+USER_ROLE_COLUMNS = ("user_id", "role_id", "date_added")
+
+
+class UserImportSchema(UserRegisterSchema):
+    # Uniqueness is checked once per batch instead of once per row
+    unique_fields = ()
+
+    class Meta:
+        unknown = EXCLUDE
+
+    confirm_password = fields.String(load_only=True, load_default=None)
+
+    @validates_schema
+    def validate_confirm_password(self, data, **kwargs):
+        if data.get("confirm_password") is not None:
+            super().validate_confirm_password(data, **kwargs)
+
+
+def read_rows(file, file_format):
+    """
+    Stream rows from an open CSV (with a header line) or JSON Lines file
+    :param file, file_format: "csv" or "jsonl"
+    :Returns: generator of (line number, row dict)
+    """
+
+    if file_format == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            row = {"__error__": f"Invalid JSON: {error}"}
+        yield line_number, row
+
+
+class UserImporter(object):
+    """
+    Bulk create users from a stream of rows. Rows are validated with the
+    registration rules, checked for uniqueness with one query per batch,
+    hashed on a process pool and written with COPY (or a multi-row INSERT
+    on other databases), one transaction per batch.
+    """
+
+    def __init__(self, role_names=("Client",), batch_size=5000, workers=0,
+                 confirm_emails=False, on_error=None):
+        self.role_names = role_names
+        self.batch_size = batch_size
+        self.workers = workers
+        self.confirm_emails = confirm_emails
+        self.on_error = on_error
+        self.schema = UserImportSchema()
+        self.role_ids = []
+        self.imported = 0
+        self.failed = 0
+        self.started = None
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        return self.imported / elapsed if elapsed else 0.0
+
+    def _error(self, line_number, errors):
+        self.failed += 1
+        if self.on_error is not None:
+            self.on_error(line_number, errors)
+
+    def run(self, rows, on_batch=None):
+        """
+        :param rows, on_batch=None: iterable of (line number, row dict) and
+            a callback invoked with the importer after every batch
+        :Returns: number of users imported
+        """
+
+        missing = [name for name in self.role_names if role_registry.get(name) is None]
+        if missing:
+            raise ValueError(f"Unknown role(s): {', '.join(sorted(missing))}")
+        self.role_ids = role_registry.uuids(self.role_names)
+
+        executor = None
+        if self.workers > 0:
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+        self.started = time.perf_counter()
+        rows = iter(rows)
+        try:
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                self._import_batch(batch, executor)
+                if on_batch is not None:
+                    on_batch(self)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        return self.imported
+
+    def _validate(self, batch):
+        valid = []
+        seen = {name: set() for name in ("username", "email", "phone_number")}
+        for line_number, row in batch:
+            if "__error__" in row:
+                self._error(line_number, {"_schema": [row["__error__"]]})
+                continue
+
+            try:
+                result = self.schema.load(row)
+            except ValidationError as error:
+                self._error(line_number, error.messages)
+                continue
+
+            duplicates = {
+                name: [f"{name} is repeated in the import file."]
+                for name, values in seen.items() if result[name] in values
+            }
+            if duplicates:
+                self._error(line_number, duplicates)
+                continue
+
+            for name, values in seen.items():
+                values.add(result[name])
+            valid.append((line_number, result))
+
+        return self._drop_existing(valid) if valid else valid
+
+    def _drop_existing(self, valid):
+        # One query for the whole batch instead of one per row and field
+        taken = {name: set() for name in ("username", "email", "phone_number")}
+        existing = User.query.with_entities(User.username, User.email, User.phone_number).filter(or_(
+            User.username.in_([result["username"] for _, result in valid]),
+            User.email.in_([result["email"] for _, result in valid]),
+            User.phone_number.in_([result["phone_number"] for _, result in valid]),
+        ))
+        for row in existing:
+            for name in taken:
+                taken[name].add(getattr(row, name))
+
+        unique = []
+        for line_number, result in valid:
+            conflicts = {
+                name: [f"{name} already exist."]
+                for name, values in taken.items() if result[name] in values
+            }
+            if conflicts:
+                self._error(line_number, conflicts)
+            else:
+                unique.append((line_number, result))
+
+        return unique
+
+    def _import_batch(self, batch, executor):
+        valid = self._validate(batch)
+        if not valid:
+            return
+
+        passwords = [result["password"] for _, result in valid]
+        if executor is not None:
+            chunksize = max(len(passwords) // (self.workers * 4), 1)
+            hashes = list(executor.map(password_hashers.hash, passwords, chunksize=chunksize))
+        else:
+            hashes = [password_hashers.hash(password) for password in passwords]
+
+        now = dt.datetime.utcnow()
+        users = []
+        links = []
+        for (_, result), password in zip(valid, hashes):
+            user_id = generate_uuid()
+            users.append({
+                "uuid": user_id,
+                "username": result["username"],
+                "email": result["email"],
+                "phone_number": result["phone_number"],
+                "password": password,
+                "is_email_confirmed": self.confirm_emails,
+                "number_of_verification_requests": 0,
+                "roles_version": 0,
+                "date_created": now,
+            })
+            links.extend(
+                {"user_id": user_id, "role_id": role_id, "date_added": now}
+                for role_id in self.role_ids
+            )
+
+        try:
+            self._insert(User.__table__, USER_COLUMNS, users)
+            self._insert(user_role, USER_ROLE_COLUMNS, links)
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            for line_number, _ in valid:
+                self._error(line_number, {"_schema": [f"Batch insert failed: {error}"]})
+            return
+
+        self.imported += len(users)
+
+    @staticmethod
+    def _insert(table, columns, rows):
+        if not rows:
+            return
+
+        connection = db.session.connection()
+        if connection.dialect.name != "postgresql":
+            connection.execute(table.insert(), rows)
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                row[column].isoformat() if isinstance(row[column], dt.datetime) else row[column]
+                for column in columns
+            ])
+        buffer.seek(0)
+
+        quoted = ", ".join(f'"{column}"' for column in columns)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f'COPY "{table.name}" ({quoted}) FROM STDIN WITH (FORMAT csv)', buffer
+            )
+        finally:
+            cursor.close()
@@ -2,11 +2,43 @@ from flask import request
 from flask_restful import Resource
 from marshmallow import ValidationError
 from flask_jwt_extended import jwt_required
+from sqlalchemy import func, select
 
 from api.users.roles.schemas import RoleSchema
-from api.models import Role
+from api.models import Role, User, user_role
 from api.utils import db
-from api.utils.views_utils import role_required, json_response
+from api.utils.views_utils import (
+    role_required, json_response, etag_for, not_modified, with_etag
+)
+from api.utils.fieldsets import Fieldset
+
+
+def role_version(role_id, include=()):
+    """
+    The columns a role's representation changes with, read in one query:
+    the role's modification time and, when its users are included, how
+    many members it has, when the latest joined and when any of them changed
+    :param role_id, include: relations included in the representation
+    :Returns: tuple, None if there is no such role
+    """
+
+    columns = [Role.date_modified]
+    if "users" in include:
+        # Scalar subqueries correlated with the role row, so the query stays one row of role
+        members = [
+            select(func.count(user_role.c.user_id)),
+            select(func.max(user_role.c.date_added)),
+            select(func.max(User.date_modified)).select_from(user_role).join(
+                User, User.uuid == user_role.c.user_id
+            ),
+        ]
+        columns += [
+            aggregate.where(user_role.c.role_id == Role.uuid).scalar_subquery() for aggregate in members
+        ]
+
+    row = db.session.query(*columns).filter(Role.uuid == role_id).one_or_none()
+
+    return None if row is None else tuple(row)
 
 
 class RolesViewAPI(Resource):
@@ -113,13 +145,15 @@ class RolesViewAPI(Resource):
         role = Role(**result)
 
         db.session.add(role)
-        db.session.commit()
+        db.session.flush()
 
-        role = Role.query.filter_by(name=result['name']).one_or_none()
+        # Serialize before commit expires the row; a new role has no users to dump
+        data = RoleSchema(exclude=["users"]).dump(role)
+        db.session.commit()
 
         return json_response(
             status=201,
-            data=RoleSchema().dump(role),
+            data=data,
             message="Role Created."
         )
 
@@ -162,21 +196,42 @@ class RolesDetailViewAPI(Resource):
               $ref: '#/components/responses/TokenInvalid'
           '403':
               $ref: '#/components/responses/AccessDenied'
+          '304':
+              $ref: '#/components/responses/NotModified'
           '404':
               $ref: '#/components/responses/NotFound'
         parameters:
           - $ref: '#/components/parameters/role_id'
+          - $ref: '#/components/parameters/fields'
+          - $ref: '#/components/parameters/include'
+          - $ref: '#/components/parameters/if_none_match'
         """
 
-        role = Role.query.filter_by(uuid=role_id).one_or_none()
+        try:
+            fieldset = Fieldset(RoleSchema, {"users": None}, request.args)
+        except ValidationError as error:
+            return json_response(
+                status=400,
+                message="Please correct the errors",
+                errors=error.messages
+            )
+
+        version = role_version(role_id, fieldset.include)
+        etag = etag_for(role_id, fieldset.only, version)
+        # If-None-Match: * only matches a resource that exists
+        response = not_modified(etag) if version is not None else None
+        if response is not None:
+            return response
+
+        role = Role.query.options(*fieldset.options(Role)).filter_by(uuid=role_id).one_or_none()
 
         if role:
 
-            return json_response(
+            return with_etag(json_response(
                 status=200,
                 message="Data fetched!",
-                data=RoleSchema().dump(role)
-            )
+                data=fieldset.schema().dump(role)
+            ), etag)
         else:
             return json_response(
                 status=404,
@@ -242,6 +297,8 @@ class RolesDetailViewAPI(Resource):
         role = Role.query.filter_by(uuid=role_id).one_or_none()
 
         if role:
+            if role.name != result["name"]:
+                role.bump_users_roles_version()
             role.name = result["name"]
             db.session.commit()
 
@@ -295,6 +352,7 @@ class RolesDetailViewAPI(Resource):
         role = Role.query.filter_by(uuid=role_id).one_or_none()
 
         if role:
+            role.bump_users_roles_version()
             db.session.delete(role)
             db.session.commit()
 
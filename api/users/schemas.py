@@ -1,13 +1,19 @@
-from marshmallow import Schema, fields, validates, validate, ValidationError, validates_schema
+from marshmallow import (
+    Schema, fields, validates, validate, ValidationError, validates_schema, post_load
+)
+from flask import current_app
 from flask_jwt_extended import current_user
 
 from api.models import User
+from api.utils import role_registry
+from api.utils.pagination import KeysetPageSchema
 from api.utils.schemas_utils import (
-    validate_model_object_does_not_exist, validate_model_object_does_exist,
-    validate_phone_number
+    validate_model_object_does_exist, validate_unique_fields, validate_phone_number
 )
 from api.users.accounts.schemas import AccountSchema
 
+from datetime import timezone
+
 
 class RoleSchema(Schema):
     name = fields.String()
@@ -20,7 +26,38 @@ class UserSchema(Schema):
     phone_number = fields.String()
     is_verified = fields.String(attribute="is_email_confirmed")
     roles = fields.Nested(RoleSchema, many=True)
-    accounts = fields.Nested(AccountSchema, many=True)
+    accounts = fields.Nested(AccountSchema, many=True, attribute="account_list")
+
+
+class UserListSchema(KeysetPageSchema):
+    """ Whitelisted filters and sort orders of the admin user list """
+
+    is_email_confirmed = fields.Boolean()
+    role = fields.String()
+    created_after = fields.DateTime()
+    created_before = fields.DateTime()
+    username = fields.String(validate=[validate.Length(min=1, max=50)])
+    order_by = fields.String(
+        load_default="date_created",
+        validate=[validate.OneOf(["date_created", "-date_created", "username", "-username"])]
+    )
+
+    @validates("role")
+    def validate_role(self, role):
+        if role_registry.get(role) is None:
+            raise ValidationError(f"Role {role} does not exist.")
+
+    @post_load
+    def to_utc(self, data, **kwargs):
+        # Creation dates are stored as naive UTC
+        for key in ("created_after", "created_before"):
+            if key in data and data[key].tzinfo is not None:
+                data[key] = data[key].astimezone(timezone.utc).replace(tzinfo=None)
+        return data
+
+
+class UserExportSchema(Schema):
+    format = fields.String(load_default="jsonl", validate=[validate.OneOf(["jsonl", "csv"])])
 
 
 class UserRegisterSchema(Schema):
@@ -52,19 +89,14 @@ class UserRegisterSchema(Schema):
         error_messages={"required": "Confirm password is required"}
     )
 
-    @validates("username")
-    def validate_username(self, username):
-        validate_model_object_does_not_exist(User, User.username, username, field_name='username')
+    unique_fields = ("username", "email", "phone_number")
 
-    @validates("email")
-    def validate_email(self, email):
-        validate_model_object_does_not_exist(User, User.email, email, field_name='email')
+    @validates_schema(skip_on_field_errors=False)
+    def validate_unique(self, data, **kwargs):
+        validate_unique_fields(User, data, self.unique_fields)
 
     @validates("phone_number")
     def validate_phone_number(self, phone_number):
-        validate_model_object_does_not_exist(
-            User, User.phone_number, phone_number, field_name='phone_number'
-        )
         validate_phone_number(phone_number)
 
     @validates("password")
@@ -153,6 +185,22 @@ class UserRevokeTokenSchema(Schema):
                 )
 
 
+class TokenIntrospectSchema(Schema):
+    tokens = fields.List(
+        fields.String(validate=[validate.Length(min=1)]),
+        required=True,
+        error_messages={"required": "tokens is required"}
+    )
+
+    @validates("tokens")
+    def validate_tokens(self, tokens):
+        max_tokens = current_app.config.get("JWT_INTROSPECT_MAX_TOKENS", 100)
+        if not tokens or len(tokens) > max_tokens:
+            raise ValidationError(
+                f"Provide between 1 and {max_tokens} tokens.", field_name="tokens"
+            )
+
+
 class UserChangePasswordSchema(Schema):
     current_password = fields.String(
         required=True,
@@ -273,33 +321,13 @@ class UserUpdateSchema(Schema):
         error_messages={"required": "phone_number is required"}
     )
 
-    @validates("username")
-    def validate_username(self, username):
-        if username != current_user.username:
-            validate_model_object_does_not_exist(
-                User,
-                User.username,
-                username,
-                field_name='username'
-            )
+    unique_fields = ("username", "email", "phone_number")
 
-    @validates("email")
-    def validate_email(self, email):
-        if email != current_user.email:
-            validate_model_object_does_not_exist(
-                User,
-                User.email,
-                email,
-                field_name='email'
-            )
+    @validates_schema(skip_on_field_errors=False)
+    def validate_unique(self, data, **kwargs):
+        validate_unique_fields(User, data, self.unique_fields, instance=current_user)
 
     @validates("phone_number")
     def validate_phone_number(self, phone_number):
         if phone_number != current_user.phone_number:
-            validate_model_object_does_not_exist(
-                User,
-                User.phone_number,
-                phone_number,
-                field_name='phone_number'
-            )
             validate_phone_number(phone_number)
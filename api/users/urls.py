@@ -2,7 +2,7 @@ from api.users.views import (
     UserRegisterViewAPI, UserConfirmEmailViewAPI,
     UserLoginViewAPI, UserLogoutViewAPI, UserRefreshTokenViewAPI,
     UserChangePasswordViewAPI, UserForgotPasswordViewAPI, MyUserProfileViewAPI,
-    UserViewAPI, UserDetailViewAPI, FileUploadsView,
+    UserViewAPI, UserExportViewAPI, UserDetailViewAPI, FileUploadsView, JWKSViewAPI, TokenIntrospectViewAPI,
 )
 
 
@@ -37,6 +37,12 @@ def user_urls(api):
         "/v1/user/logout/",
         endpoint="user_logout_api"
     )
+    api.add_resource(
+        TokenIntrospectViewAPI,
+        '/v1/auth/introspect',
+        "/v1/auth/introspect/",
+        endpoint="token_introspect_api"
+    )
     api.add_resource(
         UserChangePasswordViewAPI,
         '/v1/user/change-password',
@@ -63,6 +69,12 @@ def user_urls(api):
         "/v1/users/",
         endpoint="user_list_api"
     )
+    api.add_resource(
+        UserExportViewAPI,
+        '/v1/users/export',
+        "/v1/users/export/",
+        endpoint="user_export_api"
+    )
     api.add_resource(
         UserDetailViewAPI,
         '/v1/users/<string:user_id>',
@@ -70,6 +82,12 @@ def user_urls(api):
         endpoint="user_detail_api"
     )
 
+    api.add_resource(
+        JWKSViewAPI,
+        '/.well-known/jwks.json',
+        endpoint="jwks_api"
+    )
+
     api.add_resource(
         FileUploadsView,
         '/v1/users/<string:file_name>',
@@ -1,21 +1,116 @@
-from flask import request, url_for, current_app, send_from_directory
+from flask import (
+    request, url_for, current_app, send_from_directory, jsonify, Response, stream_with_context
+)
 from flask_restful import Resource
 from flask_jwt_extended import (
     create_access_token, create_refresh_token, get_jwt_identity, get_jwt,
     jwt_required, current_user
 )
-from marshmallow import ValidationError
+from marshmallow import ValidationError, EXCLUDE
+from sqlalchemy import exists, func, select
+from sqlalchemy.orm import selectinload
 
 from api.users.schemas import (
     UserRegisterSchema, UserEmailConfirmSchema, UserLoginSchema,
-    UserChangePasswordSchema, UserForgotPasswordSchema, UserSchema, UserUpdateSchema
+    UserChangePasswordSchema, UserForgotPasswordSchema, UserSchema, UserUpdateSchema,
+    TokenIntrospectSchema, UserListSchema, UserExportSchema
+)
+from api.models import User, Role, Account, TokenBlocklist, user_role
+from api.utils import (
+    db, token, keyset, login_writes, user_cache, login_throttle, email_outbox, role_registry
+)
+from api.utils.views_utils import (
+    role_required, json_response, etag_for, not_modified, with_etag
+)
+from api.utils.pagination import keyset_page
+from api.users.exports import UserExporter
+from api.utils.fieldsets import Fieldset
+from api.utils.auth import (
+    role_claims, introspect_tokens, start_token_family, rotate_token_family, get_or_create_role
 )
-from api.models import User, Role, TokenBlocklist
-from api.utils import db, token
-from api.utils.views_utils import role_required, json_response
 
 from datetime import timezone, datetime
-import uuid
+import re
+
+
+def user_relations():
+    """
+    Loader options for the relationships UserSchema nests: each is read
+    with one `SELECT ... WHERE user_id IN (...)` for all loaded users,
+    so dumping a page of users costs the same number of queries as one
+    :Returns: dict of nested field name to loader option
+    """
+
+    return {
+        "roles": selectinload(User.roles).load_only(Role.name),
+        "accounts": selectinload(User.account_list),
+    }
+
+
+def account_summary(user_id):
+    """
+    How many accounts a user has and when the latest of them changed
+    :param user_id: uuid or a column to correlate with
+    :Returns: list of scalar subqueries
+    """
+
+    accounts = select(func.count(Account.uuid)).where(Account.user_id == user_id)
+    changed = select(
+        func.max(func.coalesce(Account.date_modified, Account.date_created))
+    ).where(Account.user_id == user_id)
+
+    return [accounts.scalar_subquery(), changed.scalar_subquery()]
+
+
+def user_version(user_id, include=()):
+    """
+    The columns a user's representation changes with, read in one query:
+    the user's modification time and roles version (bumped by membership
+    changes and role renames) and, when accounts are included, their summary
+    :param user_id, include: relations included in the representation
+    :Returns: tuple, None if there is no such user
+    """
+
+    columns = [User.date_modified, User.roles_version]
+    if "accounts" in include:
+        columns += account_summary(User.uuid)
+
+    row = db.session.query(*columns).filter(User.uuid == user_id).one_or_none()
+
+    return None if row is None else tuple(row)
+
+
+# order_by values of the user list and the unique sort keys they page by
+user_sort_keys = {
+    "date_created": (User.date_created, User.uuid),
+    "username": (User.username,),
+}
+
+
+def filter_users(query, filters):
+    """
+    Compile the user list filters into conditions each served by an index
+    :param query, filters: loaded UserListSchema
+    :Returns: query
+    """
+
+    if "is_email_confirmed" in filters:
+        confirmed = User.is_email_confirmed
+        query = query.filter(confirmed if filters["is_email_confirmed"] else ~confirmed)
+    if "role" in filters:
+        query = query.filter(exists().where(
+            user_role.c.role_id == role_registry.get(filters["role"]),
+            user_role.c.user_id == User.uuid
+        ))
+    if "created_after" in filters:
+        query = query.filter(User.date_created > filters["created_after"])
+    if "created_before" in filters:
+        query = query.filter(User.date_created < filters["created_before"])
+    if "username" in filters:
+        prefix = re.sub(r"([\\%_])", r"\\\1", filters["username"])
+        query = query.filter(User.username.like(f"{prefix}%", escape="\\"))
+
+    return query
 
 
 class UserRegisterViewAPI(Resource):
@@ -59,52 +154,32 @@ class UserRegisterViewAPI(Resource):
                 errors=error.messages
             )
 
-        user = User(**result, uuid=uuid.uuid1())
+        user = User(**result)
         user.set_password(user.password)
         user.set_email_confirm_token(user.email)
 
-        role = Role.query.filter_by(name='Client').one_or_none()
-
-        if role:
-            role.users.append(user)
-        else:
-            role = Role(name="Client")
-            role.users.append(user)
-            db.session.add(role)
-            db.session.commit()
-
         db.session.add(user)
+        db.session.flush()
+        db.session.execute(user_role.insert().values(
+            user_id=user.uuid, role_id=get_or_create_role("Client")
+        ))
+
+        email_outbox.queue_template(
+            db.session, user.email, "confirm_email",
+            link=f'{url_for("user_confirm-email_api", _external=True)}?token={user.email_confirm_token}'
+        )
         db.session.commit()
 
-        user = User.query.filter_by(email=result['email']).one_or_none()
-
-        if user:
-            message = f'''
-                Thank you for signing up with Malonza-Tech.
-                Please click this
-                <a href="{url_for("user_confirm-email_api")}?token={user.email_confirm_token}">
-                link to confirm your email</a>
-            '''
-            print(message)
-
-            # TODO:
-            # Send Actual Email
-            # Confirm Phone number via OTP
-
-            return json_response(
-                status=201,
-                data=UserRegisterSchema().dump(result),
-                message=f"""User Created. Confirmation link has been sent to your email.
-                Verify you email to login. If no confirmation link please click this
-                <a href="{url_for('user_confirm-email_api')}"> link to resend the link</a>."""
-            )
-        else:
+        # TODO:
+        # Confirm Phone number via OTP
 
-            return json_response(
-                status=500,
-                data=UserRegisterSchema().dump(result),
-                message="Error Creating user. Please try again later."
-            )
+        return json_response(
+            status=201,
+            data=UserRegisterSchema().dump(result),
+            message=f"""User Created. Confirmation link has been sent to your email.
+            Verify you email to login. If no confirmation link please click this
+            <a href="{url_for('user_confirm-email_api')}"> link to resend the link</a>."""
+        )
 
 
 class UserConfirmEmailViewAPI(Resource):
@@ -216,16 +291,11 @@ class UserConfirmEmailViewAPI(Resource):
         if user:
             if not user.is_email_confirmed:
                 user.set_email_confirm_token(user.email)
+                email_outbox.queue_template(
+                    db.session, user.email, "confirm_email",
+                    link=f'{url_for("user_confirm-email_api", _external=True)}?token={user.email_confirm_token}'
+                )
                 db.session.commit()
-                message = f'''
-                Thank you for signing up with Space Ya Tech.
-                Please click this link to confirm your email:
-                {url_for("user_confirm-email_api")}?token={user.email_confirm_token}
-                '''
-                print(message)
-
-                # TODO:
-                # Send Actual Email
 
                 return json_response(
                     status=200,
@@ -278,6 +348,12 @@ class UserLoginViewAPI(Resource):
             $ref: '#/components/responses/ValidationError'
           '403':
             $ref: '#/components/responses/UserNotConfirmed'
+          '429':
+            description: Too many failed login attempts, retry after the Retry-After header seconds
+            content:
+              application/json:
+                schema:
+                  $ref: '#/components/schemas/GeneralResponse'
           '500':
             $ref: '#/components/responses/GeneralError'
         """
@@ -291,18 +367,43 @@ class UserLoginViewAPI(Resource):
                 message="Fix this errors",
             )
 
-        if results.get("username", None):
-            user = User.query.filter_by(username=results["username"]).one_or_none()
+        username = results.get("username", None)
+        retry_after = login_throttle.check(username, request.remote_addr)
+        if retry_after:
+            response = json_response(
+                status=429, message="Too many failed login attempts. Try again later."
+            )
+            response.headers["Retry-After"] = str(retry_after)
+            return response
+
+        if username:
+            user = User.query.filter_by(username=username).one_or_none()
 
             if user is not None:
                 if user.is_email_confirmed:
                     if user.verify_password(results["password"]):
-                        access_token = create_access_token(identity=user.uuid, fresh=True)
-                        refresh_token = create_refresh_token(identity=user.uuid)
+                        login_throttle.record_success(username, request.remote_addr)
 
-                        user.auth_token = access_token
+                        if user.password_needs_rehash():
+                            # Upgrade hashes stored with an outdated algorithm or cost
+                            user.set_password(results["password"])
+                            db.session.add(user)
 
-                        db.session.add(user)
+                        access_token = create_access_token(
+                            identity=user.uuid, fresh=True, additional_claims=role_claims(user)
+                        )
+                        refresh_token = create_refresh_token(
+                            identity=user.uuid, additional_claims=start_token_family(user)
+                        )
+
+                        if login_writes.enabled:
+                            login_writes.queue(User, user.uuid, auth_token=access_token)
+                            user_cache.pop(user.uuid)
+                        else:
+                            user.auth_token = access_token
+                            db.session.add(user)
+
+                        # Commits the refresh token family
                         db.session.commit()
 
                         return json_response(
@@ -312,6 +413,7 @@ class UserLoginViewAPI(Resource):
                             message="User logged-in successfully."
                         )
                     else:
+                        login_throttle.record_failure(username, request.remote_addr)
                         return json_response(
                             status=403, message="Wrong email or password"
                         )
@@ -326,6 +428,7 @@ class UserLoginViewAPI(Resource):
                         """
                     )
 
+        login_throttle.record_failure(username, request.remote_addr)
         return json_response(
             status=403, message="Wrong email or password"
         )
@@ -336,7 +439,9 @@ class UserRefreshTokenViewAPI(Resource):
     @jwt_required(refresh=True)
     def post(self):
         """
-        Endpoint to send a new access token to user if valid refresh token provided
+        Endpoint to send a new access token to user if valid refresh token provided.
+        The refresh token is rotated: use the returned one for the next refresh,
+        presenting an already used refresh token revokes the whole login
         ---
         tags:
           - users
@@ -362,8 +467,31 @@ class UserRefreshTokenViewAPI(Resource):
 
         identity = get_jwt_identity()
 
-        if identity is not None:
-            access_token = create_access_token(identity=identity, fresh=False)
+        if identity is not None and current_user is not None:
+            jwt_data = get_jwt()
+
+            if "fam" in jwt_data:
+                family_claims = rotate_token_family(jwt_data["fam"], jwt_data["jti"])
+                if family_claims is None:
+                    return json_response(
+                        status=403, message="Refresh token has been revoked."
+                    )
+            else:
+                # Refresh tokens issued before rotation are retired into a new family
+                db.session.add(TokenBlocklist(
+                    jti=jwt_data["jti"],
+                    created_at=datetime.utcnow(),
+                    expires_at=datetime.fromtimestamp(jwt_data["exp"], timezone.utc).replace(tzinfo=None)
+                ))
+                family_claims = start_token_family(current_user)
+                db.session.commit()
+
+            access_token = create_access_token(
+                identity=identity, fresh=False, additional_claims=role_claims(current_user)
+            )
+            refresh_token = create_refresh_token(
+                identity=identity, additional_claims=family_claims
+            )
             # identity.auth_token = access_token
 
             # db.session.add(identity)
@@ -372,6 +500,7 @@ class UserRefreshTokenViewAPI(Resource):
             return json_response(
                 status=200,
                 access_token=access_token,
+                refresh_token=refresh_token,
                 message="New access token."
             )
 
@@ -411,9 +540,13 @@ class UserLogoutViewAPI(Resource):
 
         # Saved the unique identifier (jti) for the JWT into our database.
 
-        jti = get_jwt()["jti"]
-        now = datetime.now(timezone.utc)
-        db.session.add(TokenBlocklist(jti=jti, created_at=now))
+        # The blocklist stores naive UTC, like the purge that compares against it
+        jwt_data = get_jwt()
+        now = datetime.utcnow()
+        expires_at = datetime.fromtimestamp(jwt_data["exp"], timezone.utc).replace(tzinfo=None)
+        db.session.add(TokenBlocklist(
+            jti=jwt_data["jti"], created_at=now, expires_at=expires_at
+        ))
         db.session.commit()
 
         return json_response(
@@ -421,6 +554,66 @@ class UserLogoutViewAPI(Resource):
         )
 
 
+class TokenIntrospectViewAPI(Resource):
+
+    @jwt_required()
+    @role_required(['Admin', 'SuperAdmin'])
+    def post(self):
+        """
+        This endpoint verifies a batch of access or refresh tokens for gateways,
+        checking signature, expiry, revocation and the token owner in one pass
+        ---
+        tags:
+          - auth
+          - admin
+        security:
+          - bearer_token: []
+        requestBody:
+          description: tokens to verify
+          required: true
+          content:
+            application/json:
+              schema:
+                type: object
+                properties:
+                  tokens:
+                    type: array
+                    items:
+                      type: string
+        responses:
+          '200':
+            description: Per-token results in request order
+            content:
+              application/json:
+                schema:
+                  $ref: '#/components/schemas/GeneralResponse'
+                example:
+                  $ref: '#/components/examples/introspect_success'
+          '400':
+            $ref: '#/components/responses/ValidationError'
+          '401':
+            $ref: '#/components/responses/TokenMissing'
+          '403':
+            $ref: '#/components/responses/AccessDenied'
+        """
+
+        try:
+            result = TokenIntrospectSchema().load(request.get_json())
+        except ValidationError as error:
+
+            return json_response(
+                status=400,
+                message="Please correct the errors",
+                errors=error.messages
+            )
+
+        return json_response(
+            status=200,
+            message="Tokens introspected.",
+            data=introspect_tokens(result["tokens"])
+        )
+
+
 class UserChangePasswordViewAPI(Resource):
 
     @jwt_required()
@@ -602,15 +795,11 @@ class UserForgotPasswordViewAPI(Resource):
         if user:
             if user.is_email_confirmed:
                 user.set_forgot_password_token(user.uuid)
+                email_outbox.queue_template(
+                    db.session, user.email, "reset_password", expires_in=60,
+                    link=f'{url_for("user_forgot-password_api", _external=True)}?token={user.email_confirm_token}'
+                )
                 db.session.commit()
-                message = f'''
-                Please find a link to change your password.
-                The link will expire in 30 minutes: <a href="
-                {url_for("user_forgot-password_api")}?token={user.email_confirm_token}">
-                Link to change your password</a>
-                '''
-                # send_email(message, recipients=[email,])
-                print(f"email: {message}")
             else:
                 return json_response(
                     status=403,
@@ -662,15 +851,40 @@ class MyUserProfileViewAPI(Resource):
               $ref: '#/components/responses/TokenMissing'
           '400':
               $ref: '#/components/responses/TokenInvalid'
+          '304':
+              $ref: '#/components/responses/NotModified'
+        parameters:
+          - $ref: '#/components/parameters/fields'
+          - $ref: '#/components/parameters/include'
+          - $ref: '#/components/parameters/if_none_match'
         """
 
+        try:
+            fieldset = Fieldset(UserSchema, user_relations(), request.args)
+        except ValidationError as error:
+            return json_response(
+                status=400,
+                message="Please correct the errors",
+                errors=error.messages
+            )
+
+        # Already loaded for the token, possibly from the user cache: the tag
+        # is built from the same column values the body is dumped from
         user = current_user
+        version = (user.date_modified, user.roles_version)
+        if "accounts" in fieldset.include:
+            version += tuple(db.session.query(*account_summary(user.uuid)).one())
 
-        return json_response(
+        etag = etag_for(user.uuid, fieldset.only, version)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        return with_etag(json_response(
             status=200,
             message="Data fetched.",
-            data=UserSchema().dump(user)
-        )
+            data=fieldset.schema().dump(user)
+        ), etag)
 
     @jwt_required()
     def put(self):
@@ -727,15 +941,10 @@ class MyUserProfileViewAPI(Resource):
             user.email = email
             user.set_email_confirm_token(email)
             user.is_email_confirmed = True
-            message = f'''
-                Thank you for being a valued member of SpaceYaTech.
-                Please click this
-                <a href="{url_for("user_confirm-email_api")}?token={user.email_confirm_token}">
-                link to confirm the new email</a>
-            '''
-            # TODO:
-            # Send the actual email
-            print(message)
+            email_outbox.queue_template(
+                db.session, email, "confirm_new_email",
+                link=f'{url_for("user_confirm-email_api", _external=True)}?token={user.email_confirm_token}'
+            )
 
         if phone_number != user.phone_number:
             user.phone_number = phone_number
@@ -791,6 +1000,10 @@ class UserViewAPI(Resource):
                         type: array
                         items:
                           $ref: '#/components/schemas/User'
+                      next:
+                        type: string
+                        nullable: true
+                        description: cursor of the next page, null on the last page
                       status:
                         type: integer
                         minimum: 100
@@ -803,14 +1016,92 @@ class UserViewAPI(Resource):
               $ref: '#/components/responses/TokenInvalid'
           '403':
               $ref: '#/components/responses/AccessDenied'
+        parameters:
+          - $ref: '#/components/parameters/limit'
+          - $ref: '#/components/parameters/cursor'
+          - $ref: '#/components/parameters/is_email_confirmed'
+          - $ref: '#/components/parameters/role'
+          - $ref: '#/components/parameters/created_after'
+          - $ref: '#/components/parameters/created_before'
+          - $ref: '#/components/parameters/username'
+          - $ref: '#/components/parameters/order_by'
+          - $ref: '#/components/parameters/fields'
+          - $ref: '#/components/parameters/include'
         """
 
-        users = User.query.all()
+        try:
+            page = UserListSchema().load(request.args, unknown=EXCLUDE)
+            fieldset = Fieldset(UserSchema, user_relations(), request.args)
+            sort_key = user_sort_keys[page["order_by"].lstrip("-")]
+            users, next_cursor = keyset_page(
+                filter_users(User.query.options(*fieldset.options(User, *sort_key)), page),
+                sort_key, page["cursor"], page["limit"], descending=page["order_by"].startswith("-")
+            )
+        except ValidationError as error:
+            return json_response(
+                status=400,
+                message="Please correct the errors",
+                errors=error.messages
+            )
 
         return json_response(
             status=200,
             message="Data fetched!",
-            data=UserSchema(many=True).dump(users)
+            data=fieldset.schema(many=True).dump(users),
+            next=next_cursor
+        )
+
+
+class UserExportViewAPI(Resource):
+
+    @jwt_required()
+    @role_required(['Admin', 'SuperAdmin'])
+    def get(self):
+        """
+        This endpoint streams every user with their roles and accounts, for audits
+        ---
+        tags:
+          - users
+          - admin
+        security:
+          - bearer_token: []
+        responses:
+          '200':
+              description: >
+                users as JSON Lines, one user object per line, or as CSV with
+                one row per account
+              content:
+                application/x-ndjson:
+                  schema:
+                    $ref: '#/components/schemas/User'
+                text/csv:
+                  schema:
+                    type: string
+          '401':
+              $ref: '#/components/responses/TokenMissing'
+          '400':
+              $ref: '#/components/responses/TokenInvalid'
+          '403':
+              $ref: '#/components/responses/AccessDenied'
+        parameters:
+          - $ref: '#/components/parameters/export_format'
+        """
+
+        try:
+            query = UserExportSchema().load(request.args)
+        except ValidationError as error:
+            return json_response(
+                status=400,
+                message="Please correct the errors",
+                errors=error.messages
+            )
+
+        exporter = UserExporter(query["format"], current_app.config["USER_EXPORT_CHUNK_SIZE"])
+
+        return Response(
+            stream_with_context(exporter.chunks()),
+            mimetype=exporter.mimetype,
+            headers={"Content-Disposition": f"attachment; filename=users.{query['format']}"}
         )
 
 
@@ -851,20 +1142,43 @@ class UserDetailViewAPI(Resource):
               $ref: '#/components/responses/TokenInvalid'
           '403':
               $ref: '#/components/responses/AccessDenied'
+          '304':
+              $ref: '#/components/responses/NotModified'
           '404':
               $ref: '#/components/responses/NotFound'
         parameters:
           - $ref: '#/components/parameters/user_id'
+          - $ref: '#/components/parameters/fields'
+          - $ref: '#/components/parameters/include'
+          - $ref: '#/components/parameters/if_none_match'
         """
 
-        user = User.query.filter_by(uuid=user_id).one_or_none()
+        try:
+            fieldset = Fieldset(UserSchema, user_relations(), request.args)
+        except ValidationError as error:
+            return json_response(
+                status=400,
+                message="Please correct the errors",
+                errors=error.messages
+            )
+
+        # A cheap version check answers clients that already have the user
+        # before anything is loaded or serialized; If-None-Match: * only
+        # matches a user that exists
+        version = user_version(user_id, fieldset.include)
+        etag = etag_for(user_id, fieldset.only, version)
+        response = not_modified(etag) if version is not None else None
+        if response is not None:
+            return response
+
+        user = User.query.options(*fieldset.options(User)).filter_by(uuid=user_id).one_or_none()
 
         if user:
-            return json_response(
+            return with_etag(json_response(
                 status=200,
                 message="Data fetched!",
-                data=UserSchema().dump(user)
-            )
+                data=fieldset.schema().dump(user)
+            ), etag)
         else:
             return json_response(
                 status=404,
@@ -877,3 +1191,35 @@ class FileUploadsView(Resource):
 
     def get(self, file_name):
         return send_from_directory(current_app.config["UPLOAD_FOLDER"], file_name)
+
+
+class JWKSViewAPI(Resource):
+
+    def get(self):
+        """
+        This endpoint publishes the public keys used to sign access and refresh tokens
+        so other services can verify tokens without calling this API
+        ---
+        tags:
+          - auth
+        responses:
+          '200':
+            description: JSON Web Key Set
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    keys:
+                      type: array
+                      items:
+                        type: object
+                example:
+                  $ref: '#/components/examples/jwks_success'
+        """
+
+        response = jsonify(keyset.jwks())
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config.get("JWKS_MAX_AGE", 300)
+
+        return response
@@ -5,6 +5,19 @@ from flask import Flask
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from api.utils.bloom import RevokedTokenFilter
+from api.utils.cache import TTLCache
+from api.utils.hashers import PasswordHashers
+from api.utils.hash_pool import HashingPool
+from api.utils.jwks import KeySet
+from api.utils.mail import EmailOutbox, create_transport
+from api.utils.metrics import register_metrics
+from api.utils.roles import RoleRegistry
+from api.utils.throttle import LoginThrottle
+from api.utils.write_behind import WriteBehindBuffer
+from api.utils import token
 
 
 logging.basicConfig()
@@ -13,6 +26,25 @@ logging.root.setLevel(getattr(logging, os.getenv("LOG_LEVEL", "INFO")))
 db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
+keyset = KeySet()
+user_cache = TTLCache(name="user_lookup")
+revoked_token_filter = RevokedTokenFilter()
+revoked_family_cache = TTLCache(maxsize=10000, ttl=3600, name="revoked_token_families")
+login_writes = WriteBehindBuffer(name="login_writes")
+password_hashers = PasswordHashers()
+hashing_pool = HashingPool()
+login_throttle = LoginThrottle()
+role_registry = RoleRegistry()
+email_outbox = EmailOutbox()
+register_metrics("user_cache", user_cache.stats)
+register_metrics("revoked_token_filter", revoked_token_filter.stats)
+register_metrics("token_decode_cache", token.decode_cache.stats)
+register_metrics("revoked_family_cache", revoked_family_cache.stats)
+register_metrics("login_writes", login_writes.stats)
+register_metrics("password_hashing", hashing_pool.stats)
+register_metrics("login_throttle", login_throttle.stats)
+register_metrics("role_registry", role_registry.stats)
+register_metrics("email_outbox", email_outbox.stats)
 
 
 def create_app(config_name, name="Main"):
@@ -25,6 +57,10 @@ def create_app(config_name, name="Main"):
     # Load the configuration
     app.config.from_object(config_name)
 
+    # Client IPs (e.g. the per-IP login throttle) come from X-Forwarded-For behind a proxy
+    if app.config.get("PROXY_FIX_X_FOR", 0) > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
+
     # Logging Configurations without showing Database Password or secret key
     app_config = dict(app.config)
     app_config.update({
@@ -37,5 +73,75 @@ def create_app(config_name, name="Main"):
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
+    keyset.init_app(app, jwt)
+    user_cache.configure(
+        maxsize=app.config.get("USER_CACHE_MAXSIZE", 10000),
+        ttl=app.config.get("USER_CACHE_TTL", 60),
+        validate_interval=app.config.get("USER_CACHE_VALIDATE_INTERVAL", 5)
+    )
+    password_hashers.configure(
+        algorithm=app.config.get("PASSWORD_HASHER", "pbkdf2"),
+        pbkdf2_iterations=app.config.get("PASSWORD_PBKDF2_ITERATIONS"),
+        scrypt_n=app.config.get("PASSWORD_SCRYPT_N"),
+        scrypt_r=app.config.get("PASSWORD_SCRYPT_R"),
+        scrypt_p=app.config.get("PASSWORD_SCRYPT_P"),
+        argon2_time_cost=app.config.get("PASSWORD_ARGON2_TIME_COST"),
+        argon2_memory_cost=app.config.get("PASSWORD_ARGON2_MEMORY_COST"),
+        argon2_parallelism=app.config.get("PASSWORD_ARGON2_PARALLELISM")
+    )
+    hashing_pool.configure(
+        workers=app.config.get("PASSWORD_HASHING_WORKERS", 0),
+        max_queue=app.config.get("PASSWORD_HASHING_MAX_QUEUE", 64),
+        timeout=app.config.get("PASSWORD_HASHING_TIMEOUT", 30),
+        retry_after=app.config.get("PASSWORD_HASHING_RETRY_AFTER", 1)
+    )
+    login_throttle.configure(
+        enabled=app.config.get("LOGIN_THROTTLE_ENABLED", True),
+        max_failures=app.config.get("LOGIN_THROTTLE_MAX_FAILURES", 5),
+        ip_max_failures=app.config.get("LOGIN_THROTTLE_IP_MAX_FAILURES", 50),
+        window=app.config.get("LOGIN_THROTTLE_WINDOW", 300),
+        lockout=app.config.get("LOGIN_THROTTLE_LOCKOUT", 60),
+        max_lockout=app.config.get("LOGIN_THROTTLE_MAX_LOCKOUT", 3600),
+        redis_url=app.config.get("LOGIN_THROTTLE_REDIS_URL")
+    )
+    login_writes.configure(
+        enabled=app.config.get("LOGIN_WRITE_BEHIND", False),
+        max_size=app.config.get("LOGIN_WRITE_BEHIND_MAX_SIZE", 500)
+    )
+    role_registry.configure(
+        refresh_interval=app.config.get("ROLE_REGISTRY_REFRESH", 300)
+    )
+    email_outbox.configure(
+        transport=create_transport(
+            app.config.get("MAIL_TRANSPORT", "console"),
+            host=app.config.get("MAIL_SERVER", "localhost"),
+            port=app.config.get("MAIL_PORT", 25),
+            username=app.config.get("MAIL_USERNAME"),
+            password=app.config.get("MAIL_PASSWORD"),
+            use_tls=app.config.get("MAIL_USE_TLS", False),
+            use_ssl=app.config.get("MAIL_USE_SSL", False),
+            timeout=app.config.get("MAIL_TIMEOUT", 10),
+            pool_size=app.config.get("MAIL_POOL_SIZE", 2),
+            max_idle=app.config.get("MAIL_POOL_MAX_IDLE", 60),
+            max_messages=app.config.get("MAIL_POOL_MAX_MESSAGES", 100)
+        ),
+        sender=app.config.get("MAIL_DEFAULT_SENDER", "no-reply@localhost"),
+        batch_size=app.config.get("MAIL_OUTBOX_BATCH_SIZE", 50),
+        max_attempts=app.config.get("MAIL_OUTBOX_MAX_ATTEMPTS", 8),
+        backoff=app.config.get("MAIL_OUTBOX_BACKOFF", 30),
+        max_backoff=app.config.get("MAIL_OUTBOX_MAX_BACKOFF", 3600)
+    )
+    token.decode_cache.configure(
+        maxsize=app.config.get("TOKEN_DECODE_CACHE_MAXSIZE", 4096),
+        ttl=app.config.get("TOKEN_DECODE_CACHE_TTL", 300)
+    )
+    token.negative_ttl = app.config.get("TOKEN_DECODE_CACHE_NEGATIVE_TTL", 30)
+    revoked_token_filter.configure(
+        enabled=app.config.get("TOKEN_BLOCKLIST_FILTER_ENABLED", True),
+        capacity=app.config.get("TOKEN_BLOCKLIST_FILTER_CAPACITY", 100000),
+        error_rate=app.config.get("TOKEN_BLOCKLIST_FILTER_ERROR_RATE", 0.001),
+        max_bytes=app.config.get("TOKEN_BLOCKLIST_FILTER_MAX_BYTES", 1024 * 1024),
+        refresh_interval=app.config.get("TOKEN_BLOCKLIST_FILTER_REFRESH", 60)
+    )
 
     return app
@@ -36,4 +36,120 @@ spec_parameters = {
             "type": "string"
         }
     },
+    "limit": {
+        "name": "limit",
+        "in": "query",
+        "description": "number of items per page, 1 to 200",
+        "required": 'false',
+        "schema": {
+            "type": "integer",
+            "default": 50
+        }
+    },
+    "is_email_confirmed": {
+        "name": "is_email_confirmed",
+        "in": "query",
+        "description": "only users who have (true) or have not (false) confirmed their email",
+        "required": 'false',
+        "schema": {
+            "type": "boolean"
+        }
+    },
+    "role": {
+        "name": "role",
+        "in": "query",
+        "description": "only members of the role with this name",
+        "required": 'false',
+        "schema": {
+            "type": "string"
+        }
+    },
+    "created_after": {
+        "name": "created_after",
+        "in": "query",
+        "description": "only users created after this ISO 8601 date and time, UTC unless an offset is given",
+        "required": 'false',
+        "schema": {
+            "type": "string",
+            "format": "date-time"
+        }
+    },
+    "created_before": {
+        "name": "created_before",
+        "in": "query",
+        "description": "only users created before this ISO 8601 date and time, UTC unless an offset is given",
+        "required": 'false',
+        "schema": {
+            "type": "string",
+            "format": "date-time"
+        }
+    },
+    "username": {
+        "name": "username",
+        "in": "query",
+        "description": "only users whose username starts with this prefix",
+        "required": 'false',
+        "schema": {
+            "type": "string"
+        }
+    },
+    "order_by": {
+        "name": "order_by",
+        "in": "query",
+        "description": "sort order, prefix with `-` to reverse it",
+        "required": 'false',
+        "schema": {
+            "type": "string",
+            "enum": ["date_created", "-date_created", "username", "-username"],
+            "default": "date_created"
+        }
+    },
+    "export_format": {
+        "name": "format",
+        "in": "query",
+        "description": "`jsonl` (JSON Lines, one user per line) or `csv`",
+        "required": 'false',
+        "schema": {
+            "type": "string",
+            "enum": ["jsonl", "csv"],
+            "default": "jsonl"
+        }
+    },
+    "if_none_match": {
+        "name": "If-None-Match",
+        "in": "header",
+        "description": "ETag of a previous response; a 304 without a body is returned if it is still current",
+        "required": 'false',
+        "schema": {
+            "type": "string"
+        }
+    },
+    "fields": {
+        "name": "fields",
+        "in": "query",
+        "description": "comma separated fields to return, e.g. `id,username`; "
+                       "nested relations are left out unless also given in `include`",
+        "required": 'false',
+        "schema": {
+            "type": "string"
+        }
+    },
+    "include": {
+        "name": "include",
+        "in": "query",
+        "description": "comma separated nested relations to return, e.g. `roles,accounts`",
+        "required": 'false',
+        "schema": {
+            "type": "string"
+        }
+    },
+    "cursor": {
+        "name": "cursor",
+        "in": "query",
+        "description": "`next` cursor returned with the previous page",
+        "required": 'false',
+        "schema": {
+            "type": "string"
+        }
+    },
 }
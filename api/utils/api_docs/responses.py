@@ -81,6 +81,16 @@ spec_responses = {
             }
         }
     },
+    "NotModified": {
+        "description": "Not modified, the ETag sent in If-None-Match is still current. The body is empty.",
+        "headers": {
+            "ETag": {
+                "schema": {
+                    "type": "string"
+                }
+            }
+        }
+    },
     "GeneralError": {
         "description": "General Error",
         "content": {
@@ -0,0 +1,482 @@
+import datetime as dt
+import uuid
+
+from flask import current_app
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+
+from api.utils import db, user_cache, revoked_token_filter, revoked_family_cache, role_registry
+from api.models import User, Role, TokenBlocklist, TokenFamily, user_role
+
+
+def load_user(identity):
+    """
+    Resolve the user behind a JWT `sub` claim, serving repeated lookups
+    from the in-process user cache. Cached column values are merged back
+    into the current session without a query so the returned user can be
+    modified and committed like any other loaded instance.
+    :param identity:
+    :Returns: User or None
+    """
+
+    return load_users([identity]).get(identity)
+
+
+def load_users(identities):
+    """
+    Batch form of `load_user`: cached users are merged without a query and
+    the rest are fetched with a single `IN (...)` query.
+    :param identities:
+    :Returns: dict of identity to User for the users that exist
+    """
+
+    if user_cache.needs_validation():
+        validate_cached_users()
+
+    users = {}
+    missing = []
+    for identity in set(identities):
+        values = user_cache.get(identity)
+        if values is None:
+            missing.append(identity)
+            continue
+
+        user = User(**values)
+        make_transient_to_detached(user)
+        users[identity] = db.session.merge(user, load=False)
+
+    if missing:
+        for user in User.query.filter(User.uuid.in_(missing)):
+            user_cache.set(user.uuid, {
+                attr.key: getattr(user, attr.key)
+                for attr in inspect(User).column_attrs
+            })
+            users[user.uuid] = user
+
+    return users
+
+
+def validate_cached_users(batch_size=1000):
+    """
+    Evict cached users that were deleted or modified since they were cached.
+    Writes only evict the cache of the worker making them, so every worker
+    runs this each USER_CACHE_VALIDATE_INTERVAL seconds, with one query per
+    `batch_size` cached users.
+    :param batch_size:
+    :Returns: number of evicted users
+    """
+
+    cached = user_cache.items()
+    evicted = 0
+    for start in range(0, len(cached), batch_size):
+        batch = cached[start:start + batch_size]
+        current = dict(
+            db.session.query(User.uuid, User.date_modified).filter(
+                User.uuid.in_([user_id for user_id, _ in batch])
+            )
+        )
+        for user_id, values in batch:
+            if user_id not in current or current[user_id] != values["date_modified"]:
+                user_cache.pop(user_id)
+                evicted += 1
+
+    return evicted
+
+
+def role_claims(user):
+    """
+    Additional access token claims carrying the user's role names and the
+    roles version they were read at, when JWT_ROLE_CLAIMS is enabled.
+    :param user:
+    :Returns: dict
+    """
+
+    if not current_app.config.get("JWT_ROLE_CLAIMS", False):
+        return {}
+
+    return {
+        "roles": user_role_names_from_db(user),
+        "roles_version": user.roles_version or 0,
+    }
+
+
+def user_role_names(user, jwt_data):
+    """
+    Role names to authorize `user` with. Served from the token claims while
+    they match the user's current roles version, otherwise from the database
+    (tokens issued before role claims were enabled, or after a role change).
+    The roles version is read from the database, not the user cache, so a
+    role change made on another worker takes effect on the next request.
+    :param user, jwt_data:
+    :Returns: list of role names
+    """
+
+    if "roles" in jwt_data:
+        roles = claimed_role_names(jwt_data, users_roles_version([user.uuid]).get(user.uuid))
+        if roles is not None:
+            return roles
+
+    return user_role_names_from_db(user)
+
+
+def claimed_role_names(jwt_data, roles_version):
+    """
+    :param jwt_data, roles_version: the user's current roles version
+    :Returns: role names from the token claims, None if they are missing or stale
+    """
+
+    if "roles" in jwt_data and jwt_data.get("roles_version") == (roles_version or 0):
+        return jwt_data["roles"]
+
+    return None
+
+
+def users_roles_version(user_ids):
+    """
+    Current roles versions of users, read with a single `IN (...)` query
+    :param user_ids:
+    :Returns: dict of user uuid to roles version
+    """
+
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+
+    return dict(
+        db.session.query(User.uuid, User.roles_version).filter(User.uuid.in_(user_ids))
+    )
+
+
+def user_role_names_from_db(user):
+    """
+    Role names of `user`, reading only its role uuids from the user_role
+    table and resolving them through the role registry
+    :param user:
+    :Returns: list of role names
+    """
+
+    return users_role_names_from_db([user.uuid])[user.uuid]
+
+
+def users_role_names_from_db(user_ids):
+    """
+    Batch form of `user_role_names_from_db`, with a single `IN (...)` query
+    :param user_ids:
+    :Returns: dict of user uuid to list of role names
+    """
+
+    role_ids = {user_id: [] for user_id in user_ids}
+    if not role_ids:
+        return {}
+
+    rows = db.session.query(user_role.c.user_id, user_role.c.role_id).filter(
+        user_role.c.user_id.in_(role_ids)
+    )
+    for user_id, role_id in rows:
+        role_ids[user_id].append(role_id)
+
+    return {user_id: role_registry.names(ids) for user_id, ids in role_ids.items()}
+
+
+def get_or_create_role(name):
+    """
+    Uuid of the role called `name`, from the role registry. A missing role
+    is created in a savepoint of the current transaction; if another worker
+    creates it first, its uuid is used instead.
+    :param name:
+    :Returns: role uuid
+    """
+
+    role_id = role_registry.get(name)
+    if role_id is not None:
+        return role_id
+
+    role = Role(name=name)
+    try:
+        with db.session.begin_nested():
+            db.session.add(role)
+    except IntegrityError:
+        role_registry.invalidate()
+        return role_registry.get(name)
+
+    return role.uuid
+
+
+def rebuild_revoked_token_filter():
+    """
+    Reload the revoked token prefilter from the blocklist table
+    :Returns: None
+    """
+
+    if not revoked_token_filter.start_rebuild():
+        return
+
+    # Expired tokens are rejected before the blocklist is consulted
+    live = db.session.query(TokenBlocklist.jti).filter(
+        TokenBlocklist.expires_at > dt.datetime.utcnow()
+    )
+
+    try:
+        count = live.count()
+    except Exception:
+        revoked_token_filter.cancel_rebuild()
+        raise
+
+    jtis = live.yield_per(1000)
+    revoked_token_filter.finish_rebuild((jti for jti, in jtis), count=count)
+
+
+def is_token_revoked(jti):
+    """
+    Check the blocklist for a token `jti`. The database is only queried
+    when the in-memory prefilter reports a possible match.
+    :param jti:
+    :Returns: bool
+    """
+
+    return jti in revoked_jtis([jti])
+
+
+def revoked_jtis(jtis):
+    """
+    Batch form of `is_token_revoked`: jtis the prefilter cannot rule out
+    are resolved with a single `IN (...)` query.
+    :param jtis:
+    :Returns: set of the revoked jtis
+    """
+
+    candidates = set(jtis)
+    if revoked_token_filter.enabled:
+        if revoked_token_filter.is_stale():
+            rebuild_revoked_token_filter()
+
+        candidates = {jti for jti in candidates if revoked_token_filter.might_contain(jti)}
+
+    if not candidates:
+        return set()
+
+    revoked = {
+        jti for jti, in db.session.query(TokenBlocklist.jti).filter(
+            TokenBlocklist.jti.in_(candidates)
+        )
+    }
+    if revoked_token_filter.enabled:
+        revoked_token_filter.false_positives += len(candidates - revoked)
+
+    return revoked
+
+
+def retired_refresh_jtis(claims):
+    """
+    Refresh tokens that can no longer be exchanged because their family
+    was revoked or purged, or a newer token of the family was issued,
+    with a single `IN (...)` query
+    :param claims: decoded refresh tokens with a `fam` claim
+    :Returns: set of the retired jtis
+    """
+
+    claims = list(claims)
+    if not claims:
+        return set()
+
+    families = dict(
+        db.session.query(TokenFamily.id, TokenFamily.current_jti).filter(
+            TokenFamily.id.in_({jwt_data["fam"] for jwt_data in claims}),
+            TokenFamily.revoked.is_(False)
+        )
+    )
+
+    return {
+        jwt_data["jti"] for jwt_data in claims if families.get(jwt_data["fam"]) != jwt_data["jti"]
+    }
+
+
+def introspected_role_names(claims, users):
+    """
+    Role names of a batch of tokens' users. Role claims are checked against
+    roles versions read from the database; tokens without current claims
+    (refresh tokens, or access tokens issued before a role change) share
+    one user_role query.
+    :param claims, users: decoded tokens and their users by uuid
+    :Returns: dict of jti to list of role names, for tokens whose user exists
+    """
+
+    claims = [jwt_data for jwt_data in claims if jwt_data["sub"] in users]
+    versions = users_roles_version(jwt_data["sub"] for jwt_data in claims if "roles" in jwt_data)
+    claimed = {
+        jwt_data["jti"]: claimed_role_names(jwt_data, versions.get(jwt_data["sub"]))
+        for jwt_data in claims
+    }
+    db_roles = users_role_names_from_db(
+        {jwt_data["sub"] for jwt_data in claims if claimed[jwt_data["jti"]] is None}
+    )
+
+    return {
+        jwt_data["jti"]: db_roles.get(jwt_data["sub"], claimed[jwt_data["jti"]]) for jwt_data in claims
+    }
+
+
+def introspect_tokens(encoded_tokens):
+    """
+    Verify a batch of tokens the way a protected endpoint would: signature
+    and expiry, the blocklist, refresh token families and the user lookup,
+    with one query of each for the whole batch.
+    :param encoded_tokens:
+    :Returns: list of results in the order of `encoded_tokens`
+    """
+
+    decoded = []
+    for encoded_token in encoded_tokens:
+        try:
+            decoded.append(decode_token(encoded_token))
+        except (PyJWTError, JWTExtendedException) as error:
+            decoded.append(str(error))
+
+    claims = [jwt_data for jwt_data in decoded if isinstance(jwt_data, dict)]
+    revoked = revoked_jtis(jwt_data["jti"] for jwt_data in claims)
+    revoked |= retired_refresh_jtis(
+        jwt_data for jwt_data in claims if jwt_data["type"] == "refresh" and "fam" in jwt_data
+    )
+    users = load_users(
+        jwt_data["sub"] for jwt_data in claims if jwt_data["jti"] not in revoked
+    )
+
+    roles = introspected_role_names(claims, users)
+
+    results = []
+    for jwt_data in decoded:
+        if not isinstance(jwt_data, dict):
+            results.append({"active": False, "error": jwt_data})
+            continue
+
+        user = users.get(jwt_data["sub"])
+        if jwt_data["jti"] in revoked:
+            results.append({"active": False, "error": "Token has been revoked"})
+        elif user is None:
+            results.append({"active": False, "error": "User not found"})
+        else:
+            results.append({
+                "active": True,
+                "sub": jwt_data["sub"],
+                "jti": jwt_data["jti"],
+                "token_type": jwt_data["type"],
+                "fresh": jwt_data.get("fresh", False),
+                "iat": jwt_data["iat"],
+                "exp": jwt_data["exp"],
+                "username": user.username,
+                "roles": roles[jwt_data["jti"]],
+            })
+
+    return results
+
+
+def start_token_family(user):
+    """
+    Open a refresh token family for a new login
+    :param user:
+    :Returns: claims to issue the family's first refresh token with
+    """
+
+    now = dt.datetime.utcnow()
+    jti = str(uuid.uuid4())
+    family = TokenFamily(
+        user_id=user.uuid,
+        current_jti=jti,
+        created_at=now,
+        expires_at=now + current_app.config["JWT_REFRESH_TOKEN_EXPIRES"],
+    )
+    db.session.add(family)
+    db.session.flush()
+
+    return {"jti": jti, "fam": family.id}
+
+
+def rotate_token_family(family_id, jti):
+    """
+    Advance a family to a new refresh token in one compare-and-swap update.
+    The swap only succeeds when `jti` is still the family's current token;
+    anything else means an older token was replayed, so the whole family
+    is revoked.
+    :param family_id, jti: `fam` and `jti` claims of the presented token
+    :Returns: claims for the next refresh token, or None if refused
+    """
+
+    if revoked_family_cache.get(family_id):
+        return None
+
+    now = dt.datetime.utcnow()
+    next_jti = str(uuid.uuid4())
+    rotated = TokenFamily.query.filter(
+        TokenFamily.id == family_id,
+        TokenFamily.current_jti == jti,
+        TokenFamily.revoked.is_(False),
+        TokenFamily.expires_at > now,
+    ).update({
+        TokenFamily.current_jti: next_jti,
+        TokenFamily.expires_at: now + current_app.config["JWT_REFRESH_TOKEN_EXPIRES"],
+    }, synchronize_session=False)
+
+    if not rotated:
+        revoke_token_family(family_id)
+        return None
+
+    db.session.commit()
+    return {"jti": next_jti, "fam": family_id}
+
+
+def revoke_token_family(family_id):
+    """
+    Revoke every refresh token descending from the same login
+    :param family_id:
+    :Returns: None
+    """
+
+    TokenFamily.query.filter_by(id=family_id).update(
+        {TokenFamily.revoked: True}, synchronize_session=False
+    )
+    db.session.commit()
+    revoked_family_cache.set(family_id, True)
+
+
+def purge_expired_tokens(batch_size=1000):
+    """
+    Delete blocklist rows whose token has expired, `batch_size` rows per
+    transaction so the purge never holds long locks on the table.
+    :param batch_size=1000:
+    :Returns: number of rows deleted
+    """
+
+    return _purge_expired(TokenBlocklist, batch_size)
+
+
+def purge_expired_token_families(batch_size=1000):
+    """
+    Delete refresh token families whose newest token has expired
+    :param batch_size=1000:
+    :Returns: number of rows deleted
+    """
+
+    return _purge_expired(TokenFamily, batch_size)
+
+
+def _purge_expired(model, batch_size):
+    now = dt.datetime.utcnow()
+    total = 0
+
+    while True:
+        expired = db.session.query(model.id).filter(
+            model.expires_at <= now
+        ).limit(batch_size).subquery()
+
+        deleted = model.query.filter(
+            model.id.in_(db.session.query(expired.c.id))
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+        total += deleted
+        if deleted < batch_size:
+            return total
@@ -0,0 +1,179 @@
+import hashlib
+import math
+import threading
+import time
+
+
+class BloomFilter(object):
+    """
+    Fixed size Bloom filter over strings.
+    Sized from the expected number of items and the target false-positive
+    rate, but never larger than `max_bytes`.
+    """
+
+    def __init__(self, capacity, error_rate=0.001, max_bytes=1024 * 1024):
+        capacity = max(int(capacity), 1)
+        bits = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.num_bits = max(min(bits, int(max_bytes) * 8), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    @property
+    def size_bytes(self):
+        return len(self._bits)
+
+    @property
+    def expected_error_rate(self):
+        """ False-positive rate for the number of items added so far """
+
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class RevokedTokenFilter(object):
+    """
+    Per-worker prefilter of revoked token `jti`s.
+    A negative answer is definite, so the database is only consulted when
+    the filter reports a possible match. The filter is rebuilt from the
+    database every `refresh_interval` seconds to pick up revocations made
+    by other workers; jtis added locally since the last rebuild started are
+    carried over so a concurrent rebuild never drops them.
+    """
+
+    def __init__(self, name="revoked_tokens"):
+        self.name = name
+        self.enabled = True
+        self.capacity = 100000
+        self.error_rate = 0.001
+        self.max_bytes = 1024 * 1024
+        self.refresh_interval = 60
+        self._bloom = None
+        self._built_at = None
+        self._rebuilding = False
+        self._recent = {}
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.checks = 0
+        self.filtered = 0
+        self.false_positives = 0
+
+    def configure(self, enabled=None, capacity=None, error_rate=None, max_bytes=None,
+                  refresh_interval=None):
+        if enabled is not None:
+            self.enabled = enabled
+        if capacity is not None:
+            self.capacity = capacity
+        if error_rate is not None:
+            self.error_rate = error_rate
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if refresh_interval is not None:
+            self.refresh_interval = refresh_interval
+
+        with self._lock:
+            self._bloom = None
+            self._built_at = None
+
+    def is_stale(self):
+        built_at = self._built_at
+        return built_at is None or time.monotonic() - built_at >= self.refresh_interval
+
+    def start_rebuild(self):
+        """
+        Claim the rebuild so only one thread per worker reloads the filter
+        :Returns: True if the caller should rebuild
+        """
+
+        with self._lock:
+            if self._rebuilding:
+                return False
+            self._rebuilding = True
+            return True
+
+    def cancel_rebuild(self):
+        with self._lock:
+            self._rebuilding = False
+
+    def finish_rebuild(self, jtis, count=0):
+        """
+        Swap in a new filter built from `jtis`
+        :param jtis, count=0: iterable of revoked jtis and its expected length
+        :Returns: None
+        """
+
+        try:
+            bloom = BloomFilter(
+                max(self.capacity, count * 2), self.error_rate, self.max_bytes
+            )
+            for jti in jtis:
+                bloom.add(jti)
+        except Exception:
+            self.cancel_rebuild()
+            raise
+
+        with self._lock:
+            horizon = time.monotonic() - 2 * self.refresh_interval
+            self._recent = {
+                jti: added_at for jti, added_at in self._recent.items()
+                if added_at >= horizon
+            }
+            for jti in self._recent:
+                bloom.add(jti)
+
+            self._bloom = bloom
+            self._built_at = time.monotonic()
+            self._rebuilding = False
+            self.rebuilds += 1
+
+    def add(self, jti):
+        with self._lock:
+            self._recent[jti] = time.monotonic()
+            if self._bloom is not None:
+                self._bloom.add(jti)
+
+    def might_contain(self, jti):
+        """
+        :param jti:
+        :Returns: False only when the jti is definitely not revoked
+        """
+
+        bloom = self._bloom
+        self.checks += 1
+        if bloom is None or jti in bloom:
+            return True
+
+        self.filtered += 1
+        return False
+
+    def stats(self):
+        bloom = self._bloom
+        return {
+            "enabled": self.enabled,
+            "items": bloom.count if bloom else 0,
+            "size_bytes": bloom.size_bytes if bloom else 0,
+            "hashes": bloom.num_hashes if bloom else 0,
+            "expected_error_rate": round(bloom.expected_error_rate, 6) if bloom else 0.0,
+            "rebuilds": self.rebuilds,
+            "checks": self.checks,
+            "filtered": self.filtered,
+            "false_positives": self.false_positives,
+        }
@@ -0,0 +1,147 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """
+    Bounded, thread-safe in-process cache with a per-entry time to live
+    and least-recently-used eviction once `maxsize` entries are stored.
+    Keeps hit, miss, eviction and expiration counters for monitoring.
+    With `validate_interval` set, `needs_validation` tells one caller per
+    interval to check the cached entries against their source (0 never).
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, name="cache", validate_interval=0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.validate_interval = validate_interval
+        self._validated_at = time.monotonic()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.validations = 0
+
+    def configure(self, maxsize=None, ttl=None, validate_interval=None):
+        """
+        Resize the cache and/or change the default time to live.
+        :param maxsize=None, ttl=None, validate_interval=None:
+        :Returns: None
+        """
+
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if validate_interval is not None:
+                self.validate_interval = validate_interval
+            if maxsize is not None:
+                self.maxsize = maxsize
+                self._evict()
+
+    def get(self, key, default=None):
+        """
+        Fetch a live entry and mark it as most recently used.
+        :param key, default=None:
+        :Returns: cached value or default
+        """
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value, evicting the least recently used entries if full.
+        :param key, value, ttl=None: ttl in seconds, defaults to the cache ttl
+        :Returns: None
+        """
+
+        ttl = self.ttl if ttl is None else ttl
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            self._evict()
+
+    def pop(self, key):
+        """ Invalidate a single entry """
+
+        with self._lock:
+            entry = self._data.pop(key, None)
+
+        return entry[0] if entry is not None else None
+
+    def items(self):
+        """ :Returns: list of the live (key, value) pairs, without counting them as lookups """
+
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (value, expires_at) in self._data.items() if expires_at > now]
+
+    def needs_validation(self):
+        """
+        :Returns: True once per `validate_interval`, to the first caller after it elapses
+        """
+
+        if not self.validate_interval:
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._validated_at < self.validate_interval:
+                return False
+            self._validated_at = now
+            self.validations += 1
+            return True
+
+    def clear(self):
+        """ Invalidate every entry """
+
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """ Counters for monitoring """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "validate_interval": self.validate_interval,
+                "validations": self.validations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+    def _evict(self):
+        while len(self._data) > max(self.maxsize, 0):
+            self._data.popitem(last=False)
+            self.evictions += 1
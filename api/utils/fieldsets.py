@@ -0,0 +1,71 @@
+from marshmallow import ValidationError
+from sqlalchemy.orm import load_only
+
+
+def split_param(value):
+    """ :Returns: names in a comma separated query parameter, None if it is absent """
+
+    if value is None:
+        return None
+
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+class Fieldset(object):
+    """
+    The part of a schema a request asked for with `?fields=` (scalar
+    fields) and `?include=` (nested relations). Without either parameter
+    the whole schema is dumped; `?include=` alone adds relations to all
+    scalar fields, and `?fields=` alone drops every relation.
+    `relations` maps each nested field of the schema to the loader option
+    that reads it in bulk, or None when it needs no loader.
+    """
+
+    def __init__(self, schema_class, relations, args):
+        self.schema_class = schema_class
+        self.relations = relations
+        schema_fields = schema_class().dump_fields
+        self.columns = {
+            name: field.attribute or name
+            for name, field in schema_fields.items() if name not in relations
+        }
+
+        fields = split_param(args.get("fields"))
+        include = split_param(args.get("include"))
+        errors = {}
+        unknown = [name for name in fields or () if name not in self.columns]
+        if unknown:
+            errors["fields"] = [f"Unknown field(s): {', '.join(unknown)}."]
+        unknown = [name for name in include or () if name not in relations]
+        if unknown:
+            errors["include"] = [f"Unknown relation(s): {', '.join(unknown)}."]
+        if errors:
+            raise ValidationError(errors)
+
+        if fields is None and include is None:
+            include = list(relations)
+        self.fields = list(self.columns) if fields is None else fields
+        self.include = include or []
+
+    @property
+    def only(self):
+        return tuple(self.fields + self.include)
+
+    def schema(self, **kwargs):
+        return self.schema_class(only=self.only, **kwargs)
+
+    def options(self, model, *columns):
+        """
+        Loader options reading only the requested columns (plus `columns`,
+        e.g. a sort key) and the requested relations
+        :param model, *columns:
+        :Returns: list of loader options
+        """
+
+        attributes = [getattr(model, self.columns[name]) for name in self.fields]
+        options = [load_only(*attributes, *columns)]
+        options.extend(
+            self.relations[name] for name in self.include if self.relations[name] is not None
+        )
+
+        return options
@@ -0,0 +1,141 @@
+import collections
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from werkzeug.exceptions import ServiceUnavailable
+
+
+class HashingPool(object):
+    """
+    Runs password hashing off the request thread on a process pool so a
+    burst of logins cannot starve the worker's other requests.
+    At most `max_queue` hashes may be pending or running at once; past
+    that callers get a 503 with Retry-After instead of queueing. With
+    `workers` set to 0 hashes run inline, still bounded by `max_queue`.
+    """
+
+    def __init__(self, name="password_hashing"):
+        self.name = name
+        self.workers = 0
+        self.max_queue = 64
+        self.timeout = 30
+        self.retry_after = 1
+        self._executor = None
+        self._executor_pid = None
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=1000)
+        self.depth = 0
+        self.max_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def configure(self, workers=None, max_queue=None, timeout=None, retry_after=None):
+        if workers is not None:
+            self.workers = workers
+        if max_queue is not None:
+            self.max_queue = max_queue
+        if timeout is not None:
+            self.timeout = timeout
+        if retry_after is not None:
+            self.retry_after = retry_after
+
+        with self._lock:
+            self._slots = threading.BoundedSemaphore(max(self.max_queue, 0))
+            self._shutdown()
+
+    def _get_executor(self):
+        # Created lazily and per process, so pre-forking servers each get their own pool
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def shutdown(self):
+        with self._lock:
+            self._shutdown()
+
+    def _unavailable(self, message):
+        error = ServiceUnavailable(description=message, retry_after=self.retry_after)
+        error.data = {"status": 503, "message": message}
+        return error
+
+    def run(self, func, *args):
+        """
+        Call `func(*args)` on the pool and wait for its result
+        :param func, *args: picklable callable and arguments
+        :Returns: the result of func
+        :Raises: ServiceUnavailable when the pool is saturated or too slow
+        """
+
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self.rejected += 1
+            raise self._unavailable("Server is busy, try again shortly.")
+
+        with self._lock:
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+
+        started = time.perf_counter()
+        if self.workers <= 0:
+            try:
+                return func(*args)
+            finally:
+                self._release(slots, started)
+
+        try:
+            future = self._get_executor().submit(func, *args)
+            result = future.result(timeout=self.timeout)
+        except TimeoutError:
+            self.timeouts += 1
+            # The hash keeps running, so its slot is only freed once it
+            # finishes and max_queue still bounds the hashes in flight
+            future.add_done_callback(lambda future: self._release(slots, started))
+            raise self._unavailable("Server is busy, try again shortly.")
+        except BaseException:
+            self._release(slots, started)
+            raise
+
+        self._release(slots, started)
+        return result
+
+    def _release(self, slots, started):
+        self._latencies.append(time.perf_counter() - started)
+        with self._lock:
+            self.depth -= 1
+            self.completed += 1
+        slots.release()
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return 0.0
+            return round(latencies[int(fraction * (len(latencies) - 1))] * 1000, 2)
+
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+            "latency_max_ms": percentile(1),
+        }
@@ -0,0 +1,260 @@
+import copy
+import hashlib
+import hmac
+import multiprocessing
+import secrets
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+    import argon2
+except ImportError:  # pragma: no cover - optional dependency
+    argon2 = None
+
+
+class PBKDF2Hasher(object):
+    """ werkzeug's `pbkdf2:<digest>:<iterations>$<salt>$<hash>` format """
+
+    algorithm = "pbkdf2"
+    # Cost parameters to calibrate, cheapest first, and their config keys
+    grid = [{"iterations": iterations} for iterations in (
+        100000, 200000, 260000, 400000, 600000, 900000, 1200000
+    )]
+    settings = {"iterations": "PASSWORD_PBKDF2_ITERATIONS"}
+
+    def __init__(self, iterations=260000, digest="sha256"):
+        self.iterations = iterations
+        self.digest = digest
+
+    def encode(self, password):
+        return generate_password_hash(
+            password, method=f"pbkdf2:{self.digest}:{self.iterations}", salt_length=16
+        )
+
+    def verify(self, password, encoded):
+        # Also accepts any other hash format werkzeug produced in the past
+        return check_password_hash(encoded, password)
+
+    def needs_rehash(self, encoded):
+        method = encoded.split("$", 1)[0].split(":")
+        return method[1:] != [self.digest, str(self.iterations)]
+
+
+class ScryptHasher(object):
+    """ `scrypt:<n>:<r>:<p>$<salt>$<hash>` computed with hashlib """
+
+    algorithm = "scrypt"
+    grid = [{"n": 2 ** exponent, "r": 8, "p": 1} for exponent in range(13, 19)]
+    settings = {"n": "PASSWORD_SCRYPT_N", "r": "PASSWORD_SCRYPT_R", "p": "PASSWORD_SCRYPT_P"}
+
+    def __init__(self, n=2 ** 15, r=8, p=1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    @staticmethod
+    def _derive(password, salt, n, r, p):
+        return hashlib.scrypt(
+            password.encode("utf-8"), salt=salt.encode("utf-8"), n=n, r=r, p=p,
+            maxmem=256 * r * (n + p + 2), dklen=64
+        ).hex()
+
+    def encode(self, password):
+        salt = secrets.token_hex(16)
+        derived = self._derive(password, salt, self.n, self.r, self.p)
+        return f"scrypt:{self.n}:{self.r}:{self.p}${salt}${derived}"
+
+    def verify(self, password, encoded):
+        try:
+            method, salt, expected = encoded.split("$", 2)
+            n, r, p = (int(value) for value in method.split(":")[1:])
+        except ValueError:
+            return False
+
+        return hmac.compare_digest(self._derive(password, salt, n, r, p), expected)
+
+    def needs_rehash(self, encoded):
+        method = encoded.split("$", 1)[0]
+        return method != f"scrypt:{self.n}:{self.r}:{self.p}"
+
+
+class Argon2Hasher(object):
+    """ argon2id PHC strings, requires the `argon2-cffi` package """
+
+    algorithm = "argon2id"
+    grid = sorted(
+        (
+            {"time_cost": time_cost, "memory_cost": memory_cost}
+            for memory_cost in (19456, 47104, 65536, 131072)
+            for time_cost in (1, 2, 3, 4)
+        ),
+        key=lambda params: params["time_cost"] * params["memory_cost"]
+    )
+    settings = {
+        "time_cost": "PASSWORD_ARGON2_TIME_COST",
+        "memory_cost": "PASSWORD_ARGON2_MEMORY_COST",
+        "parallelism": "PASSWORD_ARGON2_PARALLELISM",
+    }
+
+    def __init__(self, time_cost=3, memory_cost=65536, parallelism=4):
+        self.time_cost = time_cost
+        self.memory_cost = memory_cost
+        self.parallelism = parallelism
+
+    @property
+    def _hasher(self):
+        if argon2 is None:
+            raise RuntimeError("argon2id password hashing requires the argon2-cffi package")
+
+        return argon2.PasswordHasher(
+            time_cost=self.time_cost, memory_cost=self.memory_cost,
+            parallelism=self.parallelism, type=argon2.Type.ID
+        )
+
+    def encode(self, password):
+        return self._hasher.hash(password)
+
+    def verify(self, password, encoded):
+        try:
+            return self._hasher.verify(encoded, password)
+        except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHash):
+            return False
+
+    def needs_rehash(self, encoded):
+        return self._hasher.check_needs_rehash(encoded)
+
+
+class PasswordHashers(object):
+    """
+    Registry of password hashers. New hashes use the configured
+    algorithm, while stored hashes are verified with the hasher named in
+    their own prefix, so the algorithm or its cost can change at any time
+    and old hashes are upgraded as users log in.
+    """
+
+    def __init__(self):
+        self.algorithm = PBKDF2Hasher.algorithm
+        self.hashers = {
+            hasher.algorithm: hasher
+            for hasher in (PBKDF2Hasher(), ScryptHasher(), Argon2Hasher())
+        }
+
+    def configure(self, algorithm=None, **params):
+        """
+        :param algorithm=None, **params: cost parameters keyed as
+            `<algorithm>_<attribute>`, e.g. `scrypt_n=2**16`
+        :Returns: None
+        """
+
+        if algorithm is not None:
+            if algorithm not in self.hashers:
+                raise ValueError(f"Unknown password hasher {algorithm}")
+            if algorithm == Argon2Hasher.algorithm and argon2 is None:
+                raise RuntimeError("argon2id password hashing requires the argon2-cffi package")
+            self.algorithm = algorithm
+
+        for key, value in params.items():
+            if value is None:
+                continue
+            name, attribute = key.split("_", 1)
+            algorithm_name = Argon2Hasher.algorithm if name == "argon2" else name
+            setattr(self.hashers[algorithm_name], attribute, value)
+
+    @property
+    def default(self):
+        return self.hashers[self.algorithm]
+
+    def identify(self, encoded):
+        """
+        Hasher that produced `encoded`. Hashes in an unknown format are
+        handed to the pbkdf2 hasher, which verifies every werkzeug format.
+        :param encoded:
+        :Returns: hasher
+        """
+
+        if encoded.startswith("$argon2"):
+            return self.hashers[Argon2Hasher.algorithm]
+
+        return self.hashers.get(encoded.split(":", 1)[0], self.hashers[PBKDF2Hasher.algorithm])
+
+    def hash(self, password):
+        return self.default.encode(password)
+
+    def verify(self, password, encoded):
+        return self.identify(encoded).verify(password, encoded)
+
+    def needs_rehash(self, encoded):
+        hasher = self.identify(encoded)
+        return hasher is not self.default or hasher.needs_rehash(encoded)
+
+
+def with_params(hasher, params):
+    """ Copy of `hasher` using the cost parameters in `params` """
+
+    candidate = copy.copy(hasher)
+    for key, value in params.items():
+        setattr(candidate, key, value)
+
+    return candidate
+
+
+def benchmark_hasher(hasher, samples=5):
+    """
+    Time `samples` hashes on the current thread
+    :param hasher, samples=5:
+    :Returns: median milliseconds per hash
+    """
+
+    hasher.encode("calibration-password")
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        hasher.encode("calibration-password")
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return statistics.median(timings)
+
+
+def benchmark_throughput(hasher, workers, hashes_per_worker=4):
+    """
+    Hashes per second with `workers` processes hashing concurrently
+    :param hasher, workers, hashes_per_worker=4:
+    :Returns: float
+    """
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        # Let every process start and import the hashers before timing
+        list(executor.map(hasher.encode, ["calibration-password"] * workers))
+
+        started = time.perf_counter()
+        list(executor.map(hasher.encode, ["calibration-password"] * workers * hashes_per_worker))
+        elapsed = time.perf_counter() - started
+
+    return workers * hashes_per_worker / elapsed
+
+
+def calibrate(hasher, target_ms, samples=5):
+    """
+    Benchmark the hasher's parameter grid, cheapest first, and pick the
+    most expensive parameters whose median latency fits `target_ms`
+    (or the cheapest when none does).
+    :param hasher, target_ms, samples=5:
+    :Returns: (list of (params, median ms), recommended params)
+    """
+
+    results = []
+    for params in hasher.grid:
+        median_ms = benchmark_hasher(with_params(hasher, params), samples=samples)
+        results.append((params, median_ms))
+        if median_ms > target_ms * 2:
+            # Every later entry costs more
+            break
+
+    fitting = [params for params, median_ms in results if median_ms <= target_ms]
+    recommended = fitting[-1] if fitting else results[0][0]
+
+    return results, recommended
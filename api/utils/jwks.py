@@ -0,0 +1,236 @@
+import fcntl
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from flask import current_app, g
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+from jwt.exceptions import InvalidTokenError
+
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "EdDSA")
+
+
+def generate_key(algorithm, folder):
+    """
+    Create a new signing key as `<kid>.pem` in `folder`.
+    The kid starts with the creation timestamp so every worker orders
+    and activates keys the same way without sharing any other state.
+    :param algorithm, folder:
+    :Returns: kid
+    """
+
+    if algorithm == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm == "EdDSA":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        raise ValueError(f"{algorithm} is not an asymmetric JWT algorithm")
+
+    os.makedirs(folder, exist_ok=True)
+    kid = f"{int(time.time())}-{secrets.token_hex(4)}"
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+    path = os.path.join(folder, f"{kid}.pem")
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as key_file:
+        key_file.write(pem)
+
+    return kid
+
+
+def key_created_at(kid):
+    return int(kid.split("-", 1)[0])
+
+
+class KeySet(object):
+    """
+    `kid`-tagged asymmetric signing keys kept as PEM files in a folder
+    shared by all workers.
+    The newest key is published in the JWKS as soon as it exists but only
+    signs once it is `activation_delay` seconds old, giving JWKS consumers
+    time to refresh their caches. Older keys keep verifying tokens until
+    they are pruned.
+    """
+
+    def __init__(self):
+        self.algorithm = "HS256"
+        self.folder = None
+        self.activation_delay = 600
+        self.rotation_interval = 30 * 24 * 3600
+        self.retention = 30 * 24 * 3600
+        self.reload_interval = 60
+        self._keys = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.algorithm in ASYMMETRIC_ALGORITHMS
+
+    def init_app(self, app, jwt):
+        self.algorithm = app.config.get("JWT_ALGORITHM", "HS256")
+        self.folder = app.config.get("JWT_KEYS_FOLDER")
+        self.activation_delay = app.config.get("JWT_KEY_ACTIVATION_DELAY", 600)
+        self.rotation_interval = app.config.get("JWT_KEY_ROTATION_INTERVAL", 30 * 24 * 3600)
+        self.reload_interval = app.config.get("JWT_KEYS_RELOAD_INTERVAL", 60)
+        self.retention = max(
+            app.config["JWT_ACCESS_TOKEN_EXPIRES"], app.config["JWT_REFRESH_TOKEN_EXPIRES"]
+        ).total_seconds()
+        self._keys = {}
+        self._loaded_at = None
+
+        jwt.encode_key_loader(self.encode_key)
+        jwt.additional_headers_loader(self.additional_headers)
+        jwt.decode_key_loader(self.decode_key)
+
+    def load(self):
+        """ (Re)read every key in the keys folder """
+
+        keys = {}
+        if self.folder and os.path.isdir(self.folder):
+            for file_name in os.listdir(self.folder):
+                if not file_name.endswith(".pem"):
+                    continue
+
+                kid = file_name[:-len(".pem")]
+                with open(os.path.join(self.folder, file_name), "rb") as key_file:
+                    private_key = serialization.load_pem_private_key(key_file.read(), password=None)
+                keys[kid] = private_key
+
+        with self._lock:
+            self._keys = keys
+            self._loaded_at = time.monotonic()
+
+    def keys(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.reload_interval:
+            self.load()
+
+        return self._keys
+
+    def signing_key(self):
+        """
+        Newest key that is old enough to sign with, or the oldest key when
+        none is yet (for instance right after the very first key was created).
+        :Returns: (kid, private key)
+        """
+
+        keys = self.keys()
+        if not keys:
+            raise RuntimeError(
+                f"No JWT signing keys found in {self.folder}. Run `flask jwt-keys rotate`."
+            )
+
+        now = time.time()
+        kids = sorted(keys, key=key_created_at, reverse=True)
+        active = [kid for kid in kids if now - key_created_at(kid) >= self.activation_delay]
+        kid = active[0] if active else kids[-1]
+
+        return kid, keys[kid]
+
+    def public_key(self, kid):
+        key = self.keys().get(kid)
+        if key is None and time.monotonic() - self._loaded_at >= 5:
+            # The key may have been rotated in by another worker since our last reload
+            self.load()
+            key = self._keys.get(kid)
+
+        return key.public_key() if key is not None else None
+
+    def jwks(self):
+        """ Public keys as a JSON Web Key Set """
+
+        if not self.enabled:
+            return {"keys": []}
+
+        to_jwk = RSAAlgorithm.to_jwk if self.algorithm == "RS256" else OKPAlgorithm.to_jwk
+        keys = []
+        for kid, private_key in sorted(self.keys().items(), key=lambda item: key_created_at(item[0])):
+            jwk = json.loads(to_jwk(private_key.public_key()))
+            jwk.update({"kid": kid, "use": "sig", "alg": self.algorithm})
+            keys.append(jwk)
+
+        return {"keys": keys}
+
+    def rotate(self, force=False):
+        """
+        Create a new key when the newest one is older than the rotation
+        interval and prune keys no token can still be signed with.
+        Serialized through a lock file so concurrent workers or cron runs
+        create a single key.
+        :param force=False: rotate regardless of the newest key's age
+        :Returns: kid of the new key or None
+        """
+
+        if not self.enabled:
+            return None
+
+        os.makedirs(self.folder, exist_ok=True)
+        with open(os.path.join(self.folder, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.load()
+                kids = sorted(self._keys, key=key_created_at)
+                kid = None
+                if force or not kids or time.time() - key_created_at(kids[-1]) >= self.rotation_interval:
+                    kid = generate_key(self.algorithm, self.folder)
+                    logging.info(f"JWT Keys: created signing key {kid}")
+                    kids.append(kid)
+
+                self._prune(kids)
+                self.load()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        return kid
+
+    def _prune(self, kids):
+        now = time.time()
+        for kid, successor in zip(kids, kids[1:]):
+            # `kid` stopped signing once its successor became active
+            retired_at = key_created_at(successor) + self.activation_delay
+            if now - retired_at > self.retention:
+                os.remove(os.path.join(self.folder, f"{kid}.pem"))
+                logging.info(f"JWT Keys: pruned signing key {kid}")
+
+    def _pinned_signing_key(self):
+        # Header and signature must use the same key even if a rotation
+        # lands between the two flask_jwt_extended callbacks
+        if "_jwt_signing_key" not in g:
+            g._jwt_signing_key = self.signing_key()
+
+        return g._jwt_signing_key
+
+    def encode_key(self, identity):
+        if not self.enabled:
+            return current_app.config["JWT_SECRET_KEY"]
+
+        return self._pinned_signing_key()[1]
+
+    def additional_headers(self, identity):
+        if not self.enabled:
+            return {}
+
+        return {"kid": self._pinned_signing_key()[0]}
+
+    def decode_key(self, jwt_header, jwt_payload):
+        kid = jwt_header.get("kid")
+        if kid is not None and self.enabled:
+            key = self.public_key(kid)
+            if key is None:
+                raise InvalidTokenError("Unknown signing key")
+            return key
+
+        if jwt_header.get("alg", "").startswith("HS"):
+            return current_app.config["JWT_SECRET_KEY"]
+
+        raise InvalidTokenError("Signing key id is missing")
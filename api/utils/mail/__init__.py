@@ -0,0 +1,5 @@
+# flake8: noqa
+
+from api.utils.mail.outbox import EmailOutbox
+from api.utils.mail.templates import MailTemplates
+from api.utils.mail.transport import ConsoleTransport, SMTPTransport, create_transport
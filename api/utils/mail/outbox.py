@@ -0,0 +1,192 @@
+import collections
+import datetime as dt
+import logging
+import smtplib
+import time
+from email.message import EmailMessage
+
+from api.utils.mail.templates import MailTemplates
+from api.utils.mail.transport import ConsoleTransport
+
+
+class EmailOutbox(object):
+    """
+    Transactional outbox for email. Views queue messages as rows in the
+    same transaction as the change they announce, so an email is sent if
+    and only if that change committed, and no request waits on SMTP.
+    `deliver` claims due rows with FOR UPDATE SKIP LOCKED, so any number
+    of workers can deliver concurrently, and failed deliveries are
+    retried with exponential backoff until `max_attempts`.
+    `model` is the outbox table's model and is set by the models;
+    `on_queued` is called after a transaction that queued mail commits.
+    Messages are rendered from the precompiled `templates`.
+    """
+
+    def __init__(self, name="email_outbox"):
+        self.name = name
+        self.model = None
+        self.transport = ConsoleTransport()
+        self.templates = MailTemplates()
+        self.sender = "no-reply@localhost"
+        self.batch_size = 50
+        self.max_attempts = 8
+        self.backoff = 30
+        self.max_backoff = 3600
+        self.on_queued = None
+        self.queued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self._latencies = collections.deque(maxlen=1000)
+
+    def configure(self, transport=None, sender=None, batch_size=None, max_attempts=None,
+                  backoff=None, max_backoff=None):
+        if transport is not None:
+            self.transport.close()
+            self.transport = transport
+        if sender is not None:
+            self.sender = sender
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if max_attempts is not None:
+            self.max_attempts = max_attempts
+        if backoff is not None:
+            self.backoff = backoff
+        if max_backoff is not None:
+            self.max_backoff = max_backoff
+
+    def queue(self, session, recipient, subject, body, subtype="plain"):
+        """
+        Add a message to `session`; it is delivered once the session commits
+        :param session, recipient, subject, body, subtype="plain": "html" for HTML bodies
+        :Returns: outbox row
+        """
+
+        message = self.model(recipient=recipient, subject=subject, body=body, subtype=subtype)
+        session.add(message)
+        session.info["email_queued"] = True
+        self.queued += 1
+
+        return message
+
+    def queue_template(self, session, recipient, name, **context):
+        """
+        Render the `name` template with `context` and queue it for `recipient`
+        :param session, recipient, name, **context:
+        :Returns: outbox row
+        """
+
+        subject, body, subtype = self.templates.render(name, **context)
+        return self.queue(session, recipient, subject, body, subtype=subtype)
+
+    def committed(self, session):
+        if session.info.pop("email_queued", False) and self.on_queued is not None:
+            self.on_queued()
+
+    def _build(self, row):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = row.recipient
+        message["Subject"] = row.subject
+        message.set_content(row.body, subtype=row.subtype)
+
+        return message
+
+    def _claim(self, session, now):
+        return session.query(self.model).filter(
+            self.model.status == "pending",
+            self.model.next_attempt_at <= now
+        ).order_by(
+            self.model.next_attempt_at
+        ).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+    def _failed(self, row, error, now):
+        row.attempts += 1
+        row.last_error = f"{error.__class__.__name__}: {error}"[:1000]
+
+        # A refused recipient will not be accepted on a later attempt either
+        if isinstance(error, smtplib.SMTPRecipientsRefused) or row.attempts >= self.max_attempts:
+            row.status = "failed"
+            self.failed += 1
+            logging.warning(f"Mail: giving up on message {row.id} to {row.recipient}: {row.last_error}")
+            return
+
+        delay = min(self.backoff * 2 ** (row.attempts - 1), self.max_backoff)
+        row.next_attempt_at = now + dt.timedelta(seconds=delay)
+        self.retried += 1
+
+    def deliver(self, session):
+        """
+        Deliver one batch of due messages over a single transport connection
+        :param session:
+        :Returns: number of messages claimed
+        """
+
+        now = dt.datetime.utcnow()
+        rows = self._claim(session, now)
+        if not rows:
+            session.rollback()
+            return 0
+
+        pending = list(rows)
+        try:
+            with self.transport.connection() as connection:
+                while pending:
+                    row = pending[0]
+                    started = time.perf_counter()
+                    try:
+                        connection.send_message(self._build(row))
+                    except smtplib.SMTPServerDisconnected:
+                        raise
+                    except (smtplib.SMTPException, ValueError) as error:
+                        self._failed(row, error, now)
+                    else:
+                        self._latencies.append(time.perf_counter() - started)
+                        row.status = "sent"
+                        row.sent_at = dt.datetime.utcnow()
+                        self.sent += 1
+                    pending.pop(0)
+        except (smtplib.SMTPException, OSError) as error:
+            # The connection failed: every message not yet handled is retried
+            for row in pending:
+                self._failed(row, error, now)
+
+        session.commit()
+        self.batches += 1
+
+        return len(rows)
+
+    def drain(self, session):
+        """
+        Deliver batches until no message is due
+        :param session:
+        :Returns: number of messages claimed
+        """
+
+        total = 0
+        while True:
+            count = self.deliver(session)
+            total += count
+            if count < self.batch_size:
+                return total
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return 0.0
+            return round(latencies[int(fraction * (len(latencies) - 1))] * 1000, 2)
+
+        return {
+            "transport": self.transport.stats(),
+            "queued": self.queued,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "batches": self.batches,
+            "send_latency_p50_ms": percentile(0.5),
+            "send_latency_p95_ms": percentile(0.95),
+            "send_latency_max_ms": percentile(1),
+        }
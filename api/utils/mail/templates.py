@@ -0,0 +1,42 @@
+import os
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+
+TEMPLATES_FOLDER = os.path.join(os.path.dirname(__file__), "templates")
+
+
+class MailTemplates(object):
+    """
+    Email templates compiled once when the worker starts, so rendering a
+    message in a request is a plain function call with no template
+    lookup, parsing or reload check. `templates` maps a message name to
+    its subject and template file; the file extension sets the subtype.
+    """
+
+    templates = {
+        "confirm_email": ("Confirm your email", "confirm_email.html"),
+        "confirm_new_email": ("Confirm your new email", "confirm_new_email.html"),
+        "reset_password": ("Reset your password", "reset_password.html"),
+    }
+
+    def __init__(self, folder=TEMPLATES_FOLDER):
+        self.environment = Environment(
+            loader=FileSystemLoader(folder),
+            autoescape=select_autoescape(["html"]),
+            undefined=StrictUndefined,
+            auto_reload=False,
+        )
+        self._compiled = {
+            name: (subject, self.environment.get_template(filename), filename.rsplit(".", 1)[-1])
+            for name, (subject, filename) in self.templates.items()
+        }
+
+    def render(self, name, **context):
+        """
+        :param name, **context:
+        :Returns: (subject, body, subtype)
+        """
+
+        subject, template, subtype = self._compiled[name]
+        return subject, template.render(**context), "plain" if subtype == "txt" else subtype
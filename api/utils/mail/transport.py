@@ -0,0 +1,221 @@
+import collections
+import contextlib
+import email.generator
+import email.utils
+import io
+import logging
+import re
+import smtplib
+import threading
+import time
+
+
+class ConsoleTransport(object):
+    """ Logs messages instead of sending them, for development """
+
+    name = "console"
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self
+
+    def send_message(self, message):
+        logging.info(
+            f"Mail: to {message['To']}, subject {message['Subject']!r}\n{message.get_content()}"
+        )
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"name": self.name}
+
+
+class SMTPConnection(object):
+    """
+    One open SMTP session. When the server advertises PIPELINING the
+    MAIL, RCPT and DATA commands of a message go out in a single write
+    and their replies are read afterwards, saving two round trips per
+    message; otherwise smtplib sends them one at a time.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.client.ehlo_or_helo_if_needed()
+        self.pipelining = self.client.has_extn("pipelining")
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def send_message(self, message):
+        if self.pipelining:
+            self._send_pipelined(message)
+        else:
+            self.client.send_message(message)
+        self.sent += 1
+        self.last_used = time.monotonic()
+
+    def _send_pipelined(self, message):
+        client = self.client
+        sender = email.utils.parseaddr(message["From"])[1]
+        recipients = [address for _, address in email.utils.getaddresses(message.get_all("To", []))]
+
+        buffer = io.BytesIO()
+        email.generator.BytesGenerator(buffer).flatten(message, linesep="\r\n")
+        data = re.sub(rb"(?m)^\.", b"..", buffer.getvalue())
+        if not data.endswith(b"\r\n"):
+            data += b"\r\n"
+
+        commands = [f"MAIL FROM:<{sender}>"] + [f"RCPT TO:<{address}>" for address in recipients]
+        client.send("".join(f"{command}\r\n" for command in commands + ["DATA"]))
+
+        sender_reply = client.getreply()
+        refused = {}
+        for address in recipients:
+            code, response = client.getreply()
+            if code not in (250, 251):
+                refused[address] = (code, response)
+        data_reply = client.getreply()
+
+        if data_reply[0] != 354:
+            client.rset()
+            if sender_reply[0] != 250:
+                raise smtplib.SMTPSenderRefused(*sender_reply, sender)
+            if refused:
+                raise smtplib.SMTPRecipientsRefused(refused)
+            raise smtplib.SMTPDataError(*data_reply)
+
+        client.send(data + b".\r\n")
+        code, response = client.getreply()
+        if code != 250:
+            client.rset()
+            raise smtplib.SMTPDataError(code, response)
+        if refused:
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+    def close(self):
+        try:
+            self.client.quit()
+        except (smtplib.SMTPException, OSError):
+            self.client.close()
+
+
+class SMTPTransport(object):
+    """
+    Delivers messages over a pool of up to `pool_size` persistent SMTP
+    connections, so batches after the first skip the connect, TLS and
+    login handshakes. A connection is closed once it sent `max_messages`
+    messages or sat idle for `max_idle` seconds, and one idle for more
+    than a few seconds is checked with NOOP before it is reused.
+    Any SMTP server works, including a local stand-in such as
+    `python -m aiosmtpd -n -l localhost:1025` or MailHog for testing.
+    """
+
+    name = "smtp"
+    check_after = 5
+
+    def __init__(self, host="localhost", port=25, username=None, password=None,
+                 use_tls=False, use_ssl=False, timeout=10, pool_size=2, max_idle=60,
+                 max_messages=100):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.max_idle = max_idle
+        self.max_messages = max_messages
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.reuses = 0
+
+    def _connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        client = smtp_class(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                client.starttls()
+            if self.username:
+                client.login(self.username, self.password)
+            connection = SMTPConnection(client)
+        except BaseException:
+            client.close()
+            raise
+
+        self.connects += 1
+        return connection
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection = self._idle.pop()
+
+            idle = time.monotonic() - connection.last_used
+            if idle > self.max_idle:
+                connection.close()
+                continue
+            if idle > self.check_after:
+                try:
+                    if connection.client.noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected("NOOP failed")
+                except (smtplib.SMTPException, OSError):
+                    connection.client.close()
+                    continue
+
+            self.reuses += 1
+            return connection
+
+        return self._connect()
+
+    def _checkin(self, connection):
+        with self._lock:
+            if connection.sent < self.max_messages and len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    @contextlib.contextmanager
+    def connection(self):
+        connection = self._checkout()
+        try:
+            yield connection
+        except (smtplib.SMTPServerDisconnected, OSError):
+            connection.client.close()
+            raise
+        except BaseException:
+            self._checkin(connection)
+            raise
+        self._checkin(connection)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, collections.deque()
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "pool_size": self.pool_size,
+            "idle_connections": len(self._idle),
+            "connects": self.connects,
+            "reuses": self.reuses,
+        }
+
+
+def create_transport(name, **options):
+    """
+    :param name, **options: "console" or "smtp" and the SMTPTransport options
+    :Returns: transport
+    """
+
+    if name == SMTPTransport.name:
+        return SMTPTransport(**options)
+    if name == ConsoleTransport.name:
+        return ConsoleTransport()
+
+    raise ValueError(f"Unknown mail transport {name}")
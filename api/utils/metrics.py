@@ -0,0 +1,20 @@
+_collectors = {}
+
+
+def register_metrics(name, collector):
+    """
+    Register a callable returning a dict of counters under `name`
+    :param name, collector:
+    :Returns: None
+    """
+
+    _collectors[name] = collector
+
+
+def collect_metrics():
+    """
+    Snapshot of all registered counters for this worker process
+    :Returns: dict
+    """
+
+    return {name: collector() for name, collector in _collectors.items()}
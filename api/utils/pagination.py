@@ -0,0 +1,69 @@
+import base64
+import datetime as dt
+import json
+
+from marshmallow import Schema, fields, validate, ValidationError
+from sqlalchemy import tuple_
+
+
+class KeysetPageSchema(Schema):
+    limit = fields.Integer(load_default=50, validate=validate.Range(min=1, max=200))
+    cursor = fields.String(load_default=None)
+
+
+def encode_cursor(values):
+    """
+    Opaque cursor for the sort key `values` of the last row of a page
+    :param values:
+    :Returns: str
+    """
+
+    data = json.dumps([
+        value.isoformat() if isinstance(value, dt.datetime) else value for value in values
+    ], separators=(",", ":"))
+
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, columns):
+    """
+    :param cursor, columns: columns the cursor was made for
+    :Returns: list of sort key values, Raise ValidationError for a malformed cursor
+    """
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [
+            dt.datetime.fromisoformat(value)
+            if column.type.python_type is dt.datetime else column.type.python_type(value)
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise ValidationError({"cursor": ["Invalid cursor."]})
+
+
+def keyset_page(query, columns, cursor=None, limit=50, descending=False):
+    """
+    One page of `query` ordered by `columns`, which must be unique together
+    and covered by an index, starting after `cursor`. Each page seeks
+    straight to its first row, so its cost does not grow with the offset,
+    and one extra row is fetched to tell whether another page follows
+    instead of counting the table. `descending` reverses every column,
+    which the same index serves by scanning backwards.
+    :param query, columns, cursor=None, limit=50, descending=False:
+    :Returns: (rows, cursor of the next page or None)
+    """
+
+    if cursor is not None:
+        key, after = tuple_(*columns), tuple_(*decode_cursor(cursor, columns))
+        query = query.filter(key < after if descending else key > after)
+
+    order = [column.desc() for column in columns] if descending else columns
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column in columns])
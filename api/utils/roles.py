@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+
+
+class RoleRegistry(object):
+    """
+    Process-wide map of role names to role uuids. The role set hardly ever
+    changes, so it is loaded once with a single query and served from
+    memory; roles written through the ORM invalidate it once their
+    transaction commits, and `refresh_interval` bounds how long other
+    workers may serve a stale copy (0 disables periodic reloads).
+    `loader` returns (name, uuid) pairs and is set by the models.
+    """
+
+    def __init__(self, name="roles"):
+        self.name = name
+        self.refresh_interval = 300
+        self.loader = None
+        self._roles = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def configure(self, refresh_interval=None):
+        if refresh_interval is not None:
+            self.refresh_interval = refresh_interval
+        self.invalidate()
+
+    def _stale(self):
+        if self._roles is None:
+            return True
+        return bool(self.refresh_interval) and time.monotonic() - self._loaded_at > self.refresh_interval
+
+    def load(self):
+        """
+        Replace the registry with the roles returned by `loader`
+        :Returns: dict of role name to uuid
+        """
+
+        roles = {name: uuid for name, uuid in self.loader()}
+        with self._lock:
+            self._roles = roles
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+        logging.debug(f"Role Registry: {self.name} loaded {len(roles)} role(s)")
+
+        return roles
+
+    def _get_roles(self):
+        roles = self._roles
+        if roles is None or self._stale():
+            return self.load()
+
+        self.hits += 1
+        return roles
+
+    def invalidate(self):
+        with self._lock:
+            self._roles = None
+
+    def get(self, name):
+        """ :Returns: uuid of the role called `name`, or None """
+
+        return self._get_roles().get(name)
+
+    def uuids(self, names):
+        """ :Returns: uuids of the known roles among `names` """
+
+        roles = self._get_roles()
+        return [roles[name] for name in names if name in roles]
+
+    def names(self, uuids):
+        """
+        Names of the roles in `uuids`. An unknown uuid is most likely a role
+        another worker just created, so it triggers one reload.
+        :param uuids:
+        :Returns: list of role names
+        """
+
+        roles = self._get_roles()
+        if not set(uuids) <= set(roles.values()):
+            roles = self.load()
+
+        by_uuid = {uuid: name for name, uuid in roles.items()}
+        return [by_uuid[uuid] for uuid in uuids if uuid in by_uuid]
+
+    def stats(self):
+        return {
+            "roles": len(self._roles or ()),
+            "refresh_interval": self.refresh_interval,
+            "hits": self.hits,
+            "loads": self.loads,
+        }
@@ -1,4 +1,5 @@
 from marshmallow import ValidationError
+from sqlalchemy import inspect, or_
 
 
 def validate_model_object_does_not_exist(
@@ -45,6 +46,38 @@ def validate_model_object_does_exist(
         raise ValidationError(error, field_name=field_name)
 
 
+def validate_unique_fields(Model, data, field_names, instance=None):
+    """
+    Check several unique fields for marshmallow schema validation in a single
+    `SELECT ... WHERE a = ? OR b = ?` query instead of one query per field
+    :param Model, data, field_names, instance=None: `instance` is the object
+        being updated, its own values are not conflicts
+    :Returns: None, Raise ValidationError with an error per taken field
+    """
+
+    values = {
+        name: data[name] for name in field_names if data.get(name) not in ["", None]
+    }
+    if not values:
+        return
+
+    query = Model.query.with_entities(*(getattr(Model, name) for name in values)).filter(
+        or_(*(getattr(Model, name) == value for name, value in values.items()))
+    )
+    if instance is not None:
+        for column in inspect(Model).primary_key:
+            query = query.filter(column != getattr(instance, column.key))
+
+    errors = {}
+    for row in query:
+        for name, value in values.items():
+            if getattr(row, name) == value:
+                errors[name] = [f"{name} already exist."]
+
+    if errors:
+        raise ValidationError(errors)
+
+
 def validate_phone_number(number, min_length=10, max_length=15):
     """
     Check if a kenyan phone number provided has a max length of 13 (with country code inclusion)
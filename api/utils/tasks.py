@@ -0,0 +1,60 @@
+import logging
+import threading
+
+from api.utils import db
+
+
+class PeriodicTask(object):
+    """
+    Run `func` inside an application context every `interval` seconds on a
+    daemon thread. Errors are logged and the task keeps its schedule.
+    """
+
+    def __init__(self, app, interval, func, name=None):
+        self.app = app
+        self.interval = interval
+        self.func = func
+        self.name = name or func.__name__
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return self
+
+        self._thread = threading.Thread(
+            target=self._run, name=f"periodic-{self.name}", daemon=True
+        )
+        self._thread.start()
+        logging.info(f"Periodic Task: started {self.name} every {self.interval}s")
+
+        return self
+
+    def trigger(self):
+        """ Run the task now instead of waiting for the next tick """
+
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                return self.func()
+            except Exception:
+                logging.exception(f"Periodic Task: {self.name} failed")
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            self.run_once()
@@ -0,0 +1,212 @@
+import collections
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+
+class MemoryThrottleBackend(object):
+    """
+    Per-worker sliding-window failure log and lockout state.
+    At most `maxsize` keys are tracked; the least recently used are dropped.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._failures = collections.OrderedDict()
+        self._locks = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, store):
+        while len(store) > self.maxsize:
+            store.popitem(last=False)
+
+    def add_failure(self, key, now, window):
+        """ :Returns: failures for `key` within the last `window` seconds """
+
+        with self._lock:
+            failures = self._failures.setdefault(key, collections.deque())
+            self._failures.move_to_end(key)
+            self._evict(self._failures)
+            failures.append(now)
+            while failures and failures[0] <= now - window:
+                failures.popleft()
+            return len(failures)
+
+    def clear_failures(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def get_lock(self, key):
+        """ :Returns: (locked until, strikes, strikes expire at) or None """
+
+        with self._lock:
+            return self._locks.get(key)
+
+    def set_lock(self, key, until, strikes, forget_at):
+        with self._lock:
+            self._locks[key] = (until, strikes, forget_at)
+            self._locks.move_to_end(key)
+            self._evict(self._locks)
+
+    def clear_lock(self, key):
+        with self._lock:
+            self._locks.pop(key, None)
+
+    def __len__(self):
+        return len(self._failures) + len(self._locks)
+
+
+class RedisThrottleBackend(object):
+    """ The same state kept in Redis so every worker shares it """
+
+    def __init__(self, url, prefix="login_throttle:"):
+        if redis is None:
+            raise RuntimeError("LOGIN_THROTTLE_REDIS_URL requires the redis package")
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def add_failure(self, key, now, window):
+        key = f"{self.prefix}failures:{key}"
+        pipe = self.client.pipeline()
+        pipe.zadd(key, {repr(now): now})
+        pipe.zremrangebyscore(key, "-inf", now - window)
+        pipe.zcard(key)
+        pipe.expire(key, int(window) + 1)
+        return pipe.execute()[2]
+
+    def clear_failures(self, key):
+        self.client.delete(f"{self.prefix}failures:{key}")
+
+    def get_lock(self, key):
+        value = self.client.get(f"{self.prefix}lock:{key}")
+        if value is None:
+            return None
+
+        until, strikes, forget_at = value.decode().split(":")
+        return float(until), int(strikes), float(forget_at)
+
+    def set_lock(self, key, until, strikes, forget_at):
+        self.client.set(
+            f"{self.prefix}lock:{key}", f"{until}:{strikes}:{forget_at}",
+            ex=max(int(forget_at - time.time()) + 1, 1)
+        )
+
+    def clear_lock(self, key):
+        self.client.delete(f"{self.prefix}lock:{key}")
+
+    def __len__(self):
+        return 0
+
+
+class LoginThrottle(object):
+    """
+    Sliding-window limit on failed logins per username and per client IP.
+    Reaching the limit locks the key out for `lockout` seconds, doubling
+    with every further lockout within `max_lockout` seconds of the last one
+    up to `max_lockout`. Checked before any password is hashed, so
+    credential stuffing cannot turn into CPU exhaustion.
+    """
+
+    def __init__(self, name="login_throttle"):
+        self.name = name
+        self.enabled = True
+        self.max_failures = 5
+        self.ip_max_failures = 50
+        self.window = 300
+        self.lockout = 60
+        self.max_lockout = 3600
+        self.backend = MemoryThrottleBackend()
+        self.checks = 0
+        self.blocked = 0
+        self.failures = 0
+        self.lockouts = 0
+
+    def configure(self, enabled=None, max_failures=None, ip_max_failures=None, window=None,
+                  lockout=None, max_lockout=None, redis_url=None):
+        if enabled is not None:
+            self.enabled = enabled
+        if max_failures is not None:
+            self.max_failures = max_failures
+        if ip_max_failures is not None:
+            self.ip_max_failures = ip_max_failures
+        if window is not None:
+            self.window = window
+        if lockout is not None:
+            self.lockout = lockout
+        if max_lockout is not None:
+            self.max_lockout = max_lockout
+
+        self.backend = RedisThrottleBackend(redis_url) if redis_url else MemoryThrottleBackend()
+
+    def _keys(self, username, ip):
+        keys = []
+        if username:
+            keys.append((f"user:{username}", self.max_failures))
+        if ip:
+            keys.append((f"ip:{ip}", self.ip_max_failures))
+        return keys
+
+    def check(self, username, ip):
+        """
+        :param username, ip:
+        :Returns: seconds until the next attempt is allowed, 0 if allowed now
+        """
+
+        if not self.enabled:
+            return 0
+
+        self.checks += 1
+        now = time.time()
+        retry_after = 0
+        for key, _ in self._keys(username, ip):
+            lock = self.backend.get_lock(key)
+            if lock is not None and lock[0] > now:
+                retry_after = max(retry_after, int(lock[0] - now) + 1)
+
+        if retry_after:
+            self.blocked += 1
+
+        return retry_after
+
+    def record_failure(self, username, ip):
+        if not self.enabled:
+            return
+
+        self.failures += 1
+        now = time.time()
+        for key, limit in self._keys(username, ip):
+            if self.backend.add_failure(key, now, self.window) < limit:
+                continue
+
+            lock = self.backend.get_lock(key)
+            strikes = lock[1] if lock is not None and lock[2] > now else 0
+            duration = min(self.lockout * 2 ** strikes, self.max_lockout)
+            self.backend.set_lock(key, now + duration, strikes + 1, now + duration + self.max_lockout)
+            self.backend.clear_failures(key)
+            self.lockouts += 1
+
+    def record_success(self, username, ip):
+        """ A successful login clears the username's failures, not the IP's """
+
+        if not self.enabled or not username:
+            return
+
+        key = f"user:{username}"
+        self.backend.clear_failures(key)
+        self.backend.clear_lock(key)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "backend": "redis" if isinstance(self.backend, RedisThrottleBackend) else "memory",
+            "tracked_keys": len(self.backend),
+            "checks": self.checks,
+            "blocked": self.blocked,
+            "failures": self.failures,
+            "lockouts": self.lockouts,
+        }
@@ -1,6 +1,15 @@
 import jwt
+import hashlib
+import time
 import datetime as dt
 
+from api.utils.cache import TTLCache
+
+
+# Memo of verified payloads keyed by a hash of the signing key and token
+decode_cache = TTLCache(maxsize=4096, ttl=300, name="token_decode")
+negative_ttl = 30
+
 
 def encode(data, key, expiration_seconds=3600):
     """
@@ -23,10 +32,29 @@ def encode(data, key, expiration_seconds=3600):
 
 def decode(token, key):
     """
-    Decodes the token
+    Decodes the token, serving repeated presentations of the same token
+    from a memo that never outlives the token's own expiry.
+    Invalid tokens are remembered for a short time too.
     :param token, key:
     :return: integer|string
     """
+    cache_key = hashlib.sha256(f"{key}.{token}".encode("utf-8")).hexdigest()
+
+    payload = decode_cache.get(cache_key)
+    if payload is None:
+        payload = _decode(token, key)
+        if 'error' in payload:
+            decode_cache.set(cache_key, payload, ttl=negative_ttl)
+        else:
+            ttl = decode_cache.ttl
+            if 'exp' in payload:
+                ttl = min(ttl, payload['exp'] - time.time())
+            decode_cache.set(cache_key, payload, ttl=ttl)
+
+    return dict(payload)
+
+
+def _decode(token, key):
     try:
         payload = jwt.decode(jwt=token, key=key, algorithms=['HS256'])
         return payload
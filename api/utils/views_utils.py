@@ -1,9 +1,11 @@
 from flask import g, redirect, url_for, jsonify, request, current_app
-from flask_jwt_extended import current_user
+from flask_jwt_extended import current_user, get_jwt
 
 import functools
+import hashlib
 
 from api.utils.token import decode
+from api.utils.auth import user_role_names
 from api.utils.application_data import ALLOWED_EXTENSIONS
 from api.models import User
 
@@ -18,6 +20,36 @@ def json_response(status=200, message="", **kwargs):
     return response
 
 
+def etag_for(*parts):
+    """
+    ETag of a representation built from `parts`: the primary key, the
+    version columns it changes with and the requested field set
+    :param *parts:
+    :Returns: str
+    """
+
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def not_modified(etag):
+    """
+    :param etag:
+    :Returns: empty 304 response if the request's If-None-Match names `etag`, else None
+    """
+
+    if not request.if_none_match.contains_weak(etag):
+        return None
+
+    response = current_app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def with_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    return response
+
+
 def login_required(view):
     @functools.wraps(view)
     def wrapped_view(*args, **kwargs):
@@ -88,7 +120,7 @@ def role_required(roles):
                     message="User not found"
                 )
 
-            user_roles = user.roles
+            user_roles = user_role_names(user, get_jwt())
 
             if user_roles == []:
                 return json_response(
@@ -97,7 +129,7 @@ def role_required(roles):
                 )
 
             for role in user_roles:
-                if role.name in roles:
+                if role in roles:
                     return f(*args, **kwargs)
 
             return json_response(
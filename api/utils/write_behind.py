@@ -0,0 +1,113 @@
+import logging
+import threading
+
+from sqlalchemy import inspect
+
+
+class WriteBehindBuffer(object):
+    """
+    In-memory queue of column updates that may be persisted late.
+    Repeated writes to the same row are coalesced so each row is updated
+    at most once per flush, and every flush is a batched UPDATE per model
+    in a single transaction. `on_full` is called once the queue holds
+    `max_size` rows so the owner can flush early, and `on_flush(model, pks)`
+    after rows were written, since bulk updates skip ORM events.
+    """
+
+    def __init__(self, name="write_behind"):
+        self.name = name
+        self.enabled = False
+        self.max_size = 500
+        self.on_full = None
+        self.on_flush = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failures = 0
+
+    def configure(self, enabled=None, max_size=None):
+        if enabled is not None:
+            self.enabled = enabled
+        if max_size is not None:
+            self.max_size = max_size
+
+    def queue(self, model, pk, **values):
+        """
+        Queue `values` for the row of `model` identified by `pk`
+        :param model, pk, **values:
+        :Returns: None
+        """
+
+        with self._lock:
+            self._pending.setdefault(model, {}).setdefault(pk, {}).update(values)
+            self.queued += 1
+            full = self._size() >= self.max_size
+
+        if full and self.on_full is not None:
+            self.on_full()
+
+    def flush(self, session):
+        """
+        Write every queued update. Rows that fail to flush are put back
+        unless they were queued again in the meantime.
+        :param session:
+        :Returns: number of rows updated
+        """
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return 0
+
+        try:
+            for model, rows in pending.items():
+                pk_name = inspect(model).primary_key[0].key
+                session.bulk_update_mappings(
+                    model, [{pk_name: pk, **values} for pk, values in rows.items()]
+                )
+            session.commit()
+        except Exception:
+            session.rollback()
+            self._requeue(pending)
+            raise
+
+        if self.on_flush is not None:
+            for model, rows in pending.items():
+                self.on_flush(model, list(rows))
+
+        count = sum(len(rows) for rows in pending.values())
+        self.flushed += count
+        self.flushes += 1
+        logging.debug(f"Write Behind: {self.name} flushed {count} row(s)")
+
+        return count
+
+    def _requeue(self, pending):
+        with self._lock:
+            self.failures += 1
+            for model, rows in pending.items():
+                for pk, values in rows.items():
+                    newer = self._pending.setdefault(model, {}).setdefault(pk, {})
+                    for key, value in values.items():
+                        newer.setdefault(key, value)
+
+    def _size(self):
+        return sum(len(rows) for rows in self._pending.values())
+
+    def __len__(self):
+        with self._lock:
+            return self._size()
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "pending": len(self),
+            "max_size": self.max_size,
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failures": self.failures,
+        }
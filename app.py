@@ -1,15 +1,31 @@
+import atexit
 import click
-import uuid
+import json
+import logging
+import os
+import time
 
-from flask.cli import with_appcontext
+from dotenv import set_key
+from flask.cli import with_appcontext, AppGroup
 from flask_restful import Api
 from flasgger import Swagger
+from sqlalchemy.exc import SQLAlchemyError
 
-from api.utils import create_app, db, jwt
+from api.utils import (
+    create_app, db, jwt, keyset, login_writes, user_cache, hashing_pool, password_hashers,
+    role_registry, email_outbox
+)
+from api.utils.hashers import calibrate, benchmark_throughput, with_params
+from api.utils.auth import (
+    load_user, is_token_revoked, purge_expired_tokens, purge_expired_token_families,
+    get_or_create_role
+)
+from api.utils.tasks import PeriodicTask
 from api.utils.application_data import roles
 from api.utils.api_docs import spec_template
 from api.urls import api_urls
-from api.models import Role, User, TokenBlocklist
+from api.users.imports import UserImporter, read_rows
+from api.users.exports import UserExporter
 
 
 app = create_app('config.Config', name="Main")
@@ -23,12 +39,9 @@ api_urls(api)
 def seed():
     print("Seeding Data: initiated adding roles...")
     for role in roles:
-        _role = Role.query.filter_by(name=role).one_or_none()
         print(f"Seeding Data: adding {role} role...")
-        if not _role:
-            role = Role(name=role, uuid=uuid.uuid1())
-            db.session.add(role)
-            db.session.commit()
+        get_or_create_role(role)
+    db.session.commit()
 
     print("Seeding Data: adding roles completed.")
 
@@ -52,8 +65,297 @@ def seed_db_command():
     seed()
 
 
+@click.command('purge-blocklist')
+@click.option('--batch-size', default=None, type=int, help="Rows deleted per transaction.")
+@with_appcontext
+def purge_blocklist_command(batch_size):
+    """
+    Delete revoked tokens that have already expired
+    from the token blocklist, and expired refresh token families.
+    """
+
+    batch_size = batch_size or app.config.get("TOKEN_BLOCKLIST_PURGE_BATCH_SIZE", 1000)
+    deleted = purge_expired_tokens(batch_size=batch_size)
+    click.echo(f'Purged {deleted} expired token(s) from the blocklist.')
+    deleted = purge_expired_token_families(batch_size=batch_size)
+    click.echo(f'Purged {deleted} expired refresh token family(ies).')
+
+
+jwt_keys_cli = AppGroup('jwt-keys', help="Manage asymmetric JWT signing keys.")
+
+
+@jwt_keys_cli.command('rotate')
+@click.option('--force', is_flag=True, help="Create a new key even if the current one is not due.")
+def rotate_jwt_keys_command(force):
+    """
+    Create a new signing key when the current one is due for
+    rotation and prune keys no live token was signed with.
+    """
+
+    if not keyset.enabled:
+        click.echo(f'JWT_ALGORITHM is {keyset.algorithm}; signing keys are not used.')
+        return
+
+    kid = keyset.rotate(force=force)
+    click.echo(f'Created signing key {kid}.' if kid else 'Signing key is not due for rotation.')
+
+
+@jwt_keys_cli.command('list')
+def list_jwt_keys_command():
+    """ List signing keys and the one currently in use. """
+
+    if not keyset.enabled:
+        click.echo(f'JWT_ALGORITHM is {keyset.algorithm}; signing keys are not used.')
+        return
+
+    signing_kid = keyset.signing_key()[0]
+    for jwk in keyset.jwks()["keys"]:
+        marker = " (signing)" if jwk["kid"] == signing_kid else ""
+        click.echo(f'{jwk["kid"]}{marker}')
+
+
+auth_cli = AppGroup('auth', help="Authentication maintenance commands.")
+
+
+@auth_cli.command('calibrate-hash')
+@click.option('--target-ms', default=50.0, show_default=True, help="Target median hash latency.")
+@click.option('--samples', default=5, show_default=True, help="Hashes timed per parameter set.")
+@click.option('--algorithm', default=None, help="Hasher to calibrate, defaults to PASSWORD_HASHER.")
+@click.option('--write', is_flag=True, help="Save the recommended settings to the .env file.")
+@click.option(
+    '--env-file', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"),
+    show_default=True, help="Settings file written by --write."
+)
+def calibrate_hash_command(target_ms, samples, algorithm, write, env_file):
+    """
+    Benchmark the password hasher on this machine and recommend
+    cost parameters and hashing processes for a target latency.
+    """
+
+    algorithm = algorithm or password_hashers.algorithm
+    if algorithm not in password_hashers.hashers:
+        raise click.BadParameter(f"Unknown password hasher {algorithm}", param_hint="--algorithm")
+
+    hasher = password_hashers.hashers[algorithm]
+    cpus = os.cpu_count() or 1
+    click.echo(f'Calibrating {algorithm} for a {target_ms:g} ms median hash on {cpus} core(s)...')
+
+    results, recommended = calibrate(hasher, target_ms, samples=samples)
+    for params, median_ms in results:
+        marker = "  <- recommended" if params is recommended else ""
+        options = ", ".join(f"{key}={value}" for key, value in params.items())
+        click.echo(f'  {options}: {median_ms:.1f} ms{marker}')
+    if results[0][1] > target_ms:
+        click.echo(f'No parameters meet {target_ms:g} ms on this machine; using the cheapest.')
+
+    click.echo('Login throughput with the recommended parameters:')
+    tuned = with_params(hasher, recommended)
+    throughput = {}
+    for workers in sorted({1, 2, 4, cpus // 2, cpus} & set(range(1, cpus + 1))):
+        throughput[workers] = benchmark_throughput(tuned, workers)
+        click.echo(
+            f'  {workers} process(es): {throughput[workers]:.1f} logins/s, '
+            f'{throughput[workers] / workers:.1f} per core'
+        )
+
+    settings = {"PASSWORD_HASHER": algorithm}
+    settings.update({hasher.settings[key]: value for key, value in recommended.items()})
+    settings["PASSWORD_HASHING_WORKERS"] = max(throughput, key=throughput.get)
+
+    click.echo('Recommended settings:')
+    for key, value in settings.items():
+        click.echo(f'  {key}={value}')
+        if write:
+            set_key(env_file, key, str(value), quote_mode="never")
+
+    if write:
+        click.echo(f'Saved to {env_file}. Restart the workers to apply them.')
+    else:
+        click.echo('Re-run with --write to save them to the .env file.')
+
+
+users_cli = AppGroup('users', help="Manage users in bulk.")
+
+
+@users_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '--format', 'file_format', type=click.Choice(["csv", "jsonl"]), default=None,
+    help="File format, guessed from the extension by default."
+)
+@click.option('--role', 'roles', multiple=True, default=["Client"], show_default=True,
+              help="Role given to every imported user, repeat for several.")
+@click.option('--batch-size', default=5000, show_default=True, help="Users per transaction.")
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True,
+              help="Processes hashing passwords, 0 hashes in this process.")
+@click.option('--confirm-emails', is_flag=True, help="Mark imported emails as confirmed.")
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), default=None,
+              help="Write per-row errors as JSON Lines to this file instead of stderr.")
+def import_users_command(path, file_format, roles, batch_size, workers, confirm_emails, errors_path):
+    """
+    Create users from a CSV or JSON Lines file with username, email,
+    phone_number and password columns.
+    """
+
+    file_format = file_format or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    errors_file = open(errors_path, "w", encoding="utf-8") if errors_path else None
+
+    def report_error(line_number, errors):
+        if errors_file is not None:
+            errors_file.write(json.dumps({"line": line_number, "errors": errors}) + "\n")
+        else:
+            click.echo(f'Line {line_number}: {json.dumps(errors)}', err=True)
+
+    def report_batch(importer):
+        click.echo(
+            f'Imported {importer.imported} user(s), {importer.failed} error(s), '
+            f'{importer.rate:.0f} users/s'
+        )
+
+    importer = UserImporter(
+        role_names=roles, batch_size=batch_size, workers=workers,
+        confirm_emails=confirm_emails, on_error=report_error
+    )
+    started = time.perf_counter()
+    try:
+        with open(path, newline="", encoding="utf-8") as file:
+            importer.run(read_rows(file, file_format), on_batch=report_batch)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    finally:
+        if errors_file is not None:
+            errors_file.close()
+
+    click.echo(
+        f'Done: {importer.imported} user(s) imported, {importer.failed} row(s) rejected '
+        f'in {time.perf_counter() - started:.1f}s ({importer.rate:.0f} users/s).'
+    )
+
+
+@users_cli.command('export')
+@click.option('--format', 'file_format', type=click.Choice(["jsonl", "csv"]), default="jsonl",
+              show_default=True, help="JSON Lines, one user per line, or CSV, one row per account.")
+@click.option('--output', type=click.File("w", encoding="utf-8", lazy=True), default="-",
+              help="File to write, standard output by default.")
+@click.option('--chunk-size', default=None, type=int, help="Users read per chunk.")
+@with_appcontext
+def export_users_command(file_format, output, chunk_size):
+    """
+    Write every user with their roles and accounts, streamed in chunks.
+    """
+
+    exporter = UserExporter(
+        file_format, chunk_size or app.config.get("USER_EXPORT_CHUNK_SIZE", 1000)
+    )
+    for chunk in exporter.chunks():
+        output.write(chunk)
+
+    click.echo(f'Exported {exporter.exported} user(s).', err=True)
+
+
+mail_cli = AppGroup('mail', help="Deliver queued email.")
+
+
+@mail_cli.command('deliver')
+@click.option('--loop', is_flag=True, help="Keep polling the outbox instead of exiting once it is empty.")
+@click.option('--interval', default=5.0, show_default=True, help="Seconds between polls with --loop.")
+@with_appcontext
+def deliver_mail_command(loop, interval):
+    """
+    Send every due message in the email outbox. Any number of
+    workers may run at once; each claims its own batches.
+    """
+
+    while True:
+        delivered = email_outbox.drain(db.session)
+        if delivered:
+            click.echo(f'Processed {delivered} message(s). {email_outbox.stats()}')
+        if not loop:
+            break
+        time.sleep(interval)
+
+
 # Register cli commands
 app.cli.add_command(seed_db_command)
+app.cli.add_command(purge_blocklist_command)
+app.cli.add_command(jwt_keys_cli)
+app.cli.add_command(auth_cli)
+app.cli.add_command(users_cli)
+app.cli.add_command(mail_cli)
+
+
+# Background maintenance
+def purge_expired():
+    batch_size = app.config.get("TOKEN_BLOCKLIST_PURGE_BATCH_SIZE", 1000)
+    purge_expired_tokens(batch_size=batch_size)
+    purge_expired_token_families(batch_size=batch_size)
+
+
+blocklist_purge_task = PeriodicTask(
+    app,
+    app.config.get("TOKEN_BLOCKLIST_PURGE_INTERVAL", 0),
+    purge_expired,
+    name="purge_expired_tokens"
+).start()
+
+
+# Deliver queued email on a timer and right after a request queues some
+mail_outbox_task = PeriodicTask(
+    app,
+    app.config.get("MAIL_OUTBOX_INTERVAL", 0),
+    lambda: email_outbox.drain(db.session),
+    name="deliver_mail"
+).start()
+if app.config.get("MAIL_OUTBOX_INTERVAL", 0) > 0:
+    email_outbox.on_queued = mail_outbox_task.trigger
+
+atexit.register(hashing_pool.shutdown)
+atexit.register(lambda: email_outbox.transport.close())
+
+
+def evict_flushed_users(model, pks):
+    for pk in pks:
+        user_cache.pop(pk)
+
+
+if login_writes.enabled:
+    # Flush queued login writes on a timer, early when the queue fills up,
+    # and once more when the worker exits
+    login_writes_task = PeriodicTask(
+        app,
+        app.config.get("LOGIN_WRITE_BEHIND_INTERVAL", 1),
+        lambda: login_writes.flush(db.session),
+        name="flush_login_writes"
+    ).start()
+    login_writes.on_full = login_writes_task.trigger
+    login_writes.on_flush = evict_flushed_users
+
+    @atexit.register
+    def drain_login_writes():
+        login_writes_task.stop(timeout=5)
+        login_writes_task.run_once()
+
+
+def load_role_registry():
+    # Before migrations ran (e.g. during `flask db upgrade`) the registry
+    # is left empty and loads on first use instead
+    with app.app_context():
+        try:
+            role_registry.load()
+        except SQLAlchemyError as error:
+            logging.warning(f"Role Registry: not loaded at startup ({error.__class__.__name__})")
+        finally:
+            db.session.rollback()
+
+
+load_role_registry()
+
+if keyset.enabled:
+    # Make sure a signing key exists, then check hourly whether one is due
+    keyset.rotate()
+    jwt_key_rotation_task = PeriodicTask(
+        app, 3600, keyset.rotate, name="rotate_jwt_keys"
+    ).start()
 
 
 # Register a callback function that takes whatever object is passed in as the
@@ -71,16 +373,14 @@ def user_identity_lookup(user):
 @jwt.user_lookup_loader
 def user_lookup_callback(_jwt_header, jwt_data):
     identity = jwt_data["sub"]
-    return User.query.filter_by(uuid=identity).one_or_none()
+    return load_user(identity)
 
 
 # Callback function to check if a JWT exists in the database blocklist
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload: dict) -> bool:
     jti = jwt_payload["jti"]
-    token = db.session.query(TokenBlocklist.id).filter_by(jti=jti).scalar()
-
-    return token is not None
+    return is_token_revoked(jti)
 
 
 # API Swagger Docs
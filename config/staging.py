@@ -22,6 +22,97 @@ class StagingConfig(object):
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(seconds=300)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    # RS256 or EdDSA sign with rotated keys from JWT_KEYS_FOLDER, published at /.well-known/jwks.json
+    JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+    JWT_DECODE_ALGORITHMS = (os.getenv("JWT_DECODE_ALGORITHMS") or JWT_ALGORITHM).split(",")
+    JWT_KEYS_FOLDER = os.getenv("JWT_KEYS_FOLDER") or os.path.join(application_root, "instance/jwt_keys")
+    JWT_KEY_ROTATION_INTERVAL = int(os.getenv("JWT_KEY_ROTATION_INTERVAL", 30 * 24 * 3600))
+    JWT_KEY_ACTIVATION_DELAY = int(os.getenv("JWT_KEY_ACTIVATION_DELAY", 600))
+    JWT_KEYS_RELOAD_INTERVAL = int(os.getenv("JWT_KEYS_RELOAD_INTERVAL", 60))
+    JWKS_MAX_AGE = int(os.getenv("JWKS_MAX_AGE", 300))
+    # Stamp role names into access tokens so role checks skip the database
+    JWT_ROLE_CLAIMS = os.getenv("JWT_ROLE_CLAIMS", "True").lower() in ["true", "1"]
+    # Upper bound on tokens verified per introspection request
+    JWT_INTROSPECT_MAX_TOKENS = int(os.getenv("JWT_INTROSPECT_MAX_TOKENS", 100))
+
+    # New password hashes use PASSWORD_HASHER (pbkdf2, scrypt or argon2id); hashes
+    # stored with another algorithm or cost are upgraded on the next login
+    PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "pbkdf2")
+    PASSWORD_PBKDF2_ITERATIONS = int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", 260000))
+    PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", 2 ** 15))
+    PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", 8))
+    PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", 1))
+    PASSWORD_ARGON2_TIME_COST = int(os.getenv("PASSWORD_ARGON2_TIME_COST", 3))
+    PASSWORD_ARGON2_MEMORY_COST = int(os.getenv("PASSWORD_ARGON2_MEMORY_COST", 65536))
+    PASSWORD_ARGON2_PARALLELISM = int(os.getenv("PASSWORD_ARGON2_PARALLELISM", 4))
+    # Hash passwords on a process pool (0 hashes inline), answering 503 once
+    # PASSWORD_HASHING_MAX_QUEUE hashes are already pending
+    PASSWORD_HASHING_WORKERS = int(os.getenv("PASSWORD_HASHING_WORKERS", os.cpu_count() or 1))
+    PASSWORD_HASHING_MAX_QUEUE = int(os.getenv("PASSWORD_HASHING_MAX_QUEUE", 64))
+    PASSWORD_HASHING_TIMEOUT = int(os.getenv("PASSWORD_HASHING_TIMEOUT", 30))
+    PASSWORD_HASHING_RETRY_AFTER = int(os.getenv("PASSWORD_HASHING_RETRY_AFTER", 1))
+
+    # Failed login limits per username and per client IP, checked before hashing
+    LOGIN_THROTTLE_ENABLED = os.getenv("LOGIN_THROTTLE_ENABLED", "True").lower() in ["true", "1"]
+    LOGIN_THROTTLE_MAX_FAILURES = int(os.getenv("LOGIN_THROTTLE_MAX_FAILURES", 5))
+    LOGIN_THROTTLE_IP_MAX_FAILURES = int(os.getenv("LOGIN_THROTTLE_IP_MAX_FAILURES", 50))
+    LOGIN_THROTTLE_WINDOW = int(os.getenv("LOGIN_THROTTLE_WINDOW", 300))
+    LOGIN_THROTTLE_LOCKOUT = int(os.getenv("LOGIN_THROTTLE_LOCKOUT", 60))
+    LOGIN_THROTTLE_MAX_LOCKOUT = int(os.getenv("LOGIN_THROTTLE_MAX_LOCKOUT", 3600))
+    LOGIN_THROTTLE_REDIS_URL = os.getenv("LOGIN_THROTTLE_REDIS_URL")
+    # Reverse proxies in front of the app whose X-Forwarded-For is trusted for
+    # the client IP (0 uses the socket address, which behind a proxy is the proxy's)
+    PROXY_FIX_X_FOR = int(os.getenv("PROXY_FIX_X_FOR", 0))
+
+    # In-process cache of users resolved from access tokens
+    USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", 10000))
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 60))
+    # Seconds between checks evicting users another worker deleted or modified (0 never)
+    USER_CACHE_VALIDATE_INTERVAL = int(os.getenv("USER_CACHE_VALIDATE_INTERVAL", 5))
+
+    # Memo of decoded email-confirm, forgot-password and bearer tokens
+    TOKEN_DECODE_CACHE_MAXSIZE = int(os.getenv("TOKEN_DECODE_CACHE_MAXSIZE", 4096))
+    TOKEN_DECODE_CACHE_TTL = int(os.getenv("TOKEN_DECODE_CACHE_TTL", 300))
+    TOKEN_DECODE_CACHE_NEGATIVE_TTL = int(os.getenv("TOKEN_DECODE_CACHE_NEGATIVE_TTL", 30))
+
+    # In-memory Bloom filter consulted before the token blocklist table
+    TOKEN_BLOCKLIST_FILTER_ENABLED = os.getenv("TOKEN_BLOCKLIST_FILTER_ENABLED", "True").lower() in ["true", "1"]
+    TOKEN_BLOCKLIST_FILTER_CAPACITY = int(os.getenv("TOKEN_BLOCKLIST_FILTER_CAPACITY", 100000))
+    TOKEN_BLOCKLIST_FILTER_ERROR_RATE = float(os.getenv("TOKEN_BLOCKLIST_FILTER_ERROR_RATE", 0.001))
+    TOKEN_BLOCKLIST_FILTER_MAX_BYTES = int(os.getenv("TOKEN_BLOCKLIST_FILTER_MAX_BYTES", 1024 * 1024))
+    TOKEN_BLOCKLIST_FILTER_REFRESH = int(os.getenv("TOKEN_BLOCKLIST_FILTER_REFRESH", 60))
+    TOKEN_BLOCKLIST_PURGE_INTERVAL = int(os.getenv("TOKEN_BLOCKLIST_PURGE_INTERVAL", 3600))
+    TOKEN_BLOCKLIST_PURGE_BATCH_SIZE = int(os.getenv("TOKEN_BLOCKLIST_PURGE_BATCH_SIZE", 1000))
+
+    # Queue login bookkeeping writes (auth_token) and flush them in batches
+    LOGIN_WRITE_BEHIND = os.getenv("LOGIN_WRITE_BEHIND", "False").lower() in ["true", "1"]
+    LOGIN_WRITE_BEHIND_INTERVAL = float(os.getenv("LOGIN_WRITE_BEHIND_INTERVAL", 1))
+    LOGIN_WRITE_BEHIND_MAX_SIZE = int(os.getenv("LOGIN_WRITE_BEHIND_MAX_SIZE", 500))
+
+    # Role name to uuid registry kept in memory by every worker
+    ROLE_REGISTRY_REFRESH = int(os.getenv("ROLE_REGISTRY_REFRESH", 300))
+
+    # Users read per chunk by the streaming user export
+    USER_EXPORT_CHUNK_SIZE = int(os.getenv("USER_EXPORT_CHUNK_SIZE", 1000))
+
+    # Outgoing email: queued in the outbox table and delivered by a worker
+    MAIL_TRANSPORT = os.getenv("MAIL_TRANSPORT", "smtp")
+    MAIL_SERVER = os.getenv("MAIL_SERVER", "localhost")
+    MAIL_PORT = int(os.getenv("MAIL_PORT", 25))
+    MAIL_USERNAME = os.getenv("MAIL_USERNAME")
+    MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+    MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "False").lower() in ["true", "1"]
+    MAIL_USE_SSL = os.getenv("MAIL_USE_SSL", "False").lower() in ["true", "1"]
+    MAIL_TIMEOUT = float(os.getenv("MAIL_TIMEOUT", 10))
+    MAIL_POOL_SIZE = int(os.getenv("MAIL_POOL_SIZE", 2))
+    MAIL_POOL_MAX_IDLE = float(os.getenv("MAIL_POOL_MAX_IDLE", 60))
+    MAIL_POOL_MAX_MESSAGES = int(os.getenv("MAIL_POOL_MAX_MESSAGES", 100))
+    MAIL_DEFAULT_SENDER = os.getenv("MAIL_DEFAULT_SENDER", "no-reply@localhost")
+    MAIL_OUTBOX_INTERVAL = float(os.getenv("MAIL_OUTBOX_INTERVAL", 5))
+    MAIL_OUTBOX_BATCH_SIZE = int(os.getenv("MAIL_OUTBOX_BATCH_SIZE", 50))
+    MAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("MAIL_OUTBOX_MAX_ATTEMPTS", 8))
+    MAIL_OUTBOX_BACKOFF = int(os.getenv("MAIL_OUTBOX_BACKOFF", 30))
+    MAIL_OUTBOX_MAX_BACKOFF = int(os.getenv("MAIL_OUTBOX_MAX_BACKOFF", 3600))
 
     UPLOAD_FOLDER = os.path.join(application_root, "instance/uploads")
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
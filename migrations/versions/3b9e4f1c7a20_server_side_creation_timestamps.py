@@ -0,0 +1,36 @@
+"""server side creation timestamps
+
+Revision ID: 3b9e4f1c7a20
+Revises: 644b62d550e6
+Create Date: 2026-10-18 10:42:11.302517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9e4f1c7a20'
+down_revision = '644b62d550e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('role', 'user', 'account'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(
+                'date_created',
+                existing_type=sa.DateTime(),
+                server_default=sa.text("(now() at time zone 'utc')")
+            )
+
+
+def downgrade():
+    for table in ('role', 'user', 'account'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(
+                'date_created',
+                existing_type=sa.DateTime(),
+                server_default=None
+            )
@@ -5,8 +5,9 @@ from flask import url_for
 from flask_restful import Api
 
 from api.utils import create_app, db, jwt
+from api.utils.auth import load_user, is_token_revoked
 from api.urls import api_urls
-from api.models import Role, User, TokenBlocklist
+from api.models import Role, User
 from tests.utils import create_user
 from api.utils.application_data import roles
 
@@ -30,14 +31,12 @@ def test_app():
     @jwt.user_lookup_loader
     def user_lookup_callback(_jwt_header, jwt_data):
         identity = jwt_data["sub"]
-        return User.query.filter_by(uuid=identity).one_or_none()
+        return load_user(identity)
 
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload: dict) -> bool:
         jti = jwt_payload["jti"]
-        token = db.session.query(TokenBlocklist.id).filter_by(jti=jti).scalar()
-
-        return token is not None
+        return is_token_revoked(jti)
 
     return app
 
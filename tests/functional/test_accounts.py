@@ -5,7 +5,7 @@ import pytest
 from flask import url_for
 
 from api.models import Account
-from tests.utils import generate_username
+from tests.utils import generate_username, count_queries
 
 
 @pytest.fixture(scope="module")
@@ -81,6 +81,37 @@ def test_add_account(test_client, client_user):
     assert Account.query.filter_by(user_id=client_user.uuid).count() == initial_acc_count + 1
 
 
+def test_add_account_returns_inserted_row(test_db, test_client, client_user):
+    """
+    GIVEN a Flask application configured for testing and user
+    WHEN the 'user_accounts_api' is posted (POST) by user to add new account
+    THEN check the account is serialized from its INSERT ... RETURNING without a re-select
+    """
+
+    data = {
+        "name": generate_username(),
+        "bio_data": generate_username(),
+    }
+
+    with count_queries(test_db.engine) as statements:
+        response = test_client.post(
+            url_for("user_accounts_api"),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {client_user.auth_token}",
+            },
+            data=json.dumps(data),
+        )
+
+    account = response.get_json()["data"]
+
+    assert response.status_code == 201
+    assert statements[-1].startswith("INSERT INTO account")
+    assert "RETURNING account.date_created" in statements[-1]
+    assert account["id"] and account["date_created"]
+    assert account["display_photo"] == "default-avatar.png"
+
+
 def test_fetch_account_detail(test_client, test_account, superadmin):
     """
     GIVEN a Flask application configured for testing, test account and user
@@ -121,6 +152,32 @@ def test_fetch_account_detail(test_client, test_account, superadmin):
     assert "data" not in response.get_json()
 
 
+def test_fetch_account_detail_conditional_get(test_client, test_account):
+    """
+    GIVEN a Flask application configured for testing and test account
+    WHEN the 'user_accounts-detail_api' is requested (GET) again with the ETag it returned
+    THEN check a 304 is returned until the account is updated
+    """
+
+    url = url_for("user_accounts-detail_api", account_id=test_account.uuid)
+    headers = {"Authorization": f"Bearer {test_account.user.auth_token}"}
+    etag = test_client.get(url, headers=headers).headers["ETag"]
+
+    response = test_client.get(url, headers={**headers, "If-None-Match": etag})
+
+    assert response.status_code == 304
+
+    test_client.put(
+        url,
+        headers={**headers, "Content-Type": "application/json"},
+        data=json.dumps({"name": generate_username(), "bio_data": generate_username()}),
+    )
+    response = test_client.get(url, headers={**headers, "If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
 def test_update_account(test_client, test_account):
     """
     GIVEN a Flask application configured for testing and test account
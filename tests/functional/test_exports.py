@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+
+from flask import url_for
+
+from api.models import User, Account
+from api.users.exports import UserExporter
+from tests.utils import create_user, generate_username, count_queries
+
+
+def test_export_users_as_jsonl_in_chunks(test_db, client_role):
+    """
+    GIVEN users, some with accounts
+    WHEN they are exported as JSON Lines in small chunks
+    THEN check every user is written once with roles and accounts, from one streamed query
+    """
+
+    username = generate_username()
+    user = create_user(client_role, username=username)
+    user.accounts.append(Account(name=generate_username(), bio_data="bio"))
+    test_db.session.add(user)
+    test_db.session.commit()
+    user = User.query.filter_by(username=username).one()
+
+    exporter = UserExporter("jsonl", chunk_size=2)
+    with count_queries(test_db.engine) as statements:
+        chunks = list(exporter.chunks())
+
+    users = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+    count = User.query.count()
+    exported = next(row for row in users if row["id"] == user.uuid)
+
+    assert len(users) == exporter.exported == count
+    assert len(chunks) == (count + 1) // 2
+    assert [row["id"] for row in users] == [
+        row.uuid for row in User.query.order_by(User.date_created, User.uuid)
+    ]
+    assert exported["roles"] == [{"name": client_role.name}]
+    assert exported["accounts"][0]["name"] == user.account_list[0].name
+    assert len([statement for statement in statements if statement.startswith('SELECT "user".')]) == 1
+
+
+def test_export_users_endpoint_streams_csv(test_db, test_client, superadmin, client_role):
+    """
+    GIVEN a user with two accounts and an admin user
+    WHEN the 'user_export_api' is requested (GET) as CSV
+    THEN check a streamed CSV with one row per account is returned
+    """
+
+    username = generate_username()
+    user = create_user(client_role, username=username)
+    user.accounts.append(Account(name=generate_username(), bio_data="first"))
+    user.accounts.append(Account(name=generate_username(), bio_data="second"))
+    test_db.session.add(user)
+    test_db.session.commit()
+    user = User.query.filter_by(username=username).one()
+
+    response = test_client.get(
+        url_for("user_export_api", format="csv"),
+        headers={"Authorization": f"Bearer {superadmin.auth_token}"},
+    )
+
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    user_rows = [row for row in rows if row["id"] == user.uuid]
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert sorted(row["account_bio_data"] for row in user_rows) == ["first", "second"]
+    assert {row["roles"] for row in user_rows} == {client_role.name}
+    assert "password" not in rows[0]
+    assert len({row["id"] for row in rows}) == User.query.count()
+
+    response = test_client.get(
+        url_for("user_export_api", format="xml"),
+        headers={"Authorization": f"Bearer {superadmin.auth_token}"},
+    )
+
+    assert response.status_code == 400
+
+
+def test_export_users_requires_admin(test_client, client_user):
+    """
+    GIVEN a Flask application configured for testing and a client user
+    WHEN the 'user_export_api' is requested (GET) by the client user
+    THEN check access is denied
+    """
+
+    response = test_client.get(
+        url_for("user_export_api"),
+        headers={"Authorization": f"Bearer {client_user.auth_token}"},
+    )
+
+    assert response.status_code == 403
@@ -0,0 +1,72 @@
+import io
+import json
+
+from api.models import User
+from api.users.imports import UserImporter, read_rows
+from tests.utils import generate_username, generate_number
+
+
+def import_row(username=None, **overrides):
+    username = username or generate_username()
+    row = {
+        "username": username,
+        "email": f"{username}@mail.com",
+        "phone_number": "072" + generate_number(7),
+        "password": "password",
+    }
+    row.update(overrides)
+    return row
+
+
+def test_import_users_from_jsonl(test_db, client_role, client_user):
+    """
+    GIVEN a JSON Lines file with valid, invalid, repeated and existing users
+    WHEN it is imported in small batches
+    THEN check valid users are created with their role and every bad row is reported
+    """
+
+    first, second = import_row(), import_row()
+    rows = [
+        first,
+        second,
+        import_row(email="not-an-email"),
+        import_row(username=first["username"]),
+        import_row(username=client_user.username),
+    ]
+    file = io.StringIO("\n".join(json.dumps(row) for row in rows) + "\n{broken\n")
+    errors = {}
+
+    importer = UserImporter(
+        batch_size=2, on_error=lambda line_number, error: errors.update({line_number: error})
+    )
+    imported = importer.run(read_rows(file, "jsonl"))
+
+    assert imported == 2
+    assert sorted(errors) == [3, 4, 5, 6]
+    assert "email" in errors[3]
+    assert errors[5]["username"] == ["username already exist."]
+
+    user = User.query.filter_by(username=second["username"]).one()
+
+    assert user.verify_password("password")
+    assert [role.name for role in user.roles] == [client_role.name]
+    assert not user.is_email_confirmed
+
+
+def test_import_users_from_csv(test_db):
+    """
+    GIVEN a CSV file with a header line
+    WHEN it is imported with confirmed emails
+    THEN check the users are created and can log in
+    """
+
+    row = import_row()
+    file = io.StringIO(
+        "username,email,phone_number,password,extra\n"
+        f"{row['username']},{row['email']},{row['phone_number']},{row['password']},ignored\n"
+    )
+
+    importer = UserImporter(confirm_emails=True)
+
+    assert importer.run(read_rows(file, "csv")) == 1
+    assert User.query.filter_by(username=row["username"]).one().is_email_confirmed
@@ -0,0 +1,211 @@
+import datetime as dt
+import json
+import socket
+
+import pytest
+from flask import url_for
+from sqlalchemy.orm import Session
+
+from api.models import OutboxMessage
+from api.utils import email_outbox
+from api.utils.mail import SMTPTransport, ConsoleTransport
+from tests.utils import generate_username, generate_number, smtp_sink
+
+
+@pytest.fixture
+def outbox(test_db, seed_db):
+    """Empty email outbox, restored to its configuration afterwards"""
+
+    OutboxMessage.query.delete()
+    test_db.session.commit()
+    settings = (email_outbox.transport, email_outbox.backoff, email_outbox.max_attempts)
+
+    yield email_outbox
+
+    email_outbox.transport.close()
+    email_outbox.transport, email_outbox.backoff, email_outbox.max_attempts = settings
+    OutboxMessage.query.delete()
+    test_db.session.commit()
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def test_registration_queues_confirmation_email(test_client, outbox):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN a user registers (POST)
+    THEN check the confirmation email is queued in the outbox, not sent inline
+    """
+
+    username = generate_username()
+    response = test_client.post(
+        url_for("user_register_api"),
+        headers={"Content-Type": "application/json"},
+        data=json.dumps({
+            "email": f"{username}@gmail.com",
+            "username": username,
+            "phone_number": "074" + generate_number(7),
+            "password": "password",
+            "confirm_password": "password",
+        }),
+    )
+
+    message = OutboxMessage.query.filter_by(recipient=f"{username}@gmail.com").one()
+
+    assert response.status_code == 201
+    assert message.status == "pending"
+    assert message.subtype == "html"
+    assert "http://localhost.dev/v1/user/confirm-email" in message.body
+
+
+def test_outbox_delivers_over_smtp(test_db, outbox):
+    """
+    GIVEN queued messages and a local SMTP server
+    WHEN the outbox is drained
+    THEN check every message is delivered and marked sent
+    """
+
+    for index in range(3):
+        outbox.queue(test_db.session, f"user{index}@mail.com", "Hello", f"Message {index}")
+    test_db.session.commit()
+
+    with smtp_sink() as server:
+        outbox.configure(transport=SMTPTransport(port=server.server_address[1]))
+        assert outbox.drain(test_db.session) == 3
+
+    assert sorted(message["To"] for message in server.messages) == [
+        "user0@mail.com", "user1@mail.com", "user2@mail.com"
+    ]
+    assert {message.status for message in OutboxMessage.query} == {"sent"}
+    assert outbox.drain(test_db.session) == 0
+
+
+def test_outbox_retries_with_backoff(test_db, outbox):
+    """
+    GIVEN a queued message and an SMTP server that cannot be reached
+    WHEN the outbox is drained repeatedly
+    THEN check delivery is rescheduled with a growing delay, then given up
+    """
+
+    outbox.configure(
+        transport=SMTPTransport(port=unused_port(), timeout=1), backoff=60, max_attempts=2
+    )
+    message = outbox.queue(test_db.session, "offline@mail.com", "Hello", "Body")
+    test_db.session.commit()
+    message_id = message.id
+
+    started = dt.datetime.utcnow()
+    assert outbox.drain(test_db.session) == 1
+    message = test_db.session.get(OutboxMessage, message_id)
+
+    assert message.status == "pending"
+    assert message.attempts == 1
+    assert message.next_attempt_at >= started + dt.timedelta(seconds=60)
+    assert outbox.drain(test_db.session) == 0
+
+    message.next_attempt_at = started
+    test_db.session.commit()
+    outbox.drain(test_db.session)
+    message = test_db.session.get(OutboxMessage, message_id)
+
+    assert message.status == "failed"
+    assert message.attempts == 2
+    assert "ConnectionRefusedError" in message.last_error
+
+
+def test_outbox_refused_recipient_fails_without_blocking_batch(test_db, outbox):
+    """
+    GIVEN queued messages, one to a recipient the SMTP server refuses
+    WHEN the outbox is drained
+    THEN check the refused message fails at once and the others are sent
+    """
+
+    outbox.queue(test_db.session, "nobody@mail.com", "Hello", "Body")
+    outbox.queue(test_db.session, "somebody@mail.com", "Hello", "Body")
+    test_db.session.commit()
+
+    with smtp_sink(refused=["nobody@mail.com"]) as server:
+        outbox.configure(transport=SMTPTransport(port=server.server_address[1]))
+        outbox.drain(test_db.session)
+
+    statuses = {message.recipient: message.status for message in OutboxMessage.query}
+
+    assert statuses == {"nobody@mail.com": "failed", "somebody@mail.com": "sent"}
+    assert [message["To"] for message in server.messages] == ["somebody@mail.com"]
+
+
+def test_outbox_reuses_pooled_smtp_connection(test_db, outbox):
+    """
+    GIVEN a pooled SMTP transport
+    WHEN several batches are delivered one after another
+    THEN check they share one SMTP connection
+    """
+
+    with smtp_sink() as server:
+        outbox.configure(transport=SMTPTransport(port=server.server_address[1]))
+        for batch in range(2):
+            for index in range(2):
+                outbox.queue(test_db.session, f"user{batch}{index}@mail.com", "Hello", "Body")
+            test_db.session.commit()
+            outbox.drain(test_db.session)
+
+        assert server.connections == 1
+        assert len(server.messages) == 4
+        assert outbox.transport.stats()["reuses"] == 1
+        assert outbox.stats()["send_latency_max_ms"] > 0
+
+
+def test_outbox_pipelines_smtp_commands(test_db, outbox):
+    """
+    GIVEN an SMTP server advertising PIPELINING that refuses one recipient
+    WHEN the outbox is drained
+    THEN check the others are delivered intact and the refused one fails
+    """
+
+    outbox.queue(test_db.session, "first@mail.com", "Hello", "Line\n.starts with a dot\n")
+    outbox.queue(test_db.session, "nobody@mail.com", "Hello", "Body")
+    outbox.queue(test_db.session, "last@mail.com", "Hello", "Body")
+    test_db.session.commit()
+
+    with smtp_sink(refused=["nobody@mail.com"], pipelining=True) as server:
+        outbox.configure(transport=SMTPTransport(port=server.server_address[1]))
+        outbox.drain(test_db.session)
+
+        assert outbox.transport._idle[0].pipelining
+
+    statuses = {message.recipient: message.status for message in OutboxMessage.query}
+
+    assert statuses == {"first@mail.com": "sent", "nobody@mail.com": "failed", "last@mail.com": "sent"}
+    assert [message["To"] for message in server.messages] == ["first@mail.com", "last@mail.com"]
+    assert server.messages[0].get_payload().replace("\r\n", "\n") == "Line\n.starts with a dot\n"
+
+
+def test_outbox_workers_skip_claimed_messages(test_db, outbox):
+    """
+    GIVEN a batch of messages claimed by one worker whose transaction is still open
+    WHEN a second worker claims messages
+    THEN check it skips the locked messages instead of waiting or sending them twice
+    """
+
+    outbox.configure(transport=ConsoleTransport())
+    for index in range(4):
+        outbox.queue(test_db.session, f"user{index}@mail.com", "Hello", "Body")
+    test_db.session.commit()
+
+    other = Session(bind=test_db.engine)
+    try:
+        outbox.batch_size = 3
+        claimed = outbox._claim(other, dt.datetime.utcnow())
+
+        assert len(claimed) == 3
+        assert outbox.deliver(test_db.session) == 1
+        other.rollback()
+    finally:
+        outbox.batch_size = 50
+        other.close()
+
+    assert outbox.drain(test_db.session) == 3
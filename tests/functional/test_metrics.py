@@ -0,0 +1,37 @@
+from flask import url_for
+
+
+def test_admin_fetch_metrics(test_client, superadmin, client_user):
+    """
+    GIVEN a Flask application configured for testing and admin user
+    WHEN the 'metrics_api' is requested (GET) by admin user
+    THEN check the response is valid and contains the user cache counters
+    """
+
+    response = test_client.get(
+        url_for("metrics_api"),
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {superadmin.auth_token}",
+        },
+    )
+
+    assert response.status_code == 200
+    assert "hits" in response.get_json()["data"]["user_cache"]
+
+    """
+    GIVEN a Flask application configured for testing and user
+    WHEN the 'metrics_api' is requested (GET) by a non-admin user
+    THEN check the response is valid
+    """
+
+    response = test_client.get(
+        url_for("metrics_api"),
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {client_user.auth_token}",
+        },
+    )
+
+    assert response.status_code == 403
+    assert "data" not in response.get_json()
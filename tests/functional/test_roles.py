@@ -5,7 +5,8 @@ import pytest
 from flask import url_for
 
 from api.models import Role
-from tests.utils import generate_username
+from api.utils import role_registry
+from tests.utils import create_user, generate_username, count_queries
 
 
 @pytest.fixture(scope="module")
@@ -92,6 +93,32 @@ def test_admin_add_role(test_client, superadmin):
     assert Role.query.count() == initial_role_count + 1
 
 
+def test_admin_add_role_returns_inserted_row(test_db, test_client, superadmin):
+    """
+    GIVEN a Flask application configured for testing and admin user
+    WHEN the 'user_roles_api' is posted (POST) by admin user to add new role
+    THEN check the role is serialized from its INSERT without a re-select
+    """
+
+    with count_queries(test_db.engine) as statements:
+        response = test_client.post(
+            url_for("user_roles_api"),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {superadmin.auth_token}",
+            },
+            data=json.dumps({"name": generate_username()}),
+        )
+
+    role = response.get_json()["data"]
+
+    assert response.status_code == 201
+    assert statements[-1].startswith("INSERT INTO role")
+    assert role["id"] and "users" not in role
+    assert role_registry.get(role["name"]) == role["id"]
+
+
+@pytest.mark.filterwarnings("error::sqlalchemy.exc.SAWarning")
 def test_admin_fetch_role_detail(test_client, superadmin, test_role):
     """
     GIVEN a Flask application configured for testing, test role and admin user
@@ -112,6 +139,61 @@ def test_admin_fetch_role_detail(test_client, superadmin, test_role):
     assert test_role.name in response.get_json()["data"]["name"]
 
 
+def test_admin_fetch_role_detail_without_users(test_db, test_client, superadmin, test_role):
+    """
+    GIVEN a Flask application configured for testing, test role and admin user
+    WHEN the 'user_roles-detail_api' is requested (GET) with `fields=name`
+    THEN check only the name is returned and the role's users are not loaded
+    """
+
+    with count_queries(test_db.engine) as statements:
+        response = test_client.get(
+            url_for("user_roles-detail_api", role_id=test_role.uuid, fields="name"),
+            headers={"Authorization": f"Bearer {superadmin.auth_token}"},
+        )
+
+    assert response.status_code == 200
+    assert response.get_json()["data"] == {"name": test_role.name}
+    assert statements[-1].startswith("SELECT role.uuid")
+    assert not any('FROM "user", user_role' in statement for statement in statements)
+
+
+@pytest.mark.filterwarnings("error::sqlalchemy.exc.SAWarning")
+def test_admin_fetch_role_detail_conditional_get(test_db, test_client, superadmin):
+    """
+    GIVEN a Flask application configured for testing, a role and admin user
+    WHEN the 'user_roles-detail_api' is requested (GET) again with the ETag it returned
+    THEN check a 304 is returned until a user joins the role
+    """
+
+    role = Role(name=generate_username())
+    test_db.session.add(role)
+    test_db.session.commit()
+
+    url = url_for("user_roles-detail_api", role_id=role.uuid)
+    headers = {"Authorization": f"Bearer {superadmin.auth_token}"}
+    etag = test_client.get(url, headers=headers).headers["ETag"]
+
+    response = test_client.get(url, headers={**headers, "If-None-Match": etag})
+
+    assert response.status_code == 304
+
+    username = generate_username()
+    test_db.session.add(create_user(role, username=username))
+    test_db.session.commit()
+    response = test_client.get(url, headers={**headers, "If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert [user["username"] for user in response.get_json()["data"]["users"]] == [username]
+
+    response = test_client.get(
+        url_for("user_roles-detail_api", role_id=str(uuid.uuid1())),
+        headers={**headers, "If-None-Match": "*"}
+    )
+
+    assert response.status_code == 404
+
+
 def test_admin_update_role(test_client, superadmin, test_role):
     """
     GIVEN a Flask application configured for testing, test role and admin user
@@ -136,6 +218,7 @@ def test_admin_update_role(test_client, superadmin, test_role):
     assert b"Role Updated" in response.get_data()
     assert "data" in response.get_json()
     assert data["name"] == test_role.name
+    assert role_registry.get("new_role_name") == test_role.uuid
 
 
 def test_admin_delete_role(test_client, superadmin, test_role):
@@ -158,3 +241,4 @@ def test_admin_delete_role(test_client, superadmin, test_role):
     assert response.status_code == 200
     assert b"Role Deleted" in response.get_data()
     assert Role.query.filter_by(uuid=role_id).one_or_none() is None
+    assert role_registry.get("new_role_name") is None
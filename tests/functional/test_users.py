@@ -1,10 +1,21 @@
 import json
+import time
+import uuid
+import datetime as dt
 
 import pytest
 from flask import url_for
+from sqlalchemy import text
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
 
-from api.models import User
-from tests.utils import create_user, generate_username, generate_number
+from api.models import User, Account, TokenBlocklist, TokenFamily
+from api.utils import user_cache, login_writes, hashing_pool, login_throttle, role_registry
+from api.utils.auth import (
+    purge_expired_tokens, purge_expired_token_families, revoke_token_family, start_token_family
+)
+from api.utils.hashers import ScryptHasher
+from api.users.views import filter_users
+from tests.utils import create_user, generate_username, generate_number, count_queries
 
 
 @pytest.fixture(scope="module")
@@ -55,6 +66,40 @@ def test_user_registration(test_db, test_client):
     assert not user.is_email_confirmed
 
 
+def test_user_registration_uses_role_registry(test_db, test_client, client_role):
+    """
+    GIVEN a Flask application configured for testing with seeded roles
+    WHEN users register (POST)
+    THEN check the Client role is linked without querying the role table
+    """
+
+    username = generate_username()
+    data = {
+        "email": f"{username}@gmail.com",
+        "username": username,
+        "phone_number": "073" + generate_number(7),
+        "password": "password",
+        "confirm_password": "password",
+    }
+    # Warm as at startup; seeding the roles invalidated it
+    role_registry.get("Client")
+    with count_queries(test_db.engine) as statements:
+        response = test_client.post(
+            url_for("user_register_api"),
+            headers={"Content-Type": "application/json"},
+            data=json.dumps(data),
+        )
+
+    assert response.status_code == 201
+    assert not [statement for statement in statements if "FROM role" in statement]
+    assert [statement.split(" (")[0] for statement in statements[-3:]] == [
+        'INSERT INTO "user"', "INSERT INTO user_role", "INSERT INTO outbox_message"
+    ]
+
+    user = User.query.filter_by(username=username).one_or_none()
+    assert [role.name for role in user.roles] == ["Client"]
+
+
 def test_user_registration_validation(test_db, test_client):
     """
     GIVEN a Flask application configured for testing
@@ -80,6 +125,36 @@ def test_user_registration_validation(test_db, test_client):
     assert User.query.filter_by(email=data["email"]).one_or_none() is None
 
 
+def test_user_registration_unique_fields(test_db, test_client, client_user):
+    """
+    GIVEN an existing user
+    WHEN the 'user_register_api' url is posted to with its username, email and phone number
+    THEN check every conflict is reported from a single uniqueness query
+    """
+
+    data = {
+        "email": client_user.email,
+        "username": client_user.username,
+        "phone_number": client_user.phone_number,
+        "password": "password",
+        "confirm_password": "password",
+    }
+    with count_queries(test_db.engine) as statements:
+        response = test_client.post(
+            url_for("user_register_api"),
+            headers={"Content-Type": "application/json"},
+            data=json.dumps(data),
+        )
+
+    errors = response.get_json()["errors"]
+
+    assert response.status_code == 400
+    assert errors["username"] == ["username already exist."]
+    assert errors["email"] == ["email already exist."]
+    assert errors["phone_number"] == ["phone_number already exist."]
+    assert len([statement for statement in statements if 'FROM "user"' in statement]) == 1
+
+
 def test_resend_confirmation_email(test_client, unconfirmed_client_user):
     """
     GIVEN a Flask application configured for testing and unconfirmed user
@@ -170,6 +245,135 @@ def test_user_login_logout(test_db, test_client, client_user):
     assert b"Data fetched." not in response.get_data()
 
 
+def test_login_write_behind(test_db, test_client, client_user):
+    """
+    GIVEN login write-behind enabled
+    WHEN a user logs in and the queued writes are flushed
+    THEN check the auth_token is only written by the batched flush
+    """
+
+    login_writes.enabled = True
+    try:
+        previous_token = test_db.session.query(User.auth_token).filter_by(
+            uuid=client_user.uuid
+        ).scalar()
+
+        response = test_client.post(
+            url_for("user_login_api"),
+            headers={"Content-Type": "application/json"},
+            data=json.dumps({"username": client_user.username, "password": "password"}),
+        )
+        access_token = response.get_json()["access_token"]
+
+        assert response.status_code == 200
+        assert len(login_writes) == 1
+        assert test_db.session.query(User.auth_token).filter_by(
+            uuid=client_user.uuid
+        ).scalar() == previous_token
+
+        assert login_writes.flush(test_db.session) == 1
+        assert len(login_writes) == 0
+        assert test_db.session.query(User.auth_token).filter_by(
+            uuid=client_user.uuid
+        ).scalar() == access_token
+    finally:
+        login_writes.enabled = False
+
+
+def test_purge_expired_revoked_tokens(test_db):
+    """
+    GIVEN a token blocklist holding expired and live revoked tokens
+    WHEN expired tokens are purged in small batches
+    THEN check only the expired rows are deleted
+    """
+
+    now = dt.datetime.utcnow()
+    expired = [str(uuid.uuid4()) for _ in range(3)]
+    live = str(uuid.uuid4())
+
+    for jti in expired:
+        test_db.session.add(TokenBlocklist(
+            jti=jti, created_at=now - dt.timedelta(hours=2), expires_at=now - dt.timedelta(hours=1)
+        ))
+    test_db.session.add(TokenBlocklist(
+        jti=live, created_at=now, expires_at=now + dt.timedelta(hours=1)
+    ))
+    test_db.session.commit()
+
+    assert purge_expired_tokens(batch_size=2) >= 3
+    assert TokenBlocklist.query.filter(TokenBlocklist.jti.in_(expired)).count() == 0
+    assert TokenBlocklist.query.filter_by(jti=live).count() == 1
+
+
+def test_logout_revocation_survives_purge(test_db, test_client, client_user):
+    """
+    GIVEN a database session whose time zone is west of UTC
+    WHEN a token is revoked by logging out and expired tokens are purged
+    THEN check the blocklist row keeps the token's real expiry and it stays revoked
+    """
+
+    access_token = create_access_token(identity=client_user.uuid)
+    jti = decode_token(access_token)["jti"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    # Lasts until the logout commits
+    test_db.session.execute(text("SET LOCAL TIME ZONE 'America/New_York'"))
+    response = test_client.delete(url_for("user_logout_api"), headers=headers)
+    row = TokenBlocklist.query.filter_by(jti=jti).one()
+
+    assert response.status_code == 200
+    assert row.expires_at == dt.datetime.utcfromtimestamp(decode_token(access_token)["exp"])
+
+    purge_expired_tokens()
+
+    assert TokenBlocklist.query.filter_by(jti=jti).count() == 1
+    assert test_client.get(url_for("user_profile_api"), headers=headers).status_code == 401
+
+
+def test_login_upgrades_outdated_password_hash(test_db, test_client, client_user):
+    """
+    GIVEN a user whose password hash uses an outdated algorithm
+    WHEN the user logs in
+    THEN check the hash is transparently upgraded to the configured hasher
+    """
+
+    client_user.password = ScryptHasher(n=2 ** 10).encode("password")
+    test_db.session.add(client_user)
+    test_db.session.commit()
+
+    response = test_client.post(
+        url_for("user_login_api"),
+        headers={"Content-Type": "application/json"},
+        data=json.dumps({"username": client_user.username, "password": "password"}),
+    )
+
+    assert response.status_code == 200
+    assert client_user.password.startswith("pbkdf2:sha256:")
+    assert client_user.verify_password("password")
+
+
+def test_login_when_hashing_pool_saturated(test_client, client_user):
+    """
+    GIVEN a password hashing pool with no free slots
+    WHEN a user logs in
+    THEN check a 503 response with Retry-After is returned
+    """
+
+    hashing_pool.configure(max_queue=0)
+    try:
+        response = test_client.post(
+            url_for("user_login_api"),
+            headers={"Content-Type": "application/json"},
+            data=json.dumps({"username": client_user.username, "password": "password"}),
+        )
+    finally:
+        hashing_pool.configure(max_queue=64)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(hashing_pool.retry_after)
+    assert response.get_json()["status"] == 503
+
+
 def test_invalid_login(test_client, client_user):
     """
     GIVEN a Flask application configured for testing
@@ -191,6 +395,77 @@ def test_invalid_login(test_client, client_user):
     assert "access_token" not in response.get_json()
 
 
+def test_login_throttled_after_repeated_failures(test_db, test_client, client_role):
+    """
+    GIVEN a user whose login failed the maximum number of times
+    WHEN the user logs in again, even with the right password
+    THEN check the attempt is rejected with 429 and Retry-After
+    """
+
+    user = create_user(client_role, username=generate_username())
+    user.is_email_confirmed = True
+    username = user.username
+
+    test_db.session.add(user)
+    test_db.session.commit()
+
+    user = User.query.filter_by(username=username).one_or_none()
+
+    try:
+        for _ in range(login_throttle.max_failures):
+            response = test_client.post(
+                url_for("user_login_api"),
+                headers={"Content-Type": "application/json"},
+                data=json.dumps({"username": user.username, "password": "invalid_password"}),
+            )
+            assert response.status_code == 403
+
+        response = test_client.post(
+            url_for("user_login_api"),
+            headers={"Content-Type": "application/json"},
+            data=json.dumps({"username": user.username, "password": "password"}),
+        )
+
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) > 0
+        assert "access_token" not in response.get_json()
+    finally:
+        login_throttle.configure()
+
+
+def test_login_throttle_keys_on_forwarded_client_ip(test_db, test_client, client_role):
+    """
+    GIVEN an application behind a trusted reverse proxy (PROXY_FIX_X_FOR)
+    WHEN one client fails to log in more often than the per-IP limit allows
+    THEN check only that client's X-Forwarded-For address is locked out
+    """
+
+    user = create_user(client_role, username=generate_username())
+    user.is_email_confirmed = True
+    username = user.username
+
+    test_db.session.add(user)
+    test_db.session.commit()
+
+    login_throttle.configure(ip_max_failures=2)
+
+    def login(client_ip):
+        return test_client.post(
+            url_for("user_login_api"),
+            headers={"Content-Type": "application/json", "X-Forwarded-For": client_ip},
+            data=json.dumps({"username": username, "password": "invalid_password"}),
+        )
+
+    try:
+        for _ in range(2):
+            assert login("203.0.113.7").status_code == 403
+
+        assert login("203.0.113.7").status_code == 429
+        assert login("203.0.113.8").status_code == 403
+    finally:
+        login_throttle.configure()
+
+
 def test_refresh_token(test_client, client_user):
     """
     GIVEN a Flask application configured for testing
@@ -254,6 +529,104 @@ def test_refresh_token(test_client, client_user):
     assert b"Data fetched." in response.get_data()
 
 
+def test_refresh_token_rotation(test_db, test_client, client_user):
+    """
+    GIVEN a refresh token issued at login
+    WHEN it is exchanged for a new pair of tokens
+    THEN check a rotated refresh token of the same family is returned
+    """
+
+    response = test_client.post(
+        url_for("user_login_api"),
+        headers={"Content-Type": "application/json"},
+        data=json.dumps({"username": client_user.username, "password": "password"}),
+    )
+    first_refresh_token = response.get_json()["refresh_token"]
+
+    response = test_client.post(
+        url_for("user_token_refresh_api"),
+        headers={"Authorization": f"Bearer {first_refresh_token}"},
+    )
+    second_refresh_token = response.get_json()["refresh_token"]
+
+    assert response.status_code == 200
+    assert decode_token(second_refresh_token)["fam"] == decode_token(first_refresh_token)["fam"]
+
+    """
+    GIVEN an already exchanged refresh token
+    WHEN it is presented again
+    THEN check it is refused and the family's newest token is revoked with it
+    """
+
+    response = test_client.post(
+        url_for("user_token_refresh_api"),
+        headers={"Authorization": f"Bearer {first_refresh_token}"},
+    )
+
+    assert response.status_code == 403
+    assert TokenFamily.query.get(decode_token(first_refresh_token)["fam"]).revoked
+
+    response = test_client.post(
+        url_for("user_token_refresh_api"),
+        headers={"Authorization": f"Bearer {second_refresh_token}"},
+    )
+
+    assert response.status_code == 403
+
+    """
+    GIVEN a refresh token issued before rotation was introduced
+    WHEN it is exchanged
+    THEN check it starts a new family and cannot be used again
+    """
+
+    legacy_refresh_token = create_refresh_token(identity=client_user.uuid)
+    legacy_claims = decode_token(legacy_refresh_token)
+
+    # A session time zone west of UTC must not shift the stored expiry
+    test_db.session.execute(text("SET LOCAL TIME ZONE 'America/New_York'"))
+    response = test_client.post(
+        url_for("user_token_refresh_api"),
+        headers={"Authorization": f"Bearer {legacy_refresh_token}"},
+    )
+    retired = TokenBlocklist.query.filter_by(jti=legacy_claims["jti"]).one()
+
+    assert response.status_code == 200
+    assert "fam" in decode_token(response.get_json()["refresh_token"])
+    assert retired.expires_at == dt.datetime.utcfromtimestamp(legacy_claims["exp"])
+
+    response = test_client.post(
+        url_for("user_token_refresh_api"),
+        headers={"Authorization": f"Bearer {legacy_refresh_token}"},
+    )
+
+    assert response.status_code == 401
+
+
+def test_purge_expired_token_families(test_db, client_user):
+    """
+    GIVEN expired and live refresh token families
+    WHEN expired families are purged
+    THEN check only the expired rows are deleted
+    """
+
+    now = dt.datetime.utcnow()
+    expired = TokenFamily(
+        user_id=client_user.uuid, current_jti=str(uuid.uuid4()),
+        created_at=now - dt.timedelta(days=2), expires_at=now - dt.timedelta(days=1)
+    )
+    live = TokenFamily(
+        user_id=client_user.uuid, current_jti=str(uuid.uuid4()),
+        created_at=now, expires_at=now + dt.timedelta(days=1)
+    )
+    test_db.session.add_all([expired, live])
+    test_db.session.commit()
+    expired_id, live_id = expired.id, live.id
+
+    assert purge_expired_token_families() >= 1
+    assert TokenFamily.query.filter_by(id=expired_id).count() == 0
+    assert TokenFamily.query.filter_by(id=live_id).count() == 1
+
+
 def test_user_change_password(test_db, test_client, client_user):
     """
     GIVEN a Flask application configured for testing and a user
@@ -375,6 +748,221 @@ def test_update_my_user_profile(test_client, client_user):
     assert client_user.phone_number != phone_number
 
 
+def test_user_lookup_cache_invalidated_on_update(test_client, client_user):
+    """
+    GIVEN a Flask application configured for testing and a user cached by token lookup
+    WHEN the 'user_profile_api' is posted to update my user profile (PUT)
+    THEN check the cached lookup is dropped and the new profile is served
+    """
+
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {client_user.auth_token}",
+    }
+
+    test_client.get(url_for("user_profile_api"), headers=headers)
+    assert user_cache.get(client_user.uuid)["username"] == client_user.username
+
+    new_name = generate_username()
+    data = {
+        "username": new_name,
+        "email": new_name + "@jmail.com",
+        "phone_number": "071" + generate_number(7)
+    }
+
+    response = test_client.put(
+        url_for("user_profile_api"), headers=headers, data=json.dumps(data)
+    )
+
+    assert response.status_code == 200
+    assert user_cache.get(client_user.uuid) is None
+
+    response = test_client.get(url_for("user_profile_api"), headers=headers)
+
+    assert response.get_json()["data"]["username"] == new_name
+
+
+def test_my_profile_conditional_get(test_db, test_client, client_user):
+    """
+    GIVEN a Flask application configured for testing and a logged in user
+    WHEN the 'user_profile_api' is requested (GET) again with the ETag it returned
+    THEN check a 304 is returned without a body until the profile or its accounts change
+    """
+
+    headers = {"Authorization": f"Bearer {client_user.auth_token}"}
+    response = test_client.get(url_for("user_profile_api"), headers=headers)
+    etag = response.headers["ETag"]
+
+    assert response.status_code == 200
+    assert etag.startswith('W/"')
+
+    with count_queries(test_db.engine) as statements:
+        response = test_client.get(
+            url_for("user_profile_api"), headers={**headers, "If-None-Match": etag}
+        )
+
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    assert response.headers["ETag"] == etag
+    assert not [statement for statement in statements if statement.startswith("SELECT account.")]
+
+    response = test_client.get(
+        url_for("user_profile_api", fields="username"), headers={**headers, "If-None-Match": etag}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    test_client.post(
+        url_for("user_accounts_api"),
+        headers={**headers, "Content-Type": "application/json"},
+        data=json.dumps({"name": generate_username(), "bio_data": "bio"}),
+    )
+    response = test_client.get(url_for("user_profile_api"), headers={**headers, "If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    etag = response.headers["ETag"]
+
+    new_name = generate_username()
+    test_client.put(
+        url_for("user_profile_api"),
+        headers={**headers, "Content-Type": "application/json"},
+        data=json.dumps({
+            "username": new_name,
+            "email": new_name + "@jmail.com",
+            "phone_number": "071" + generate_number(7)
+        }),
+    )
+    response = test_client.get(url_for("user_profile_api"), headers={**headers, "If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.get_json()["data"]["username"] == new_name
+
+
+def test_user_deleted_by_another_worker_is_evicted(test_db, test_client, client_role):
+    """
+    GIVEN a cached user that another worker deletes
+    WHEN the 'user_profile_api' is requested (GET) after the cache validation interval
+    THEN check the user is evicted and the token no longer authenticates
+    """
+
+    username = generate_username()
+    test_db.session.add(create_user(client_role, username=username))
+    test_db.session.commit()
+    user = User.query.filter_by(username=username).one()
+    user_id = user.uuid
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user_id)}"}
+
+    response = test_client.get(url_for("user_profile_api"), headers=headers)
+
+    assert response.status_code == 200
+    assert user_cache.get(user_id) is not None
+
+    # Deleted by another worker, so this worker's cache keeps the user
+    test_db.session.expunge(user)
+    test_db.session.execute(text("DELETE FROM user_role WHERE user_id = :id"), {"id": user_id})
+    test_db.session.execute(text('DELETE FROM "user" WHERE uuid = :id'), {"id": user_id})
+    test_db.session.commit()
+
+    user_cache.configure(validate_interval=0.01)
+    try:
+        time.sleep(0.02)
+        response = test_client.get(url_for("user_profile_api"), headers=headers)
+    finally:
+        user_cache.configure(validate_interval=0)
+
+    assert response.status_code == 401
+    assert user_cache.get(user_id) is None
+
+
+def expunge_user(session, user_id):
+    for instance in list(session.identity_map.values()):
+        if isinstance(instance, User) and instance.uuid == user_id:
+            session.expunge(instance)
+
+
+def test_my_profile_etag_matches_cached_body(test_db, test_client, client_role):
+    """
+    GIVEN a user whose cached lookup is older than the row in the database
+    WHEN the 'user_profile_api' is requested (GET) and then again once the cache expires
+    THEN check the stale body is not tagged as current, so the fresh body is sent
+    """
+
+    username = generate_username()
+    test_db.session.add(create_user(client_role, username=username))
+    test_db.session.commit()
+    user_id = User.query.filter_by(username=username).one().uuid
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user_id)}"}
+    test_client.get(url_for("user_profile_api"), headers=headers)
+    cached = user_cache.get(user_id)
+    old_name = cached["username"]
+    new_name = generate_username()
+
+    # Written by another worker, so this worker's cache keeps the old row
+    User.query.filter_by(uuid=user_id).update({
+        User.username: new_name, User.date_modified: dt.datetime.utcnow()
+    }, synchronize_session=False)
+    test_db.session.commit()
+    user_cache.set(user_id, cached)
+
+    # Requests here share the test's session; load the user afresh for each
+    expunge_user(test_db.session, user_id)
+    response = test_client.get(url_for("user_profile_api"), headers=headers)
+
+    assert response.get_json()["data"]["username"] == old_name
+
+    user_cache.pop(user_id)
+    expunge_user(test_db.session, user_id)
+    response = test_client.get(
+        url_for("user_profile_api"), headers={**headers, "If-None-Match": response.headers["ETag"]}
+    )
+
+    assert response.status_code == 200
+    assert response.get_json()["data"]["username"] == new_name
+
+
+def test_admin_fetch_user_details_conditional_get(test_client, superadmin, client_user):
+    """
+    GIVEN a Flask application configured for testing and admin user
+    WHEN the 'user_detail_api' is requested (GET) again with the ETag it returned
+    THEN check a 304 is returned, and a 404 for a user that does not exist
+    """
+
+    headers = {"Authorization": f"Bearer {superadmin.auth_token}"}
+    response = test_client.get(url_for("user_detail_api", user_id=client_user.uuid), headers=headers)
+
+    response = test_client.get(
+        url_for("user_detail_api", user_id=client_user.uuid),
+        headers={**headers, "If-None-Match": response.headers["ETag"]},
+    )
+
+    assert response.status_code == 304
+
+    response = test_client.get(
+        url_for("user_detail_api", user_id=str(uuid.uuid1())), headers={**headers, "If-None-Match": "*"}
+    )
+
+    assert response.status_code == 404
+
+
+def test_user_lookup_cache_evicted_after_commit(test_db, client_user):
+    """
+    GIVEN a user updated and flushed but not yet committed
+    WHEN another request caches the old row before the commit
+    THEN check the commit evicts that stale entry again
+    """
+
+    user = User.query.filter_by(uuid=client_user.uuid).one()
+    user.number_of_verification_requests = (user.number_of_verification_requests or 0) + 1
+    test_db.session.flush()
+
+    user_cache.set(user.uuid, {"uuid": user.uuid, "username": "stale"})
+    test_db.session.commit()
+
+    assert user_cache.get(user.uuid) is None
+
+
 def test_admin_fetch_user_list(test_client, superadmin):
     """
     GIVEN a Flask application configured for testing and admin user
@@ -394,6 +982,214 @@ def test_admin_fetch_user_list(test_client, superadmin):
     assert b"Data fetched" in response.get_data()
 
 
+def test_admin_fetch_user_list_pages(test_db, test_client, superadmin):
+    """
+    GIVEN a Flask application configured for testing and admin user
+    WHEN the 'user_list_api' is paged through with `limit` and `next` cursors (GET)
+    THEN check every user is returned exactly once, in creation order, without counting rows
+    """
+
+    headers = {"Authorization": f"Bearer {superadmin.auth_token}"}
+    expected = [user.uuid for user in User.query.order_by(User.date_created, User.uuid)]
+
+    seen = []
+    cursor = None
+    with count_queries(test_db.engine) as statements:
+        while True:
+            query = {"limit": 3} if cursor is None else {"limit": 3, "cursor": cursor}
+            response = test_client.get(url_for("user_list_api", **query), headers=headers)
+            assert response.status_code == 200
+            assert len(response.get_json()["data"]) <= 3
+            seen.extend(user["id"] for user in response.get_json()["data"])
+            cursor = response.get_json()["next"]
+            if cursor is None:
+                break
+
+    assert seen == expected
+    assert not [
+        statement for statement in statements
+        if "count(" in statement.lower() and 'FROM "user"' in statement
+    ]
+
+    response = test_client.get(url_for("user_list_api", cursor="not-a-cursor"), headers=headers)
+
+    assert response.status_code == 400
+    assert "cursor" in response.get_json()["errors"]
+
+    response = test_client.get(url_for("user_list_api", limit=0), headers=headers)
+
+    assert response.status_code == 400
+    assert "limit" in response.get_json()["errors"]
+
+
+def test_admin_fetch_user_list_filters(test_db, test_client, superadmin, client_role):
+    """
+    GIVEN confirmed and unconfirmed users sharing a username prefix
+    WHEN the 'user_list_api' is requested (GET) with filters and a descending sort
+    THEN check only the matching users are returned, in order, across pages
+    """
+
+    prefix = "zq" + generate_number(4) + "_"
+    for index in range(5):
+        user = create_user(client_role, username=f"{prefix}{index}")
+        user.is_email_confirmed = index % 2 == 0
+        test_db.session.add(user)
+    test_db.session.add(create_user(client_role, username=f"{prefix[:-1]}x9"))
+    test_db.session.commit()
+
+    headers = {"Authorization": f"Bearer {superadmin.auth_token}"}
+    query = {"username": prefix, "is_email_confirmed": "true", "order_by": "-username", "limit": 2}
+
+    seen = []
+    cursor = None
+    while True:
+        response = test_client.get(
+            url_for("user_list_api", **query, **({"cursor": cursor} if cursor else {})),
+            headers=headers
+        )
+        assert response.status_code == 200
+        seen.extend(user["username"] for user in response.get_json()["data"])
+        cursor = response.get_json()["next"]
+        if cursor is None:
+            break
+
+    assert seen == [f"{prefix}4", f"{prefix}2", f"{prefix}0"]
+
+    response = test_client.get(
+        url_for("user_list_api", username=prefix, is_email_confirmed="false", role="Client",
+                created_after="2000-01-01T00:00:00+03:00", fields="username"),
+        headers=headers
+    )
+
+    assert [user["username"] for user in response.get_json()["data"]] == [f"{prefix}1", f"{prefix}3"]
+
+    response = test_client.get(url_for("user_list_api", username=prefix, role="Admin"), headers=headers)
+
+    assert response.get_json()["data"] == []
+
+    response = test_client.get(
+        url_for("user_list_api", role="Nobody", order_by="password"), headers=headers
+    )
+
+    assert response.status_code == 400
+    assert set(response.get_json()["errors"]) == {"role", "order_by"}
+
+
+def test_user_list_filters_use_indexes(test_db):
+    """
+    GIVEN the user list filters compiled to SQL
+    WHEN PostgreSQL plans them with sequential scans disabled
+    THEN check each is answered from its index
+    """
+
+    filters = {
+        "is_email_confirmed": (
+            {"is_email_confirmed": False}, "ix_user_unconfirmed_date_created_uuid"
+        ),
+        # ix_user_username_prefix, or ix_user_username under the C collation
+        "username": ({"username": "ab_c"}, "ix_user_username"),
+        "role": ({"role": "Client"}, "ix_user_role_role_id_user_id"),
+    }
+
+    with test_db.engine.connect() as connection:
+        connection.exec_driver_sql("SET enable_seqscan = off")
+        for name, (loaded, index) in filters.items():
+            statement = filter_users(User.query, loaded).statement.compile(
+                test_db.engine, compile_kwargs={"literal_binds": True}
+            )
+            plan = connection.exec_driver_sql(f"EXPLAIN {statement}").scalars().all()
+            assert index in "\n".join(plan), name
+
+
+def test_admin_fetch_user_list_query_budget(test_db, test_client, superadmin, client_role):
+    """
+    GIVEN users with roles and accounts
+    WHEN pages of different sizes of the 'user_list_api' are requested (GET)
+    THEN check they cost the same number of queries
+    """
+
+    for _ in range(6):
+        user = create_user(client_role, username=generate_username())
+        user.accounts.append(Account(name=generate_username(), bio_data="bio"))
+        user.accounts.append(Account(name=generate_username(), bio_data="bio"))
+        test_db.session.add(user)
+    test_db.session.commit()
+
+    headers = {"Authorization": f"Bearer {superadmin.auth_token}"}
+    test_client.get(url_for("user_list_api", limit=1), headers=headers)
+
+    budgets = []
+    for limit in (2, 6):
+        with count_queries(test_db.engine) as statements:
+            response = test_client.get(url_for("user_list_api", limit=limit), headers=headers)
+        assert len(response.get_json()["data"]) == limit
+        budgets.append(len(statements))
+
+    assert budgets[0] == budgets[1]
+    assert any(user["accounts"] for user in response.get_json()["data"])
+    assert all(user["roles"] for user in response.get_json()["data"])
+
+
+def test_admin_fetch_user_list_sparse_fields(test_db, test_client, superadmin):
+    """
+    GIVEN a Flask application configured for testing and admin user
+    WHEN the 'user_list_api' is requested (GET) with `fields` and no `include`
+    THEN check only those fields are returned and relations are not loaded
+    """
+
+    with count_queries(test_db.engine) as statements:
+        response = test_client.get(
+            url_for("user_list_api", fields="id,username", limit=5),
+            headers={"Authorization": f"Bearer {superadmin.auth_token}"},
+        )
+
+    users = response.get_json()["data"]
+    selects = [statement for statement in statements if 'FROM "user"' in statement]
+
+    assert response.status_code == 200
+    assert users and all(set(user) == {"id", "username"} for user in users)
+    assert not any("role" in statement or "account" in statement for statement in selects)
+    assert "password" not in selects[-1]
+
+
+def test_admin_fetch_user_list_unknown_field(test_client, superadmin):
+    """
+    GIVEN a Flask application configured for testing and admin user
+    WHEN the 'user_list_api' is requested (GET) with an unknown field or relation
+    THEN check the response is 400 naming them
+    """
+
+    response = test_client.get(
+        url_for("user_list_api", fields="id,password", include="roles,tokens"),
+        headers={"Authorization": f"Bearer {superadmin.auth_token}"},
+    )
+
+    assert response.status_code == 400
+    assert response.get_json()["errors"] == {
+        "fields": ["Unknown field(s): password."],
+        "include": ["Unknown relation(s): tokens."],
+    }
+
+
+def test_my_profile_include_relation(test_client, client_user):
+    """
+    GIVEN a Flask application configured for testing and a logged in user
+    WHEN the 'user_profile_api' is requested (GET) with `include=roles`
+    THEN check the scalar fields and only the roles relation are returned
+    """
+
+    response = test_client.get(
+        url_for("user_profile_api", include="roles"),
+        headers={"Authorization": f"Bearer {client_user.auth_token}"},
+    )
+
+    data = response.get_json()["data"]
+
+    assert response.status_code == 200
+    assert "accounts" not in data
+    assert data["roles"] and data["username"] == client_user.username
+
+
 def test_admin_fetch_user_details(test_client, superadmin, client_user):
     """
     GIVEN a Flask application configured for testing and admin user
@@ -431,3 +1227,222 @@ def test_admin_fetch_user_details(test_client, superadmin, client_user):
     assert response.get_json().get("status") == 403
     assert b"You don't have the permission" in response.get_data()
     assert "data" not in response.get_json()
+
+
+def test_role_claims_authorize_admin_requests(test_client, superadmin, client_user):
+    """
+    GIVEN a Flask application configured for testing and admin user
+    WHEN the admin logs in
+    THEN check the access token carries the role names and roles version
+    """
+
+    response = test_client.post(
+        url_for("user_login_api"),
+        headers={"Content-Type": "application/json"},
+        data=json.dumps({"username": superadmin.username, "password": "password"}),
+    )
+    claims = decode_token(response.get_json()["access_token"])
+
+    assert claims["roles"] == ["SuperAdmin"]
+    assert claims["roles_version"] == superadmin.roles_version
+
+    """
+    GIVEN a user whose token claims a role at their current roles version
+    WHEN the 'user_list_api' is requested (GET)
+    THEN check the claims alone authorize the request
+    """
+
+    token = create_access_token(
+        identity=client_user.uuid,
+        additional_claims={"roles": ["Admin"], "roles_version": client_user.roles_version}
+    )
+    response = test_client.get(
+        url_for("user_list_api"),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 200
+
+    """
+    GIVEN a user whose token claims are from an older roles version
+    WHEN the 'user_list_api' is requested (GET)
+    THEN check the roles are read from the database instead
+    """
+
+    token = create_access_token(
+        identity=client_user.uuid,
+        additional_claims={"roles": ["Admin"], "roles_version": client_user.roles_version - 1}
+    )
+    response = test_client.get(
+        url_for("user_list_api"),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 403
+
+
+def test_role_claims_rejected_after_role_change_on_another_worker(test_db, test_client, client_role):
+    """
+    GIVEN a user whose token claims a role and whose cached lookup predates a role change
+    WHEN the 'user_list_api' is requested (GET) after another worker bumped their roles version
+    THEN check the claims are no longer trusted and the roles are read from the database
+    """
+
+    username = generate_username()
+    test_db.session.add(create_user(client_role, username=username))
+    test_db.session.commit()
+    user = User.query.filter_by(username=username).one()
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": "Bearer " + create_access_token(
+            identity=user.uuid,
+            additional_claims={"roles": ["Admin"], "roles_version": user.roles_version}
+        ),
+    }
+
+    response = test_client.get(url_for("user_list_api"), headers=headers)
+    cached = user_cache.get(user.uuid)
+
+    assert response.status_code == 200
+    assert cached["roles_version"] == user.roles_version
+
+    # Written by another worker, so this worker's cache keeps the old version
+    User.query.filter_by(uuid=user.uuid).update(
+        {User.roles_version: User.roles_version + 1}, synchronize_session=False
+    )
+    test_db.session.commit()
+    user_cache.set(user.uuid, cached)
+
+    response = test_client.get(url_for("user_list_api"), headers=headers)
+
+    assert response.status_code == 403
+
+
+def test_fetch_jwks(test_client):
+    """
+    GIVEN a Flask application configured for testing
+    WHEN the 'jwks_api' is requested (GET)
+    THEN check a cacheable JSON Web Key Set is returned
+    """
+
+    response = test_client.get(url_for("jwks_api"))
+
+    assert response.status_code == 200
+    assert "keys" in response.get_json()
+    assert response.cache_control.max_age is not None
+
+
+def test_introspect_tokens(test_db, test_client, superadmin, client_user):
+    """
+    GIVEN a Flask application configured for testing and admin user
+    WHEN the 'token_introspect_api' is requested (POST) with a batch of tokens
+    THEN check each token gets its own result in request order
+    """
+
+    valid = create_access_token(identity=client_user.uuid)
+    revoked = create_access_token(identity=client_user.uuid)
+    orphan = create_access_token(identity=str(uuid.uuid4()))
+
+    test_db.session.add(TokenBlocklist(
+        jti=decode_token(revoked)["jti"],
+        created_at=dt.datetime.utcnow(),
+        expires_at=dt.datetime.utcnow() + dt.timedelta(hours=1),
+    ))
+    test_db.session.commit()
+
+    response = test_client.post(
+        url_for("token_introspect_api"),
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {superadmin.auth_token}",
+        },
+        data=json.dumps({"tokens": [valid, revoked, orphan, "not-a-token"]}),
+    )
+    results = response.get_json()["data"]
+
+    assert response.status_code == 200
+    assert results[0]["active"] is True
+    assert results[0]["sub"] == client_user.uuid
+    assert results[0]["username"] == client_user.username
+    assert results[1] == {"active": False, "error": "Token has been revoked"}
+    assert results[2] == {"active": False, "error": "User not found"}
+    assert results[3]["active"] is False
+
+    """
+    GIVEN refresh tokens that were rotated out, belong to a revoked family or are current
+    WHEN the 'token_introspect_api' is requested (POST) with them
+    THEN check only the current refresh token is active
+    """
+
+    def login():
+        family_claims = start_token_family(client_user)
+        test_db.session.commit()
+        return create_refresh_token(identity=client_user.uuid, additional_claims=family_claims)
+
+    rotated = login()
+    current = test_client.post(
+        url_for("user_token_refresh_api"), headers={"Authorization": f"Bearer {rotated}"}
+    ).get_json()["refresh_token"]
+    family_revoked = login()
+    revoke_token_family(decode_token(family_revoked)["fam"])
+
+    response = test_client.post(
+        url_for("token_introspect_api"),
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {superadmin.auth_token}",
+        },
+        data=json.dumps({"tokens": [rotated, current, family_revoked]}),
+    )
+    results = response.get_json()["data"]
+
+    assert results[0] == {"active": False, "error": "Token has been revoked"}
+    assert results[1]["active"] is True
+    assert results[1]["token_type"] == "refresh"
+    assert results[2] == {"active": False, "error": "Token has been revoked"}
+
+    """
+    GIVEN a Flask application configured for testing and user
+    WHEN the 'token_introspect_api' is requested (POST) by a non-admin user
+    THEN check access is denied
+    """
+
+    response = test_client.post(
+        url_for("token_introspect_api"),
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {client_user.auth_token}",
+        },
+        data=json.dumps({"tokens": [valid]}),
+    )
+
+    assert response.status_code == 403
+
+
+def test_introspect_tokens_query_budget(test_db, test_client, superadmin, client_user):
+    """
+    GIVEN batches of refresh tokens, which carry no role claims, for several users
+    WHEN the 'token_introspect_api' is requested (POST) with batches of different sizes
+    THEN check they cost the same number of queries and report each user's roles
+    """
+
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {superadmin.auth_token}",
+    }
+    identities = [client_user.uuid, superadmin.uuid]
+
+    budgets = []
+    for size in (2, 6):
+        tokens = [create_refresh_token(identity=identities[index % 2]) for index in range(size)]
+        with count_queries(test_db.engine) as statements:
+            response = test_client.post(
+                url_for("token_introspect_api"), headers=headers, data=json.dumps({"tokens": tokens})
+            )
+        budgets.append(len(statements))
+
+    results = response.get_json()["data"]
+
+    assert budgets[0] == budgets[1]
+    assert results[0]["roles"] == ["Client"]
+    assert results[1]["roles"] == ["SuperAdmin"]
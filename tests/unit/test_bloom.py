@@ -0,0 +1,67 @@
+import uuid
+
+from api.utils.bloom import BloomFilter, RevokedTokenFilter
+
+
+def test_bloom_filter_has_no_false_negatives():
+    """
+    GIVEN a BloomFilter sized for 1000 items
+    WHEN 1000 jtis are added
+    THEN check every one of them is reported as present
+    """
+
+    bloom = BloomFilter(1000, error_rate=0.01)
+    jtis = [str(uuid.uuid4()) for _ in range(1000)]
+    for jti in jtis:
+        bloom.add(jti)
+
+    assert all(jti in bloom for jti in jtis)
+
+
+def test_bloom_filter_false_positive_rate():
+    """
+    GIVEN a BloomFilter filled to capacity
+    WHEN unrelated jtis are checked
+    THEN check the false-positive rate stays close to the configured one
+    """
+
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for _ in range(1000):
+        bloom.add(str(uuid.uuid4()))
+
+    false_positives = sum(str(uuid.uuid4()) in bloom for _ in range(10000))
+
+    assert false_positives < 300
+
+
+def test_bloom_filter_respects_max_bytes():
+    """
+    GIVEN a BloomFilter whose ideal size exceeds max_bytes
+    WHEN it is created
+    THEN check its bit array is capped
+    """
+
+    bloom = BloomFilter(1000000, error_rate=0.0001, max_bytes=1024)
+
+    assert bloom.size_bytes == 1024
+
+
+def test_revoked_token_filter_keeps_local_adds_across_rebuild():
+    """
+    GIVEN a RevokedTokenFilter being rebuilt
+    WHEN a jti is revoked locally while the rebuild is running
+    THEN check the rebuilt filter still reports it
+    """
+
+    revoked = RevokedTokenFilter()
+    revoked.configure(capacity=100, refresh_interval=60)
+
+    assert revoked.might_contain("anything")
+    assert revoked.start_rebuild()
+
+    revoked.add("local-jti")
+    revoked.finish_rebuild(["other-jti"], count=1)
+
+    assert not revoked.is_stale()
+    assert revoked.might_contain("local-jti")
+    assert revoked.might_contain("other-jti")
@@ -0,0 +1,92 @@
+import time
+
+from api.utils.cache import TTLCache
+
+
+def test_cache_hit_and_miss():
+    """
+    GIVEN an empty TTLCache
+    WHEN a key is stored and then fetched along with a missing key
+    THEN check the stored value is returned and hits/misses are counted
+    """
+
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_lru_eviction():
+    """
+    GIVEN a full TTLCache
+    WHEN a new key is stored
+    THEN check the least recently used key is evicted and counted
+    """
+
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_entry_expires():
+    """
+    GIVEN a TTLCache entry with a short time to live
+    WHEN the entry is fetched after it has expired
+    THEN check it is treated as a miss and dropped
+    """
+
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1, ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.stats()["expirations"] == 1
+
+
+def test_cache_pop_and_clear():
+    """
+    GIVEN a TTLCache with entries
+    WHEN entries are invalidated
+    THEN check they are no longer returned
+    """
+
+    cache = TTLCache(maxsize=4, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    assert cache.pop("a") == 1
+    assert cache.get("a") is None
+
+    cache.clear()
+    assert cache.get("b") is None
+
+
+def test_cache_validation_interval():
+    """
+    GIVEN a TTLCache with a validation interval
+    WHEN callers ask whether the entries need validating
+    THEN check only the first caller after each interval is told to, and items are not counted as lookups
+    """
+
+    cache = TTLCache(maxsize=4, ttl=60, validate_interval=0.01)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.needs_validation()
+    assert not cache.needs_validation()
+    assert cache.items() == [("a", 1)]
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 0
+    assert cache.stats()["validations"] == 1
+    assert not TTLCache().needs_validation()
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+from werkzeug.exceptions import ServiceUnavailable
+
+from api.utils.hash_pool import HashingPool
+from api.utils.hashers import PasswordHashers
+
+
+def test_pool_hashes_on_worker_processes():
+    """
+    GIVEN a hashing pool with a worker process
+    WHEN a password is hashed and verified through it
+    THEN check the results and latency counters are recorded
+    """
+
+    hashers = PasswordHashers()
+    hashers.configure(pbkdf2_iterations=1000)
+    pool = HashingPool()
+    pool.configure(workers=1, max_queue=4)
+
+    try:
+        encoded = pool.run(hashers.hash, "password")
+
+        assert pool.run(hashers.verify, "password", encoded)
+        assert pool.stats()["completed"] == 2
+        assert pool.stats()["depth"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_saturated_pool_rejects_with_retry_after():
+    """
+    GIVEN a hashing pool with no free slots
+    WHEN a hash is requested
+    THEN check a 503 with Retry-After is raised and counted
+    """
+
+    pool = HashingPool()
+    pool.configure(workers=0, max_queue=0, retry_after=5)
+
+    with pytest.raises(ServiceUnavailable) as error:
+        pool.run(str.upper, "password")
+
+    assert error.value.retry_after == 5
+    assert pool.stats()["rejected"] == 1
+
+
+def test_timed_out_hash_keeps_its_slot():
+    """
+    GIVEN a hashing pool with one slot and a hash slower than its timeout
+    WHEN the hash times out and another is requested before it finishes
+    THEN check the second one is rejected and the slot is freed once the first finishes
+    """
+
+    pool = HashingPool()
+    pool.configure(workers=1, max_queue=1, timeout=0.5)
+
+    try:
+        with pytest.raises(ServiceUnavailable):
+            pool.run(time.sleep, 3)
+
+        with pytest.raises(ServiceUnavailable):
+            pool.run(str.upper, "password")
+
+        assert pool.stats()["timeouts"] == 1
+        assert pool.stats()["rejected"] == 1
+        assert pool.stats()["depth"] == 1
+
+        deadline = time.monotonic() + 10
+        while pool.stats()["depth"] and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        assert pool.run(str.upper, "password") == "PASSWORD"
+    finally:
+        pool.shutdown()
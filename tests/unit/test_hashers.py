@@ -0,0 +1,78 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from api.utils.hashers import PasswordHashers, argon2, calibrate
+
+
+def test_hash_and_verify_each_algorithm():
+    """
+    GIVEN a hasher registry
+    WHEN a password is hashed with each available algorithm
+    THEN check only the right password verifies and the hash is current
+    """
+
+    hashers = PasswordHashers()
+    algorithms = ["pbkdf2", "scrypt"] + (["argon2id"] if argon2 is not None else [])
+
+    for algorithm in algorithms:
+        hashers.configure(algorithm, pbkdf2_iterations=1000, scrypt_n=2 ** 10)
+        encoded = hashers.hash("password")
+
+        assert hashers.verify("password", encoded)
+        assert not hashers.verify("wrong-password", encoded)
+        assert not hashers.needs_rehash(encoded)
+
+
+def test_outdated_hashes_need_rehash():
+    """
+    GIVEN hashes stored with another algorithm or cost
+    WHEN they are checked against the configured hasher
+    THEN check they still verify but are flagged for rehash
+    """
+
+    hashers = PasswordHashers()
+    hashers.configure("scrypt", scrypt_n=2 ** 10)
+    scrypt_hash = hashers.hash("password")
+    legacy_hash = generate_password_hash("password", method="sha256")
+
+    hashers.configure("pbkdf2", pbkdf2_iterations=1000)
+
+    for encoded in (scrypt_hash, legacy_hash):
+        assert hashers.verify("password", encoded)
+        assert hashers.needs_rehash(encoded)
+
+    hashers.configure(scrypt_n=2 ** 11)
+    hashers.configure("scrypt")
+
+    assert hashers.needs_rehash(scrypt_hash)
+
+
+def test_unknown_hasher_rejected():
+    """
+    GIVEN a hasher registry
+    WHEN an unknown algorithm is configured
+    THEN check a ValueError is raised
+    """
+
+    with pytest.raises(ValueError):
+        PasswordHashers().configure("md5")
+
+
+def test_calibrate_picks_costliest_parameters_within_target():
+    """
+    GIVEN a hasher with a small parameter grid
+    WHEN it is calibrated against a generous and an impossible target
+    THEN check the costliest fitting and the cheapest parameters are recommended
+    """
+
+    hasher = PasswordHashers().hashers["pbkdf2"]
+    hasher.grid = [{"iterations": 1000}, {"iterations": 2000}]
+
+    results, recommended = calibrate(hasher, target_ms=10000, samples=1)
+
+    assert len(results) == 2
+    assert recommended == {"iterations": 2000}
+
+    results, recommended = calibrate(hasher, target_ms=0, samples=1)
+
+    assert recommended == {"iterations": 1000}
@@ -0,0 +1,94 @@
+import os
+import time
+
+import jwt
+import pytest
+
+from api.utils.jwks import KeySet, generate_key
+
+
+def make_keyset(folder, algorithm="RS256", activation_delay=0):
+    keyset = KeySet()
+    keyset.algorithm = algorithm
+    keyset.folder = str(folder)
+    keyset.activation_delay = activation_delay
+    keyset.retention = 3600
+
+    return keyset
+
+
+@pytest.mark.parametrize("algorithm", ["RS256", "EdDSA"])
+def test_keyset_signs_and_publishes_keys(tmp_path, algorithm):
+    """
+    GIVEN an empty asymmetric KeySet
+    WHEN it is rotated and a token is signed with its signing key
+    THEN check the JWKS lists the key and the kid resolves to a key that verifies the token
+    """
+
+    keyset = make_keyset(tmp_path, algorithm)
+    kid = keyset.rotate()
+
+    signing_kid, private_key = keyset.signing_key()
+    token = jwt.encode({"sub": "user"}, private_key, algorithm=algorithm, headers={"kid": signing_kid})
+    header = jwt.get_unverified_header(token)
+
+    assert signing_kid == kid
+    assert [jwk["kid"] for jwk in keyset.jwks()["keys"]] == [kid]
+    assert "d" not in keyset.jwks()["keys"][0]
+    assert jwt.decode(token, keyset.decode_key(header, {}), algorithms=[algorithm])["sub"] == "user"
+
+
+def test_keyset_waits_for_activation_delay(tmp_path):
+    """
+    GIVEN a KeySet with an active key
+    WHEN a new key is rotated in
+    THEN check it is published but not used for signing until the activation delay passes
+    """
+
+    old_kid = generate_key("EdDSA", str(tmp_path))
+    old_path = os.path.join(str(tmp_path), f"{old_kid}.pem")
+    backdated_kid = f"{int(time.time()) - 7200}-{old_kid.split('-')[1]}"
+    os.rename(old_path, os.path.join(str(tmp_path), f"{backdated_kid}.pem"))
+
+    keyset = make_keyset(tmp_path, "EdDSA", activation_delay=600)
+    new_kid = keyset.rotate(force=True)
+
+    assert keyset.signing_key()[0] == backdated_kid
+    assert {jwk["kid"] for jwk in keyset.jwks()["keys"]} == {backdated_kid, new_kid}
+
+
+def test_keyset_prunes_retired_keys(tmp_path):
+    """
+    GIVEN a KeySet holding a key retired longer ago than the token lifetime
+    WHEN it is rotated
+    THEN check the retired key is removed
+    """
+
+    now = int(time.time())
+    for created_at in (now - 3 * 3600, now - 2 * 3600):
+        kid = generate_key("EdDSA", str(tmp_path))
+        os.rename(
+            os.path.join(str(tmp_path), f"{kid}.pem"),
+            os.path.join(str(tmp_path), f"{created_at}-{kid.split('-')[1]}.pem")
+        )
+
+    keyset = make_keyset(tmp_path, "EdDSA")
+    keyset.rotate()
+
+    assert [key_file for key_file in os.listdir(str(tmp_path)) if key_file.endswith(".pem")] == [
+        f"{now - 2 * 3600}-{kid.split('-')[1]}.pem"
+    ]
+
+
+def test_keyset_rejects_unknown_kid(tmp_path):
+    """
+    GIVEN an asymmetric KeySet
+    WHEN a token header names a kid that is not in the set
+    THEN check the token is rejected
+    """
+
+    keyset = make_keyset(tmp_path)
+    keyset.rotate()
+
+    with pytest.raises(jwt.InvalidTokenError):
+        keyset.decode_key({"alg": "RS256", "kid": "0-unknown"}, {})
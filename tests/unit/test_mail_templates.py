@@ -0,0 +1,32 @@
+import pytest
+from jinja2.exceptions import UndefinedError
+
+from api.utils.mail import MailTemplates
+
+
+def test_render_escapes_html_context():
+    """
+    GIVEN the precompiled email templates
+    WHEN a message is rendered
+    THEN check its subject, subtype and escaped link
+    """
+
+    subject, body, subtype = MailTemplates().render(
+        "reset_password", link="http://localhost/reset?a=1&b=2", expires_in=60
+    )
+
+    assert subject == "Reset your password"
+    assert subtype == "html"
+    assert 'href="http://localhost/reset?a=1&amp;b=2"' in body
+    assert "expire in 60 minutes" in body
+
+
+def test_render_requires_context():
+    """
+    GIVEN the precompiled email templates
+    WHEN a message is rendered without a value its template uses
+    THEN check rendering fails instead of sending a broken link
+    """
+
+    with pytest.raises(UndefinedError):
+        MailTemplates().render("confirm_email")
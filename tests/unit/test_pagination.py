@@ -0,0 +1,35 @@
+import datetime as dt
+
+import pytest
+from marshmallow import ValidationError
+
+from api.models import User
+from api.utils.pagination import encode_cursor, decode_cursor
+
+
+def test_cursor_round_trip():
+    """
+    GIVEN the sort key of the last row of a page
+    WHEN it is encoded into a cursor and decoded again
+    THEN check the values and their types are restored
+    """
+
+    created = dt.datetime(2022, 12, 14, 10, 4, 12, 342211)
+    cursor = encode_cursor([created, "97439be0-7b84-11ed-98bb-a518d967d620"])
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor, [User.date_created, User.uuid]) == [
+        created, "97439be0-7b84-11ed-98bb-a518d967d620"
+    ]
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor(["only one value"]), encode_cursor(["yesterday", "x"])])
+def test_malformed_cursor_is_rejected(cursor):
+    """
+    GIVEN a cursor that was not issued for this sort key
+    WHEN it is decoded
+    THEN check a validation error is raised
+    """
+
+    with pytest.raises(ValidationError):
+        decode_cursor(cursor, [User.date_created, User.uuid])
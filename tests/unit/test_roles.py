@@ -0,0 +1,56 @@
+from api.utils.roles import RoleRegistry
+
+
+def test_registry_loads_once():
+    """
+    GIVEN a role registry with a loader
+    WHEN roles are looked up repeatedly
+    THEN check the loader runs once and unknown names resolve to None
+    """
+
+    calls = []
+    registry = RoleRegistry()
+    registry.loader = lambda: calls.append(1) or [("Admin", "a-1"), ("Client", "c-1")]
+
+    assert registry.get("Client") == "c-1"
+    assert registry.get("Staff") is None
+    assert registry.uuids(["Admin", "Staff", "Client"]) == ["a-1", "c-1"]
+    assert len(calls) == 1
+    assert registry.stats()["roles"] == 2
+
+
+def test_registry_invalidate_reloads():
+    """
+    GIVEN a loaded role registry
+    WHEN it is invalidated after a role changed
+    THEN check the next lookup sees the new roles
+    """
+
+    roles = [("Client", "c-1")]
+    registry = RoleRegistry()
+    registry.loader = lambda: list(roles)
+    assert registry.get("Admin") is None
+
+    roles.append(("Admin", "a-1"))
+    assert registry.get("Admin") is None
+
+    registry.invalidate()
+    assert registry.get("Admin") == "a-1"
+    assert registry.stats()["loads"] == 2
+
+
+def test_registry_reloads_on_unknown_uuid():
+    """
+    GIVEN a loaded role registry
+    WHEN names are resolved for a role uuid it has not seen
+    THEN check it reloads once and resolves the new role
+    """
+
+    roles = [("Client", "c-1")]
+    registry = RoleRegistry()
+    registry.loader = lambda: list(roles)
+    assert registry.names(["c-1"]) == ["Client"]
+
+    roles.append(("Staff", "s-1"))
+    assert registry.names(["s-1", "c-1"]) == ["Staff", "Client"]
+    assert registry.stats()["loads"] == 2
@@ -0,0 +1,62 @@
+import time
+
+from api.utils.throttle import LoginThrottle
+
+
+def test_lockout_after_max_failures():
+    """
+    GIVEN a login throttle allowing 3 failures per username
+    WHEN a username fails 3 times
+    THEN check further attempts are locked out for the lockout period
+    """
+
+    throttle = LoginThrottle()
+    throttle.configure(max_failures=3, ip_max_failures=100, window=60, lockout=30)
+
+    for _ in range(2):
+        throttle.record_failure("alice", "10.0.0.1")
+        assert throttle.check("alice", "10.0.0.1") == 0
+
+    throttle.record_failure("alice", "10.0.0.1")
+
+    assert 0 < throttle.check("alice", "10.0.0.2") <= 31
+    assert throttle.check("bob", "10.0.0.1") == 0
+    assert throttle.stats()["lockouts"] == 1
+    assert throttle.stats()["blocked"] == 1
+
+
+def test_repeated_lockouts_grow_exponentially():
+    """
+    GIVEN a username that was already locked out
+    WHEN it reaches the failure limit again
+    THEN check the lockout doubles, capped at the maximum lockout
+    """
+
+    throttle = LoginThrottle()
+    throttle.configure(max_failures=1, window=60, lockout=10, max_lockout=25)
+
+    durations = []
+    for _ in range(3):
+        now = time.time()
+        throttle.record_failure("alice", None)
+        until, _, _ = throttle.backend.get_lock("user:alice")
+        durations.append(round(until - now))
+
+    assert durations == [10, 20, 25]
+
+
+def test_success_clears_username_failures():
+    """
+    GIVEN a username with failed attempts
+    WHEN it logs in successfully
+    THEN check its failure count starts over
+    """
+
+    throttle = LoginThrottle()
+    throttle.configure(max_failures=2, window=60)
+
+    throttle.record_failure("alice", None)
+    throttle.record_success("alice", None)
+    throttle.record_failure("alice", None)
+
+    assert throttle.check("alice", None) == 0
@@ -0,0 +1,51 @@
+import time
+
+from api.utils import token
+
+
+def test_decode_memoizes_valid_tokens():
+    """
+    GIVEN a freshly encoded token
+    WHEN it is decoded twice
+    THEN check the second decode is served from the memo as an independent copy
+    """
+
+    token.decode_cache.clear()
+    encoded = token.encode("user@example.com", "secret", expiration_seconds=60)
+
+    first = token.decode(encoded, "secret")
+    first["data"] = "tampered"
+    second = token.decode(encoded, "secret")
+
+    assert second["data"] == "user@example.com"
+    assert token.decode_cache.stats()["hits"] >= 1
+
+
+def test_decode_memo_never_outlives_token():
+    """
+    GIVEN a token expiring in one second
+    WHEN it is decoded before and after its expiry
+    THEN check the expired token is rejected instead of served from the memo
+    """
+
+    token.decode_cache.clear()
+    encoded = token.encode("user@example.com", "secret", expiration_seconds=1)
+
+    assert token.decode(encoded, "secret")["data"] == "user@example.com"
+    time.sleep(2)
+    assert token.decode(encoded, "secret") == {"error": "Token expired."}
+
+
+def test_decode_memo_is_per_key():
+    """
+    GIVEN a token decoded with its signing key
+    WHEN it is decoded with a different key
+    THEN check the memoized payload is not returned and the failure is memoized
+    """
+
+    token.decode_cache.clear()
+    encoded = token.encode("user@example.com", "secret", expiration_seconds=60)
+
+    assert "data" in token.decode(encoded, "secret")
+    assert token.decode(encoded, "other") == {"error": "Invalid token."}
+    assert len(token.decode_cache) == 2
@@ -1,7 +1,13 @@
+import contextlib
+import email
+import socketserver
 import string
 import random
+import threading
 import uuid
 
+from sqlalchemy import event
+
 from api.models import User
 
 
@@ -34,3 +40,80 @@ def create_user(role, username=generate_username()):
     user.set_email_confirm_token(user.email)
 
     return user
+
+
+@contextlib.contextmanager
+def count_queries(engine):
+    """Collect the SQL statements executed on `engine` inside the block"""
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages from smtplib"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost SMTP sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb == "EHLO" and self.server.pipelining:
+                self.reply("250-localhost")
+                self.reply("250 PIPELINING")
+            elif verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb == "RCPT" and command.split(":", 1)[1].strip(" <>") in self.server.refused:
+                self.reply("550 No such user")
+                self.rejected = True
+            elif verb == "DATA" and getattr(self, "rejected", False):
+                self.reply("554 No valid recipients")
+            elif verb == "RSET":
+                self.rejected = False
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = iter(self.rfile.readline, b".\r\n")
+                data = b"".join(line[1:] if line.startswith(b"..") else line for line in lines)
+                self.server.messages.append(email.message_from_bytes(data))
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+@contextlib.contextmanager
+def smtp_sink(refused=(), pipelining=False):
+    """Local SMTP stand-in collecting the messages it receives"""
+
+    server = socketserver.ThreadingTCPServer(("localhost", 0), SMTPSinkHandler)
+    server.daemon_threads = True
+    server.messages = []
+    server.refused = set(refused)
+    server.pipelining = pipelining
+    server.connections = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()